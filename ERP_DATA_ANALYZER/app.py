@@ -1,11 +1,10 @@
 import streamlit as st
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from backend.config import Config
-from backend.models import ProductionRecordGRD
-from backend.utilities import process_csv_file
+from backend.database import get_engine
+from backend.writer import get_writer
 import os
 import logging
+import queue
 import shutil
 
 # Setup logging
@@ -17,12 +16,8 @@ if not os.path.exists(Config.INSTANCE_PATH):
     os.makedirs(Config.INSTANCE_PATH)
 
 try:
-    engine_grd = create_engine(Config.SQLALCHEMY_BINDS['grd'])
-    SessionLocal = sessionmaker(binds={
-        ProductionRecordGRD: engine_grd
-    })
-    # Create tables if they don't exist
-    ProductionRecordGRD.__table__.create(engine_grd, checkfirst=True)
+    # Creates tables that don't exist and applies pending schema migrations, once per process
+    engine_grd = get_engine()
     logger.info("Database connected and table checked/created.")
 except Exception as e:
     logger.error(f"Database connection failed: {e}", exc_info=True)
@@ -63,36 +58,50 @@ if uploaded_files:
             st.sidebar.error(f"Error creating upload directory: {e}")
             st.stop()
 
-    # Use a single session for all uploads in this batch
-    session = None
     try:
-        session = SessionLocal()
         st.sidebar.write("Processing uploaded files...")
         progress_bar = st.sidebar.progress(0)
-        processed_count = 0
-        for i, uploaded_file in enumerate(uploaded_files):
+        file_paths = []
+        for uploaded_file in uploaded_files:
             file_path = os.path.join(upload_folder, uploaded_file.name)
             try:
                 with open(file_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
-                st.sidebar.write(f"Processing: {uploaded_file.name}...")
-                count = process_csv_file(file_path, session) # Pass session
-                st.sidebar.success(f"Processed {uploaded_file.name} ({count} records)")
-                processed_count += 1
-            except Exception as e:
-                st.sidebar.error(f"Error processing {uploaded_file.name}: {str(e)}")
-                logger.error(f"Error processing {uploaded_file.name}: {str(e)}", exc_info=True)
-                # Optionally remove the failed file
-                # if os.path.exists(file_path):
-                #     os.remove(file_path)
-            progress_bar.progress((i + 1) / len(uploaded_files))
+                file_paths.append(file_path)
+            except OSError as e:
+                st.sidebar.error(f"Error saving {uploaded_file.name}: {str(e)}")
+                logger.error(f"Error saving {uploaded_file.name}: {str(e)}", exc_info=True)
+
+        # The files join the database writer's queue (backend/writer.py), behind any batch the
+        # folder monitor is writing. They are parsed in parallel worker processes; results
+        # arrive one file at a time from the writer thread and are shown from here
+        finished = [len(uploaded_files) - len(file_paths)] # Files that could not be saved
+        def show_result(result):
+            if result['status'] == 'success':
+                st.sidebar.success(f"Processed {result['file']} ({result['records']} records)")
+            elif result['status'] == 'skipped':
+                st.sidebar.info(f"Skipped {result['file']}: {result['error']}")
+            else:
+                st.sidebar.error(f"Error processing {result['file']}: {result['error']}")
+            finished[0] += 1
+            progress_bar.progress(finished[0] / len(uploaded_files))
+
+        writer = get_writer()
+        if writer.pending():
+            st.sidebar.write(f"Waiting for {writer.pending()} earlier ingestion job(s)...")
+        result_queue = queue.Queue()
+        job = writer.ingest(file_paths, on_result=result_queue.put)
+        while not (job.done() and result_queue.empty()):
+            try:
+                show_result(result_queue.get(timeout=0.2))
+            except queue.Empty:
+                pass
+        results = job.result()
+        processed_count = sum(1 for result in results if result['status'] == 'success')
         st.sidebar.write(f"Finished processing {processed_count}/{len(uploaded_files)} files.")
-        st.sidebar.info("Data might take a minute to reflect in dashboards. You may need to refresh.")
-        # Clear cache related to data fetching after upload
-        st.cache_data.clear()
+        # Dashboard caches are keyed on the data version the ingestion bumped (backend/versions.py),
+        # so the next page view shows the new data without clearing anything
+        st.sidebar.info("Dashboards show the new data on their next refresh.")
     except Exception as e:
         st.sidebar.error(f"A general error occurred during processing: {str(e)}")
-        logger.error(f"General file processing error: {str(e)}", exc_info=True)
-    finally:
-        if session:
-            session.close() # Ensure session is closed
\ No newline at end of file
+        logger.error(f"General file processing error: {str(e)}", exc_info=True)
\ No newline at end of file
@@ -0,0 +1,138 @@
+import logging
+import multiprocessing
+import os
+import queue
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy.orm import Session
+
+from backend.config import Config
+from backend.ingest_stats import merge_stage_stats
+from backend.models import IngestedFile
+from backend.utilities import (AlreadyIngestedError, file_content_hash, load_checkpoint,
+                               prepare_csv_file, process_csv_file)
+
+logger = logging.getLogger(__name__)
+
+# --- Parallel Batch Ingestion ---
+# Reading, cleaning and KPI calculation are CPU-bound pandas work, so for several files they
+# run in a pool of worker processes (prepare_csv_file). SQLite allows one writer at a time, so
+# all database work stays in the calling thread: each prepared file is handed to
+# process_csv_file, which does the ledger check, insert/upsert and commit as usual.
+# Files are written in the order given, so with upsert the later file still wins on overlap.
+# Workers send their chunks one at a time through a bounded queue per file
+# (Config.INGEST_QUEUED_CHUNKS), so memory is bounded by chunks in flight, not file sizes.
+# The pool starts files in submission order and the writer takes them in that order, so the
+# file being written is never stuck behind workers waiting on later files.
+# Workers and the queue manager are spawned, not forked: ingestion runs on the DatabaseWriter
+# thread of a multithreaded server, and a forked child would inherit locks (logging, SQLite,
+# tornado) held by other threads at fork time, which nothing in the child would ever release.
+_MP_CONTEXT = multiprocessing.get_context('spawn')
+
+class _WorkerFile:
+    """A file being prepared by prepare_csv_file in a worker process."""
+
+    def __init__(self, pool, manager, file_path, chunksize, rows_to_skip):
+        self.out = manager.Queue(maxsize=Config.INGEST_QUEUED_CHUNKS)
+        self.stop = manager.Event()
+        self.future = pool.submit(prepare_csv_file, file_path, self.out, self.stop, chunksize, rows_to_skip)
+
+    def chunks(self, stage_stats):
+        """Yields the chunks as the worker prepares them, then adds its stage stats to
+        stage_stats. Waiting happens on first iteration, i.e. after process_csv_file's ledger
+        check, and worker errors surface inside process_csv_file so they are logged and
+        recorded in the ledger like any other read failure."""
+        while (item := self._next()) is not None:
+            yield item
+        merge_stage_stats(stage_stats, self.future.result())
+
+    def _next(self):
+        while True:
+            try:
+                return self.out.get(timeout=1)
+            except queue.Empty:
+                if self.future.done():
+                    self.future.result() # A worker that died without its final None raises here
+
+    def abandon(self):
+        """Stops the worker if the file was not read to the end (skipped or failed) and takes
+        its queued chunks, so the worker can finish and the pool moves on."""
+        if self.future.cancel(): # Not started yet
+            return
+        self.stop.set()
+        while not self.future.done():
+            try:
+                self.out.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _already_ingested(file_path, db_session):
+    """Ledger pre-check so known content is not sent to a worker for nothing."""
+    entry = db_session.query(IngestedFile).filter_by(content_hash=file_content_hash(file_path)).one_or_none()
+    return entry is not None and entry.status == 'success'
+
+
+def _result(file_path, status, records=0, error=None):
+    return {'file': os.path.basename(file_path), 'path': file_path, 'status': status,
+            'records': records, 'error': error}
+
+
+def ingest_files(file_paths, db_session: Session, max_workers: int = None, on_result=None, **process_kwargs) -> list:
+    """Ingests several CSV files, preparing them in parallel with one database writer.
+
+    Returns one result dict per file, in input order:
+    {'file', 'path', 'status' ('success' | 'skipped' | 'failed'), 'records', 'error'}.
+    on_result(result) is called as each file finishes, e.g. to update a progress display.
+    process_kwargs (chunksize, commit_per_chunk, resume, force, mode) go to process_csv_file.
+    A failed file does not stop the rest of the batch.
+    """
+    file_paths = list(dict.fromkeys(file_paths)) # Same path twice would race on its checkpoint
+    max_workers = min(max_workers or Config.INGEST_WORKERS, len(file_paths))
+    chunksize = process_kwargs.get('chunksize') or Config.INGEST_CHUNK_SIZE
+    resume = process_kwargs.get('resume', True)
+    force = process_kwargs.get('force', False)
+    results = []
+
+    def write(file_path, worker=None):
+        stage_stats = {}
+        prepared = worker.chunks(stage_stats) if worker is not None else None
+        try:
+            records = process_csv_file(file_path, db_session, prepared=prepared, stage_stats=stage_stats, **process_kwargs)
+            result = _result(file_path, 'success', records)
+        except AlreadyIngestedError as e:
+            result = _result(file_path, 'skipped', error=str(e))
+        except Exception as e:
+            logger.error(f"Batch ingestion failed for {os.path.basename(file_path)}: {e}")
+            result = _result(file_path, 'failed', error=str(e))
+        finally:
+            if worker is not None:
+                prepared.close()
+                worker.abandon()
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    if max_workers <= 1:
+        for file_path in file_paths:
+            write(file_path)
+        return results
+
+    logger.info(f"Ingesting {len(file_paths)} files with {max_workers} worker processes.")
+    with _MP_CONTEXT.Manager() as manager, ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT) as pool:
+        # Files are submitted a few ahead of the writer, so the next ones are being prepared
+        # while one is written; the queues keep what they hold to a few chunks each
+        pending = deque()
+        for file_path in file_paths:
+            if not os.path.exists(file_path) or (not force and _already_ingested(file_path, db_session)):
+                worker = None # process_csv_file reports the missing file / skip without reading it
+            else:
+                rows_to_skip = load_checkpoint(file_path) if resume else 0
+                worker = _WorkerFile(pool, manager, file_path, chunksize, rows_to_skip)
+            pending.append((file_path, worker))
+            if len(pending) >= 2 * max_workers:
+                write(*pending.popleft())
+        while pending:
+            write(*pending.popleft())
+    return results
@@ -0,0 +1,72 @@
+import functools
+import logging
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import Config
+from backend.schema import init_db
+
+logger = logging.getLogger(__name__)
+
+# --- Engine and Sessions ---
+# app.py, the monitor and every page used to create their own engine (and connection pool)
+# for the same SQLite file on each script run, with SQLite's defaults: a rollback journal
+# that blocks readers during a write, a sync on every commit and a 2 MiB page cache.
+# get_engine() creates one engine per process and database; every connection it opens gets
+# the pragmas below (Config.SQLITE_*). It also runs init_db() once, when it creates the
+# engine, rather than each page doing so on every script run (every widget interaction).
+
+def sqlite_pragmas() -> dict:
+    """PRAGMA name -> value applied to each new connection, from Config."""
+    return {
+        'journal_mode': Config.SQLITE_JOURNAL_MODE,
+        'synchronous': Config.SQLITE_SYNCHRONOUS,
+        'cache_size': -Config.SQLITE_CACHE_SIZE_KIB, # Negative: KiB rather than pages
+        'mmap_size': Config.SQLITE_MMAP_SIZE,
+        'temp_store': Config.SQLITE_TEMP_STORE,
+    }
+
+def create_sqlite_engine(url: str, pragmas: dict = None, **kwargs):
+    """create_engine() for a SQLite URL that applies `pragmas` (default: sqlite_pragmas())
+    on connect. Pass pragmas={} for SQLite's defaults."""
+    engine = create_engine(url, **kwargs)
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+_engines = {} # {bind: engine}
+_engines_lock = threading.Lock() # Pages run in several threads: one engine and one init_db per bind
+
+def get_engine(bind: str = 'grd'):
+    """The process-wide engine of a Config.SQLALCHEMY_BINDS database, with its tables created
+    and migrations applied (init_db). If init_db fails, the next call tries again."""
+    with _engines_lock:
+        if bind not in _engines:
+            engine = create_sqlite_engine(Config.SQLALCHEMY_BINDS[bind])
+            try:
+                init_db(engine)
+            except Exception:
+                engine.dispose()
+                raise
+            logger.info(f"Created the '{bind}' database engine ({', '.join(f'{k}={v}' for k, v in sqlite_pragmas().items())}).")
+            _engines[bind] = engine
+        return _engines[bind]
+
+def get_sessionmaker(bind: str = 'grd') -> sessionmaker:
+    """The process-wide session factory of a database; all models share its engine."""
+    return _sessionmaker(bind)
+
+@functools.lru_cache(maxsize=None) # Keyed on an explicit bind, as get_sessionmaker() and ('grd') must share one
+def _sessionmaker(bind: str) -> sessionmaker:
+    return sessionmaker(bind=get_engine(bind))
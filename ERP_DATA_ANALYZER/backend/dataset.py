@@ -0,0 +1,218 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pandas.api.types import union_categoricals
+from sqlalchemy import or_, select
+
+from backend.database import get_engine
+from backend.models import ProductionRecordGRD
+from backend.queries import METRIC_RANGE, dimension_names
+from backend.versions import month_bounds, month_states
+
+logger = logging.getLogger(__name__)
+
+# --- Shared Dashboard Dataset ---
+# The metric pages used to cache their own copy of production_records_grd, one per page and
+# per filter combination. ProductionDataset loads the columns the dashboards show once per
+# process, with compact dtypes, and hands out filtered slices. All pages share one instance
+# through st.cache_resource (shared_dataset()) and it reads only what an ingestion changed.
+
+# Column -> in-memory dtype. Repeated strings become categories (one copy of each distinct
+# value plus small integer codes); machines, shifts and operators are read as their dimension
+# ids (backend/models.Dimension), filtered as integers and named only for display (with_names).
+# KPIs and cycle times are float32, durations and quantities 32-bit integers (nullable Int32,
+# as the columns can be NULL).
+DATASET_COLUMNS = {
+    'id': 'int64',
+    'posting_date': 'datetime64[ns]',
+    'document_no': 'category',
+    'machine_no_id': 'int32',
+    'work_shift_code_id': 'int32',
+    'operator_name_id': 'int32',
+    'oee_new': 'float32',
+    'availability': 'float32',
+    'performance': 'float32',
+    'quality_rate': 'float32',
+    'plan_time': 'Int32', # Seconds
+    'loss_time': 'Int32',
+    'actual_run_time': 'Int32',
+    'output_quantity': 'Int32',
+    'rejection_qty': 'Int32',
+    'rework_qty': 'Int32',
+    'current_c_t': 'float32',
+}
+# Rounding to float32 can move a KPI just above 100 onto 100, so whether each KPI lies within
+# METRIC_RANGE is worked out on the float64 values first: bit i of kpi_valid is set when
+# KPI_METRICS[i] is in range, which matches the SQL filters exactly.
+KPI_METRICS = ('oee_new', 'availability', 'performance', 'quality_rate')
+_LOAD_CHUNK_ROWS = 100_000
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """df with its DATASET_COLUMNS columns cast to the planned dtypes, and dimension names
+    (e.g. machine_no, see backend/queries.named_query) to categories."""
+    plan = {column: dtype for column, dtype in DATASET_COLUMNS.items() if column in df.columns}
+    plan.update({field: 'category' for field in ProductionRecordGRD.DIMENSIONS if field in df.columns})
+    if 'posting_date' in plan:
+        df['posting_date'] = pd.to_datetime(df['posting_date'])
+    return df.astype(plan)
+
+def _compact(rows: list) -> pd.DataFrame:
+    """One fetched chunk as a frame with DATASET_COLUMNS dtypes, plus kpi_valid, the month_year
+    label and the day of month the pages show (each distinct date is formatted once)."""
+    df = pd.DataFrame(rows, columns=list(DATASET_COLUMNS))
+    kpi_valid = np.zeros(len(df), dtype='uint8')
+    for bit, metric in enumerate(KPI_METRICS):
+        values = df[metric].to_numpy(dtype='float64', na_value=np.nan)
+        kpi_valid |= ((values >= METRIC_RANGE[0]) & (values <= METRIC_RANGE[1])).astype('uint8') << bit
+    df = compact_dtypes(df)
+    df['kpi_valid'] = kpi_valid
+    dates = pd.Series(df['posting_date'].unique())
+    df['month_year'] = df['posting_date'].map(dict(zip(dates, dates.dt.strftime('%b, %Y')))).astype('category')
+    df['day'] = df['posting_date'].dt.day.astype('int8')
+    return df
+
+def _concat(chunks: list) -> pd.DataFrame:
+    """Concatenates compact chunks, merging each category column's categories."""
+    if not chunks:
+        return _compact([])
+    # An empty chunk (e.g. the frame of an empty table) has object-dtype categories, which
+    # union_categoricals will not merge with the str categories of the others
+    chunks = [chunk for chunk in chunks if len(chunk)] or chunks[:1]
+    df = pd.concat(chunks, ignore_index=True)
+    for column in df.columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype) and len(chunks) > 1:
+            df[column] = pd.Categorical(union_categoricals([chunk[column] for chunk in chunks], sort_categories=True))
+    return df
+
+
+class ProductionDataset:
+    """The dashboard columns of production_records_grd, loaded once and shared read-only.
+
+    Rows are sorted by posting_date, so a date range is a contiguous slice. rows() takes the
+    same filter keywords as backend/queries.py and returns a new frame (copy-on-write), so
+    callers cannot change the shared data.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._frame = None
+        self._states = {} # {'YYYY-MM': (version, rewritten_version)} of the loaded rows
+        self._high_water = 0 # Highest id loaded
+        self._names = {} # {dimension id: name}, read with the rows (with_names)
+        self._lock = threading.Lock()
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """The whole dataset, loaded on first use. Each access compares the month data versions
+        (backend/versions.py) with those loaded and, if they moved, brings the rows up to date
+        (_update)."""
+        with self.engine.connect() as conn:
+            states = month_states(conn) # Read before the rows, so a concurrent commit is picked up next time
+        if self._frame is None or states != self._states:
+            with self._lock:
+                if self._frame is None:
+                    self._frame = self._load()
+                elif states != self._states:
+                    self._frame = self._update(states)
+                with self.engine.connect() as conn:
+                    # Values are added before the rows that use them and never removed, so every
+                    # id loaded has a name
+                    self._names = dimension_names(conn)
+                self._states = states
+                self._high_water = int(self._frame['id'].max()) if len(self._frame) else 0
+        return self._frame
+
+    def _read(self, *conditions) -> list:
+        """Compact chunks of the rows with a posting_date matching `conditions`."""
+        columns = [getattr(ProductionRecordGRD, column) for column in DATASET_COLUMNS]
+        # Read in table order and sort afterwards: ORDER BY posting_date would walk the date index
+        # and fetch each row from the table separately
+        query = select(*columns).where(ProductionRecordGRD.posting_date.isnot(None), *conditions)
+        chunks = []
+        with self.engine.connect() as conn:
+            result = conn.execute(query)
+            while rows := result.fetchmany(_LOAD_CHUNK_ROWS):
+                chunks.append(_compact(rows))
+        return chunks
+
+    def _load(self) -> pd.DataFrame:
+        df = _concat(self._read()).sort_values(['posting_date', 'id'], ignore_index=True)
+        logger.info(f"Loaded dashboard dataset: {len(df)} rows, {df.memory_usage(deep=True).sum() / 2**20:.1f} MiB.")
+        return df
+
+    def _update(self, states: dict) -> pd.DataFrame:
+        """The loaded frame brought up to `states`.
+
+        Ingestion mostly adds rows, and new rows get ids above every existing one, so they are
+        read by id above the high-water mark (a rowid range scan) and merged in. Only months
+        whose rewritten_version moved (rows updated or deleted) are dropped and read again.
+        """
+        df = self._frame
+        rewritten = sorted(month for month in states.keys() | self._states.keys()
+                           if states.get(month, (0, 0))[1] != self._states.get(month, (0, 0))[1])
+        high_water = self._high_water
+        chunks = []
+        if rewritten:
+            rewritten_months = np.array(rewritten, dtype='datetime64[M]')
+            df = df[~np.isin(df['posting_date'].to_numpy().astype('datetime64[M]'), rewritten_months)]
+            # Rows of the other months were not deleted, so new ids are above the highest kept one
+            high_water = int(df['id'].max()) if len(df) else 0
+            chunks += self._read(or_(*(ProductionRecordGRD.posting_date.between(*month_bounds(month)) for month in rewritten)))
+        reread = sum(len(chunk) for chunk in chunks)
+        for chunk in self._read(ProductionRecordGRD.id > high_water):
+            if rewritten: # Already read with their months
+                chunk = chunk[~np.isin(chunk['posting_date'].to_numpy().astype('datetime64[M]'), rewritten_months)]
+            chunks.append(chunk)
+        if not chunks:
+            return df.reset_index(drop=True)
+        new = _concat(chunks).sort_values(['posting_date', 'id'])
+        # Within a date, rows are either all re-read or kept rows followed by higher new ids, so a
+        # stable sort on the date alone (two sorted runs) restores (posting_date, id) order
+        df = _concat([df, new]).sort_values('posting_date', kind='stable', ignore_index=True)
+        logger.info(f"Updated dashboard dataset: {len(new) - reread} new rows"
+                    + (f", {reread} rows of {', '.join(rewritten)} read again" if rewritten else '') + '.')
+        return df
+
+    def reload(self):
+        """Drops the loaded data; the next access reads the table again."""
+        with self._lock:
+            self._frame = None
+            self._states = {}
+
+    def _date_slice(self, start_date=None, end_date=None) -> pd.DataFrame:
+        df = self.frame
+        dates = df['posting_date'].to_numpy()
+        first = 0 if start_date is None else np.searchsorted(dates, np.datetime64(start_date, 'ns'), side='left')
+        last = len(df) if end_date is None else np.searchsorted(dates, np.datetime64(end_date, 'ns'), side='right')
+        return df.iloc[first:last]
+
+    def rows(self, start_date=None, end_date=None, machines=None, shifts=None, operators=None,
+             valid_metrics=()) -> pd.DataFrame:
+        """Rows matching the filters (see backend/queries.filter_conditions)."""
+        df = self._date_slice(start_date, end_date)
+        mask = np.ones(len(df), dtype=bool)
+        for selected, column in ((machines, 'machine_no_id'), (shifts, 'work_shift_code_id'), (operators, 'operator_name_id')):
+            if selected:
+                mask &= np.isin(df[column].to_numpy(), list(selected))
+        if valid_metrics:
+            bits = sum(1 << KPI_METRICS.index(metric) for metric in set(valid_metrics))
+            mask &= (df['kpi_valid'].to_numpy() & bits) == bits
+        return df if mask.all() else df[mask]
+
+    def with_names(self, df: pd.DataFrame) -> pd.DataFrame:
+        """df (rows of this dataset) with the names of its dimension ids as category columns
+        (machine_no_id -> machine_no, ...), for display."""
+        return df.assign(**{column.removesuffix('_id'): df[column].map(self._names).astype('category')
+                            for column in DATASET_COLUMNS if column.endswith('_id') and column in df.columns})
+
+    def memory_mib(self) -> float:
+        return self.frame.memory_usage(deep=True).sum() / 2**20
+
+
+@st.cache_resource
+def shared_dataset() -> ProductionDataset:
+    """The process-wide dataset of the dashboard pages. It follows the data versions itself."""
+    return ProductionDataset(get_engine())
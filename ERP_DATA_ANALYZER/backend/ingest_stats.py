@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from backend.config import Config
+from backend.models import IngestRun
+
+logger = logging.getLogger(__name__)
+
+# --- Stage Instrumentation ---
+# process_csv_file times each ingestion stage with timed_stage(). Stats are summed over all
+# chunks: {stage: {'seconds', 'cpu_seconds', 'rows', 'peak_rss_mib'}}. Every attempt is then
+# stored as an IngestRun row (record_run), which the Data Management page charts.
+# peak_rss_mib is the highest resident memory during the stage, temporaries included: on Linux
+# each stage resets the kernel's high-water mark (VmHWM) when it starts and reads it when it
+# ends. Where that is not available it is the memory at the stage's end.
+INGEST_STAGES = ('hash', 'read', 'clean', 'align', 'kpi', 'insert', 'publish', 'rollup')
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError): # No sysconf on Windows
+    _PAGE_SIZE = 4096
+
+def current_rss_mib():
+    """Resident memory of this process in MiB. Uses /proc on Linux; elsewhere falls back to
+    the peak so far (ru_maxrss), or None where neither is available."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KiB elsewhere
+    except ImportError:
+        return None
+
+# The high-water mark is per process, so a reset for one stage would hide the earlier peak of
+# any other stage in progress (nested, or in another thread): each reset first adds the
+# high-water mark so far to the peaks of the open stages.
+_open_stage_peaks = {} # {token: peak MiB so far} of the stages in progress
+_open_stage_lock = threading.Lock()
+
+def _high_water_rss_mib():
+    """Highest resident memory since the last reset (VmHWM), or None where unavailable."""
+    try:
+        with open('/proc/self/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) / 2**10 # kB
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def _start_peak():
+    """Starts measuring a stage's peak memory. Returns a token for _end_peak, or None where
+    the high-water mark cannot be reset."""
+    with _open_stage_lock:
+        high_water = _high_water_rss_mib()
+        if high_water is None:
+            return None
+        for token in _open_stage_peaks:
+            _open_stage_peaks[token] = max(_open_stage_peaks[token], high_water)
+        try:
+            with open('/proc/self/clear_refs', 'wb') as f:
+                f.write(b'5') # Resets VmHWM to the current RSS
+        except OSError:
+            return None
+        token = object()
+        _open_stage_peaks[token] = _high_water_rss_mib() or 0.0
+        return token
+
+def _end_peak(token) -> float:
+    """Peak memory in MiB since _start_peak returned `token`."""
+    with _open_stage_lock:
+        return max(_open_stage_peaks.pop(token), _high_water_rss_mib() or 0.0)
+
+def _empty_stage():
+    return {'seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0, 'peak_rss_mib': None}
+
+@contextmanager
+def timed_stage(stage_stats: dict, stage: str, rows: int = 0):
+    """Adds the block's wall and CPU time, `rows` and its peak memory to stage_stats[stage].
+    Yields a dict whose 'rows' the block may set when the count is only known afterwards.
+    No-op when stage_stats is None."""
+    counter = {'rows': rows}
+    peak_token = _start_peak() if stage_stats is not None else None
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        yield counter
+    finally:
+        if stage_stats is not None:
+            stats = stage_stats.setdefault(stage, _empty_stage())
+            stats['seconds'] += time.perf_counter() - started
+            stats['cpu_seconds'] += time.process_time() - cpu_started
+            stats['rows'] += counter['rows']
+            rss = _end_peak(peak_token) if peak_token is not None else current_rss_mib()
+            if rss is not None:
+                stats['peak_rss_mib'] = max(stats['peak_rss_mib'] or 0.0, rss)
+
+def merge_stage_stats(target: dict, source: dict):
+    """Adds stage stats collected elsewhere (e.g. in a batch worker process) into target."""
+    for stage, stats in source.items():
+        merged = target.setdefault(stage, _empty_stage())
+        for key in ('seconds', 'cpu_seconds', 'rows'):
+            merged[key] += stats[key]
+        if stats['peak_rss_mib'] is not None:
+            merged['peak_rss_mib'] = max(merged['peak_rss_mib'] or 0.0, stats['peak_rss_mib'])
+
+
+# --- Run Records ---
+def record_run(db_session: Session, file_name: str, status: str, stage_stats: dict, wall_seconds: float, **fields):
+    """Stores one IngestRun and commits it. Best effort: a failure here is logged, never raised,
+    so instrumentation cannot fail an ingestion. fields: other IngestRun columns."""
+    peaks = [s['peak_rss_mib'] for s in stage_stats.values() if s['peak_rss_mib'] is not None]
+    row_count = fields.get('row_count')
+    run = IngestRun(
+        file_name=file_name, status=status, wall_seconds=wall_seconds,
+        cpu_seconds=sum(s['cpu_seconds'] for s in stage_stats.values()),
+        peak_rss_mib=max(peaks) if peaks else None,
+        rows_per_second=row_count / wall_seconds if row_count and wall_seconds else None,
+        stages=json.dumps({stage: stage_stats[stage] for stage in INGEST_STAGES if stage in stage_stats}),
+        **fields,
+    )
+    if run.error:
+        run.error = run.error[:500]
+    try:
+        db_session.add(run)
+        db_session.commit()
+    except SQLAlchemyError as e:
+        db_session.rollback()
+        logger.warning(f"Could not record ingest run for {file_name}: {e}")
+
+
+def run_history(db_session: Session, limit: int = 500) -> pd.DataFrame:
+    """The latest `limit` runs, oldest first, with regression flags.
+
+    A successful run is flagged when its rows/s is INGEST_REGRESSION_FACTOR times below the
+    median of the previous INGEST_REGRESSION_WINDOW successful runs of similar size (same power
+    of ten of rows, same serial/worker path). Small files run slower per row, so runs are only
+    compared with runs of similar size. At least 3 earlier runs are needed for a baseline.
+    """
+    runs = (db_session.query(IngestRun).order_by(IngestRun.finished_at.desc(), IngestRun.id.desc())
+            .limit(limit).all())
+    columns = [c.name for c in IngestRun.__table__.columns]
+    df = pd.DataFrame([{col: getattr(run, col) for col in columns} for run in reversed(runs)], columns=columns)
+    df['baseline_rows_per_second'] = np.nan
+    df['regression'] = False
+    if df.empty:
+        return df
+
+    ok = (df['status'] == 'success') & (df['rows_per_second'] > 0)
+    successful = df[ok]
+    size_bucket = np.floor(np.log10(successful['row_count'].clip(lower=1).astype(float)))
+    window = Config.INGEST_REGRESSION_WINDOW
+    baseline = (successful.groupby([size_bucket, successful['worker_prepared'].astype(bool)])['rows_per_second']
+                .transform(lambda s: s.shift(1).rolling(window, min_periods=3).median()))
+    df.loc[ok, 'baseline_rows_per_second'] = baseline
+    df.loc[ok, 'regression'] = (successful['rows_per_second'] * Config.INGEST_REGRESSION_FACTOR < baseline).to_numpy()
+    return df
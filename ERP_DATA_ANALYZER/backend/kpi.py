@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# --- Columnar KPI Engine ---
+# Array versions of calc_availability, calc_quality_rate, calc_performance,
+# calc_oee_new and calc_shift_type from utilities.py. The clamping and
+# zero-handling rules must stay identical to the scalar functions, which remain
+# the reference implementation (see benchmarks/bench_kpi.py for the parity check).
+
+KPI_COLUMNS = ['availability', 'quality_rate', 'performance', 'oee_new', 'shift_type']
+
+
+def as_float_array(values, length=None):
+    """Converts a column to a float64 array, mapping NA/NaN/inf and unparsable values to 0.0
+    (the same default safe_float_conversion uses)."""
+    if values is None:
+        return np.zeros(length or 0, dtype='float64')
+    numeric = pd.to_numeric(pd.Series(values, copy=False), errors='coerce')
+    arr = numeric.to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(np.isfinite(arr), arr, 0.0)
+
+
+def calc_kpi_arrays(plan_time, loss_time, output_qty, reject_qty, current_ct, actual_run_time):
+    """Computes all five KPI columns in one pass over whole arrays.
+
+    Inputs may be Series or array-likes of equal length (NA allowed).
+    Returns a dict of column name -> numpy array.
+    """
+    n = next((len(v) for v in (plan_time, loss_time, output_qty, reject_qty, current_ct, actual_run_time) if v is not None), 0)
+    plan = as_float_array(plan_time, n)
+    loss = as_float_array(loss_time, n)
+    output = as_float_array(output_qty, n)
+    reject = as_float_array(reject_qty, n)
+    ct = as_float_array(current_ct, n)
+    run = as_float_array(actual_run_time, n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Availability: 0 when there is no plan time, clamped to 0-100
+        has_plan = plan > 0
+        available = np.maximum(0.0, plan - loss)
+        availability = np.where(has_plan, np.clip(available / np.where(has_plan, plan, 1.0) * 100, 0.0, 100.0), 0.0)
+
+        # Quality: nothing produced -> 0 if anything was rejected, else 100
+        has_output = output > 0
+        capped_reject = np.minimum(reject, output)
+        quality_ratio = (output - capped_reject) / np.where(has_output, output, 1.0)
+        quality_rate = np.where(has_output, np.clip(quality_ratio * 100, 0.0, 100.0), np.where(reject > 0, 0.0, 100.0))
+
+        # Performance: not clamped above 100 (values > 100 surface on the error pages)
+        perf_valid = (run > 0) & (ct > 0) & (output > 0)
+        performance_ratio = (output * ct) / np.where(perf_valid, run, 1.0)
+        performance = np.where(perf_valid, np.maximum(0.0, performance_ratio * 100), 0.0)
+
+    # OEE: availability and quality ratios clamped to 0-1, performance only floored at 0
+    avail_ratio = np.clip(availability / 100.0, 0.0, 1.0)
+    perf_ratio = np.maximum(0.0, performance / 100.0)
+    qual_ratio = np.clip(quality_rate / 100.0, 0.0, 1.0)
+    oee_new = np.maximum(0.0, avail_ratio * perf_ratio * qual_ratio * 100)
+
+    shift_type = np.where(run > 0, 'Active', 'Idle').astype(object)
+
+    return {
+        'availability': availability,
+        'quality_rate': quality_rate,
+        'performance': performance,
+        'oee_new': oee_new,
+        'shift_type': shift_type,
+    }
+
+
+def compute_kpis(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds the calculated KPI columns to a type-aligned ingestion frame (in place) and returns it."""
+    kpis = calc_kpi_arrays(
+        df.get('plan_time'), df.get('loss_time'),
+        df.get('output_quantity'), df.get('rejection_qty'),
+        df.get('current_c_t'), df.get('actual_run_time'),
+    )
+    for col, values in kpis.items():
+        df[col] = values
+    return df
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Index
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, Index, text
 from sqlalchemy.orm import declarative_base # Updated import
 
 Base = declarative_base()
@@ -10,32 +10,32 @@ class ProductionRecordGRD(Base):
 
     id = Column(Integer, primary_key=True)
     shift_type = Column(String(10), nullable=True) # Increased size slightly
-    posting_date = Column(String(20), nullable=True, index=True) # Index for faster date filtering
+    posting_date = Column(Date, nullable=True, index=True) # Stored as ISO 'YYYY-MM-DD', so the index serves date ranges
     document_no = Column(String(255), nullable=True, index=True) # Index if frequently filtered
     order_no = Column(String(255), nullable=True)
-    item_no = Column(String(255), nullable=True)
+    item_no_id = Column(Integer, nullable=False) # dimensions.id of the value (see DIMENSIONS)
     operation_no = Column(Integer, nullable=True)
     operation_description = Column(String(255), nullable=True)
     order_line_no = Column(Integer, nullable=True)
     type = Column(String(50), nullable=True)
-    machine_no = Column(String(50), nullable=True, index=True) # Index for faster machine filtering
+    machine_no_id = Column(Integer, nullable=False, index=True) # Index for faster machine filtering
     current_c_t = Column(Float, nullable=True) # Cycle time often stored as float seconds
     output_quantity = Column(Integer, nullable=True)
     rejection_qty = Column(Integer, nullable=True)
-    rejection_reason = Column(String(255), nullable=True)
+    rejection_reason_id = Column(Integer, nullable=False)
     rework_qty = Column(Integer, nullable=True)
-    rework_reason = Column(String(255), nullable=True)
-    work_shift_code = Column(String(50), nullable=True, index=True) # Index for faster shift filtering
+    rework_reason_id = Column(Integer, nullable=False)
+    work_shift_code_id = Column(Integer, nullable=False, index=True) # Index for faster shift filtering
     start_time = Column(String(10), nullable=True) # Allow HH:MM or HH:MM:SS
     end_time = Column(String(10), nullable=True) # Allow HH:MM or HH:MM:SS
     plan_time = Column(Integer, nullable=True, default=0) # Plan time in seconds
     actual_run_time = Column(Integer, nullable=True, default=0) # Run time in seconds
     loss_time = Column(Integer, nullable=True, default=0) # Loss time in seconds
     remarks = Column(String(500), nullable=True) # Increased size for remarks
-    operator_name = Column(String(255), nullable=True)
+    operator_name_id = Column(Integer, nullable=False)
     loss_time_should_be = Column(Integer, nullable=True, default=0) # In seconds
     oee = Column(String(255), nullable=True) # Original OEE string, if needed for reference
-    reason_code = Column(String(50), nullable=True)
+    reason_code_id = Column(Integer, nullable=False)
     reason_time_hm = Column(Integer, nullable=True, default=0) # Assuming this is time in seconds now based on utility
     loss_time_remark = Column(String(500), nullable=True) # Increased size
 
@@ -45,11 +45,199 @@ class ProductionRecordGRD(Base):
     performance = Column(Float, nullable=True)
     oee_new = Column(Float, nullable=True, index=True) # Index the main OEE metric
 
+    # ingested_files.id of the file that last wrote the row (NULL for rows loaded before batches
+    # were recorded). Lets a whole file be deleted or replaced (backend/utilities.delete_ingest_batch).
+    ingest_batch_id = Column(Integer, nullable=True)
+    # Lines of one file can share all the other natural-key columns, e.g. two loss-time entries
+    # with the same reason but different times or remarks. They are numbered 0, 1, ... in file
+    # order (backend/utilities.KeyOrdinals), so each stays a row of its own.
+    key_ordinal = Column(Integer, nullable=False, default=0)
+
+    # Repeated text values stored as keys into the dimensions table: field -> column <field>_id.
+    # Blank and missing values are both the value ''.
+    DIMENSIONS = ('machine_no', 'work_shift_code', 'operator_name', 'item_no', 'reason_code',
+                  'rejection_reason', 'rework_reason')
+
+    # Natural key: identifies the same ERP line across overlapping exports, so a re-exported
+    # month updates its rows instead of appending copies. The export has no line id; the
+    # production entry (document/operation/line, date, shift, machine, start) plus reason_code
+    # (loss-time lines share an empty start_time) identifies a line up to key_ordinal, its
+    # position among the lines of the file with the same entry and reason.
+    NATURAL_KEY = ('document_no', 'operation_no', 'order_line_no', 'posting_date',
+                   'work_shift_code_id', 'machine_no_id', 'start_time', 'reason_code_id', 'key_ordinal')
+    # Error pages list rows whose metric exceeds 100%, a few hundred out of the whole table.
+    # Partial indexes hold only those rows, ordered by date, so the error queries read them directly.
+    ERROR_METRICS = ('oee_new', 'availability', 'performance', 'quality_rate')
+    __table_args__ = (
+        Index('uq_prodrecgrd_natural_key', *NATURAL_KEY, unique=True),
+        *(Index(f'ix_prodrecgrd_{metric}_over_100', 'posting_date', sqlite_where=text(f'{metric} > 100'))
+          for metric in ERROR_METRICS),
+        # Batch first, then date: deleting a batch finds its rows and the dates to refresh from the index
+        Index('ix_prodrecgrd_ingest_batch', 'ingest_batch_id', 'posting_date'),
+    )
+
     # Add more indexes if other columns are frequently used in WHERE clauses
     # Example: Index('ix_prodrecgrd_item_op', 'item_no', 'operation_no')
 
     def __repr__(self):
-        return f"<ProductionRecordGRD(id={self.id}, date={self.posting_date}, machine={self.machine_no}, oee={self.oee_new})>"
+        return f"<ProductionRecordGRD(id={self.id}, date={self.posting_date}, machine={self.machine_no_id}, oee={self.oee_new})>"
+
+class KpiDailyRollup(Base):
+    """Daily aggregates of production_records_grd per (date, machine, shift, operator), kept
+    in step with it at ingest (backend/rollup.py) so dashboards read pre-aggregated rows.
+
+    Metric sums/counts only include rows where that metric is in 0-100 (the dashboard range).
+    The all_valid_* columns only include rows where all four metrics are in 0-100, which is
+    what the Overview page averages over. Rows without a posting_date are not rolled up."""
+    __tablename__ = 'kpi_daily_rollup'
+
+    id = Column(Integer, primary_key=True)
+    posting_date = Column(Date, nullable=False)
+    machine_no_id = Column(Integer, nullable=False) # dimensions.id, as on production_records_grd
+    work_shift_code_id = Column(Integer, nullable=False)
+    operator_name_id = Column(Integer, nullable=False)
+
+    row_count = Column(Integer, nullable=False)
+    plan_time_sum = Column(Integer, nullable=False) # Seconds
+    loss_time_sum = Column(Integer, nullable=False) # Seconds
+    actual_run_time_sum = Column(Integer, nullable=False) # Seconds
+    output_quantity_sum = Column(Integer, nullable=False)
+    rejection_qty_sum = Column(Integer, nullable=False)
+
+    oee_new_sum = Column(Float, nullable=False)
+    oee_new_count = Column(Integer, nullable=False)
+    availability_sum = Column(Float, nullable=False)
+    availability_count = Column(Integer, nullable=False)
+    performance_sum = Column(Float, nullable=False)
+    performance_count = Column(Integer, nullable=False)
+    quality_rate_sum = Column(Float, nullable=False)
+    quality_rate_count = Column(Integer, nullable=False)
+
+    all_valid_count = Column(Integer, nullable=False)
+    oee_new_all_valid_sum = Column(Float, nullable=False)
+    availability_all_valid_sum = Column(Float, nullable=False)
+    performance_all_valid_sum = Column(Float, nullable=False)
+    quality_rate_all_valid_sum = Column(Float, nullable=False)
+
+    KEY = ('posting_date', 'machine_no_id', 'work_shift_code_id', 'operator_name_id')
+    __table_args__ = (
+        Index('uq_kpi_daily_rollup_key', *KEY, unique=True),
+    )
+
+    def __repr__(self):
+        return f"<KpiDailyRollup(date={self.posting_date}, machine={self.machine_no_id}, shift={self.work_shift_code_id}, rows={self.row_count})>"
+
+class FilterCatalog(Base):
+    """Distinct values of the filterable columns per month, kept in step with
+    production_records_grd at ingest (backend/rollup.py). Sidebar options are read from here,
+    so building them costs the number of distinct values rather than the number of rows.
+    The counts follow kpi_daily_rollup: a metric's count only includes rows where it is in 0-100."""
+    __tablename__ = 'filter_catalog'
+
+    FIELDS = ('machine_no', 'work_shift_code', 'operator_name', 'reason_code', 'item_no') # Dimension fields
+
+    id = Column(Integer, primary_key=True)
+    field = Column(String(50), nullable=False) # One of FIELDS
+    month = Column(String(7), nullable=False) # 'YYYY-MM' of posting_date
+    value_id = Column(Integer, nullable=False) # dimensions.id of the value
+
+    row_count = Column(Integer, nullable=False)
+    oee_new_count = Column(Integer, nullable=False)
+    availability_count = Column(Integer, nullable=False)
+    performance_count = Column(Integer, nullable=False)
+    quality_rate_count = Column(Integer, nullable=False)
+    all_valid_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('uq_filter_catalog_key', 'field', 'month', 'value_id', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<FilterCatalog(field={self.field}, month={self.month}, value={self.value_id}, rows={self.row_count})>"
+
+class Dimension(Base):
+    """Dictionary of the repeated text values of production_records_grd (ProductionRecordGRD.DIMENSIONS):
+    machines, shifts, operators, items, reason codes and reasons. Fact, rollup and catalog rows
+    store the id of a value, so the large tables and their indexes hold small integers and
+    GROUP BY / IN compare integers; names are joined back for display. Ingestion adds new values
+    when it publishes (backend/utilities.publish_staged); values are never removed."""
+    __tablename__ = 'dimensions'
+
+    id = Column(Integer, primary_key=True)
+    field = Column(String(50), nullable=False) # One of ProductionRecordGRD.DIMENSIONS
+    value = Column(String(255), nullable=False) # '' for blank or missing values
+
+    __table_args__ = (
+        Index('uq_dimensions_field_value', 'field', 'value', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<Dimension(id={self.id}, field={self.field}, value={self.value})>"
+
+class DataVersion(Base):
+    """Data version counters (backend/versions.py). The 'all' row counts every commit that
+    changed production data; each 'YYYY-MM' row holds the counter value of the last commit
+    that changed that month. Dashboard caches key on these instead of expiring on a timer.
+    rewritten_version is the last commit that updated or deleted existing rows rather than
+    only adding new ones; until it changes, cached rows can be extended with the new ids."""
+    __tablename__ = 'data_versions'
+
+    scope = Column(String(7), primary_key=True) # 'all' or 'YYYY-MM'
+    version = Column(Integer, nullable=False)
+    rewritten_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<DataVersion(scope={self.scope}, version={self.version})>"
+
+class IngestedFile(Base):
+    """Ingestion ledger: one row per distinct file content, so re-dropped or re-uploaded
+    files can be skipped with a hash lookup instead of a full parse and insert. Its id is the
+    ingest_batch_id of the production rows the file wrote."""
+    __tablename__ = 'ingested_files'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False, unique=True) # SHA-256 of the file bytes
+    file_name = Column(String(255), nullable=False)
+    file_size = Column(Integer, nullable=True) # Bytes
+    row_count = Column(Integer, nullable=True) # CSV data rows read
+    inserted_count = Column(Integer, nullable=True) # Records written by the last run
+    status = Column(String(20), nullable=False) # 'success', 'failed', or 'deleted'/'replaced' (rows removed again)
+    error = Column(String(500), nullable=True) # Last failure message
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    hash_seconds = Column(Float, nullable=True) # Time spent hashing the file
+    duration_seconds = Column(Float, nullable=True) # Total processing time
+
+    def __repr__(self):
+        return f"<IngestedFile(id={self.id}, file={self.file_name}, status={self.status}, rows={self.row_count})>"
+
+class IngestRun(Base):
+    """Instrumentation for one ingestion attempt (success or failure): totals plus wall time,
+    CPU time, rows and peak memory per stage (see backend/ingest_stats.py)."""
+    __tablename__ = 'ingest_runs'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=True, index=True) # Links to ingested_files.content_hash
+    file_name = Column(String(255), nullable=False)
+    file_size = Column(Integer, nullable=True) # Bytes
+    status = Column(String(20), nullable=False) # 'success' or 'failed'
+    error = Column(String(500), nullable=True)
+    mode = Column(String(20), nullable=True) # 'upsert' or 'append'
+    chunksize = Column(Integer, nullable=True)
+    worker_prepared = Column(Boolean, nullable=False, default=False) # Parsed in a batch worker process
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True, index=True)
+    row_count = Column(Integer, nullable=True) # CSV data rows read
+    inserted_count = Column(Integer, nullable=True)
+    wall_seconds = Column(Float, nullable=True)
+    cpu_seconds = Column(Float, nullable=True) # Summed over stages, including worker processes
+    peak_rss_mib = Column(Float, nullable=True) # Highest resident memory during any stage (see backend/ingest_stats.py)
+    rows_per_second = Column(Float, nullable=True)
+    stages = Column(Text, nullable=True) # JSON: {stage: {seconds, cpu_seconds, rows, peak_rss_mib}}
+
+    def __repr__(self):
+        return f"<IngestRun(id={self.id}, file={self.file_name}, status={self.status}, rows/s={self.rows_per_second})>"
 
 # You can define other models for different databases/tables here
 # class AnotherRecord(Base):
@@ -0,0 +1,106 @@
+import logging
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from backend.models import Dimension, FilterCatalog
+from backend.versions import month_key
+
+logger = logging.getLogger(__name__)
+
+# --- Dashboard Query Builder ---
+# The dashboard sidebars (date range, machines, shifts, operators) and the 0-100 metric range
+# become WHERE clauses here, so SQLite filters through the posting_date / machine_no_id /
+# work_shift_code_id indexes and only matching rows reach pandas. Works on any model with the
+# sidebar columns (ProductionRecordGRD, KpiDailyRollup).
+# Machines, shifts and operators are dimension ids (backend/models.Dimension): filters compare
+# integers, and names are only joined back for display (catalog_values, named_query).
+#
+# Filters are keyword arguments, so pages can keep them in a dict (hashable by st.cache_data):
+#   start_date, end_date: inclusive datetime.date bounds
+#   machines, shifts, operators: selected dimension ids; empty or None means no filter (as in the sidebars)
+#   valid_metrics: metric columns that must lie within METRIC_RANGE
+#   where: extra SQLAlchemy conditions
+
+METRIC_RANGE = (0, 100)
+
+def filter_conditions(model, start_date=None, end_date=None, machines=None, shifts=None, operators=None,
+                      valid_metrics=(), where=()) -> list:
+    """SQL conditions for the sidebar selections. Rows without a posting_date never match."""
+    conditions = [model.posting_date.isnot(None)]
+    if start_date is not None:
+        conditions.append(model.posting_date >= start_date)
+    if end_date is not None:
+        conditions.append(model.posting_date <= end_date)
+    for selected, column in ((machines, 'machine_no_id'), (shifts, 'work_shift_code_id'), (operators, 'operator_name_id')):
+        if selected:
+            conditions.append(getattr(model, column).in_(list(selected)))
+    for metric in valid_metrics:
+        conditions.append(getattr(model, metric).between(*METRIC_RANGE))
+    conditions.extend(where)
+    return conditions
+
+def above_range(model, metric: str):
+    """Condition for rows whose metric exceeds METRIC_RANGE (the error pages). On
+    production_records_grd it is served by the partial ix_prodrecgrd_<metric>_over_100 index."""
+    return getattr(model, metric) > METRIC_RANGE[1]
+
+def filtered_query(session, model, columns, **filters):
+    """session.query(*columns) restricted to the rows matching the filters."""
+    return session.query(*columns).filter(*filter_conditions(model, **filters))
+
+def date_bounds(session, model, **filters):
+    """(first, last) posting_date of the matching rows as datetime.date, or (None, None)."""
+    return tuple(filtered_query(session, model, [func.min(model.posting_date), func.max(model.posting_date)], **filters).one())
+
+def catalog_values(session, field: str, start_date=None, end_date=None, count_column: str = 'row_count') -> dict:
+    """{dimension id: name} of the distinct values of `field` (sidebar options) in the months
+    overlapping the date range, sorted by name, read from filter_catalog. Only values with rows
+    counted by count_column qualify, e.g. 'oee_new_count' for values with a valid (0-100) OEE."""
+    query = (session.query(FilterCatalog.value_id, Dimension.value).join(Dimension, Dimension.id == FilterCatalog.value_id)
+             .filter(FilterCatalog.field == field, getattr(FilterCatalog, count_column) > 0))
+    if start_date is not None:
+        query = query.filter(FilterCatalog.month >= month_key(start_date))
+    if end_date is not None:
+        query = query.filter(FilterCatalog.month <= month_key(end_date))
+    return dict(query.distinct().order_by(Dimension.value).all())
+
+def dimension_names(conn) -> dict:
+    """{dimension id: name} of every dimension value (a few thousand rows at most)."""
+    return dict(conn.execute(select(Dimension.id, Dimension.value)).all())
+
+def named_query(session, model, columns):
+    """session.query(*columns) where a dimension field in `columns` (model.DIMENSIONS, e.g.
+    machine_no) is its name, joined from dimensions through <field>_id. For display."""
+    entities, joins = [], []
+    for column in columns:
+        if column in getattr(model, 'DIMENSIONS', ()):
+            names = aliased(Dimension)
+            entities.append(names.value.label(column))
+            joins.append((names, names.id == getattr(model, f"{column}_id")))
+        else:
+            entities.append(getattr(model, column))
+    query = session.query(*entities).select_from(model)
+    for names, on in joins:
+        query = query.join(names, on)
+    return query
+
+
+# --- Aggregations ---
+def daily_averages(session, model, metric: str, mean_columns=(), **filters) -> pd.DataFrame:
+    """One row per posting_date among the matching rows, computed with SQL GROUP BY: the mean
+    of `metric` (as metric_value), the mean of each of mean_columns and record_count. Chart
+    payloads built from it grow with the number of days, not records."""
+    columns = [model.posting_date, func.avg(getattr(model, metric)).label('metric_value')]
+    columns += [func.avg(getattr(model, column)).label(column) for column in mean_columns]
+    columns.append(func.count().label('record_count'))
+    rows = filtered_query(session, model, columns, **filters).group_by(model.posting_date).order_by(model.posting_date).all()
+    return pd.DataFrame(rows, columns=['posting_date', 'metric_value', *mean_columns, 'record_count'])
+
+def metric_errors(session, model, metric: str, columns, **filters) -> pd.DataFrame:
+    """`columns` of the matching rows whose metric exceeds METRIC_RANGE, ordered by posting_date,
+    with dimension fields as names (named_query). Only those rows are read, as plain column tuples."""
+    where = (above_range(model, metric), *filters.pop('where', ()))
+    query = named_query(session, model, columns).filter(*filter_conditions(model, where=where, **filters))
+    return pd.DataFrame(query.order_by(model.posting_date).all(), columns=list(columns))
@@ -0,0 +1,119 @@
+import logging
+
+from sqlalchemy import text
+
+from backend.models import FilterCatalog, KpiDailyRollup, ProductionRecordGRD
+from backend.versions import month_key
+
+logger = logging.getLogger(__name__)
+
+# --- Daily KPI Rollup ---
+# kpi_daily_rollup holds one row per (posting_date, machine, shift, operator), keyed by their
+# dimension ids (backend/models.Dimension) like production_records_grd.
+# Ingestion can update existing rows (upsert), and the operator is not part of the natural key,
+# so adding deltas could leave stale groups behind. Instead, every date touched by an ingestion
+# is recomputed from production_records_grd (posting_date is indexed), in the same transaction
+# as the data. Rows without a posting_date are left out.
+
+METRICS = ('oee_new', 'availability', 'performance', 'quality_rate')
+SUMMED_COLUMNS = ('plan_time', 'loss_time', 'actual_run_time', 'output_quantity', 'rejection_qty')
+
+# Dates per DELETE/INSERT statement (keeps well under SQLite's bound-parameter limit)
+_DATES_PER_STATEMENT = 500
+
+def _valid(metric):
+    return f"{metric} BETWEEN 0 AND 100"
+
+def _aggregate_select(where: str) -> str:
+    """SELECT producing kpi_daily_rollup rows from production_records_grd for `where`."""
+    all_valid = ' AND '.join(_valid(m) for m in METRICS)
+    keys = list(KpiDailyRollup.KEY)
+    expressions = keys + ['COUNT(*)']
+    expressions += [f"IFNULL(SUM({col}), 0)" for col in SUMMED_COLUMNS]
+    for metric in METRICS:
+        expressions += [f"TOTAL(CASE WHEN {_valid(metric)} THEN {metric} END)",
+                        f"COUNT(CASE WHEN {_valid(metric)} THEN 1 END)"]
+    expressions.append(f"COUNT(CASE WHEN {all_valid} THEN 1 END)")
+    expressions += [f"TOTAL(CASE WHEN {all_valid} THEN {metric} END)" for metric in METRICS]
+    return (f"SELECT {', '.join(expressions)} FROM {ProductionRecordGRD.__tablename__} "
+            f"WHERE {where} GROUP BY {', '.join(keys)}")
+
+def _insert_columns() -> str:
+    columns = list(KpiDailyRollup.KEY) + ['row_count'] + [f"{col}_sum" for col in SUMMED_COLUMNS]
+    for metric in METRICS:
+        columns += [f"{metric}_sum", f"{metric}_count"]
+    columns.append('all_valid_count')
+    columns += [f"{metric}_all_valid_sum" for metric in METRICS]
+    return ', '.join(columns)
+
+def refresh_daily_rollup(conn, posting_dates) -> int:
+    """Recomputes the rollup rows of the given posting dates from production_records_grd.
+    Runs in the connection's open transaction. Returns the number of rollup rows written."""
+    dates = sorted({str(d) for d in posting_dates if d is not None})
+    table = KpiDailyRollup.__tablename__
+    written = 0
+    for start in range(0, len(dates), _DATES_PER_STATEMENT):
+        batch = dates[start:start + _DATES_PER_STATEMENT]
+        params = {f"d{i}": d for i, d in enumerate(batch)}
+        in_list = ', '.join(f":d{i}" for i in range(len(batch)))
+        conn.execute(text(f"DELETE FROM {table} WHERE posting_date IN ({in_list})"), params)
+        written += conn.execute(text(
+            f"INSERT INTO {table} ({_insert_columns()}) "
+            + _aggregate_select(f"posting_date IN ({in_list})")
+        ), params).rowcount
+    return written
+
+def rebuild_daily_rollup(conn) -> int:
+    """Rebuilds the whole rollup from production_records_grd. Returns the number of rollup rows."""
+    conn.execute(text(f"DELETE FROM {KpiDailyRollup.__tablename__}"))
+    written = conn.execute(text(
+        f"INSERT INTO {KpiDailyRollup.__tablename__} ({_insert_columns()}) " + _aggregate_select('posting_date IS NOT NULL')
+    )).rowcount
+    logger.info(f"Rebuilt {KpiDailyRollup.__tablename__}: {written} rows.")
+    return written
+
+
+# --- Filter Catalog ---
+# filter_catalog lists the distinct value ids of FilterCatalog.FIELDS per month, with the rollup's
+# validity counts. Like the rollup, every month touched by an ingestion is recomputed in the
+# same transaction, after the rollup: machines, shifts and operators are summed from the
+# month's kpi_daily_rollup rows, the other fields counted from production_records_grd.
+
+def _catalog_select(field: str) -> str:
+    """SELECT producing the filter_catalog rows of `field` for the :first..:last date range."""
+    column = f"{field}_id"
+    if column in KpiDailyRollup.KEY:
+        expressions = ['SUM(row_count)'] + [f"SUM({metric}_count)" for metric in METRICS] + ['SUM(all_valid_count)']
+        source = KpiDailyRollup.__tablename__
+    else:
+        all_valid = ' AND '.join(_valid(m) for m in METRICS)
+        expressions = ['COUNT(*)'] + [f"COUNT(CASE WHEN {_valid(metric)} THEN 1 END)" for metric in METRICS]
+        expressions.append(f"COUNT(CASE WHEN {all_valid} THEN 1 END)")
+        source = ProductionRecordGRD.__tablename__
+    return (f"SELECT '{field}', substr(posting_date, 1, 7), {column}, {', '.join(expressions)} FROM {source} "
+            f"WHERE posting_date BETWEEN :first AND :last GROUP BY 2, 3")
+
+def _catalog_columns() -> str:
+    return ', '.join(['field', 'month', 'value_id', 'row_count'] + [f"{metric}_count" for metric in METRICS] + ['all_valid_count'])
+
+def refresh_filter_catalog(conn, posting_dates) -> int:
+    """Recomputes the filter_catalog rows of the months of the given posting dates. Runs in the
+    connection's open transaction. Returns the number of catalog rows written."""
+    table = FilterCatalog.__tablename__
+    written = 0
+    for month in sorted({month_key(d) for d in posting_dates if d is not None}):
+        params = {'month': month, 'first': f"{month}-01", 'last': f"{month}-31"} # ISO text compares as dates
+        conn.execute(text(f"DELETE FROM {table} WHERE month = :month"), params)
+        for field in FilterCatalog.FIELDS:
+            written += conn.execute(text(f"INSERT INTO {table} ({_catalog_columns()}) " + _catalog_select(field)), params).rowcount
+    return written
+
+def rebuild_filter_catalog(conn) -> int:
+    """Rebuilds the whole catalog from production_records_grd. Returns the number of catalog rows."""
+    conn.execute(text(f"DELETE FROM {FilterCatalog.__tablename__}"))
+    months = conn.execute(text(
+        f"SELECT DISTINCT substr(posting_date, 1, 7) FROM {ProductionRecordGRD.__tablename__} WHERE posting_date IS NOT NULL"
+    )).scalars().all()
+    written = refresh_filter_catalog(conn, months)
+    logger.info(f"Rebuilt {FilterCatalog.__tablename__}: {written} rows for {len(months)} months.")
+    return written
@@ -0,0 +1,227 @@
+import logging
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+from backend.models import Base, Dimension, FilterCatalog, KpiDailyRollup, ProductionRecordGRD
+from backend.rollup import rebuild_daily_rollup, rebuild_filter_catalog
+from backend.versions import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+# --- Schema Migrations ---
+# create_all() only creates missing tables. Changes to existing tables (new indexes,
+# columns, data rewrites) are applied here in order. The last applied step is tracked in
+# SQLite's PRAGMA user_version, so each step runs once per database file.
+# Steps before 9 can meet production_records_grd as it was before dimension ids (its
+# machine_no, work_shift_code, ... text columns); they work on the table as it is.
+
+# Oldest SQLite the schema, migrations and ingestion need: RETURNING (3.35, bump_data_version),
+# UPDATE ... FROM (3.33), window functions (3.25) and upserts (3.24). init_db checks it.
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+def _columns(conn) -> set:
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({ProductionRecordGRD.__tablename__})")}
+
+def _encoded(conn) -> bool:
+    """Whether production_records_grd stores dimension ids (created or migrated since step 9)."""
+    return 'machine_no_id' in _columns(conn)
+
+def _natural_key(conn) -> tuple:
+    """ProductionRecordGRD.NATURAL_KEY as the table stores it: text columns before step 9,
+    no key_ordinal before it was added."""
+    columns, fields = _columns(conn), ProductionRecordGRD.DIMENSIONS
+    key = ProductionRecordGRD.NATURAL_KEY if _encoded(conn) else tuple(
+        col.removesuffix('_id') if col.removesuffix('_id') in fields else col for col in ProductionRecordGRD.NATURAL_KEY)
+    return tuple(col for col in key if col in columns)
+
+def _add_key_ordinal_column(conn):
+    if 'key_ordinal' not in _columns(conn):
+        conn.exec_driver_sql(f"ALTER TABLE {ProductionRecordGRD.__tablename__} ADD COLUMN key_ordinal INTEGER NOT NULL DEFAULT 0")
+
+def _number_key_ordinals(conn):
+    """Sets key_ordinal to 0, 1, ... (by id) across the rows that share the rest of the natural
+    key, the way ingestion numbers such lines of a file. Rows are kept, never merged: lines
+    that share those columns can still differ in times, quantities or remarks."""
+    table = ProductionRecordGRD.__tablename__
+    rest = ', '.join(col for col in _natural_key(conn) if col != 'key_ordinal')
+    conn.exec_driver_sql(
+        f"UPDATE {table} SET key_ordinal = r.ordinal FROM (SELECT id, key_ordinal, "
+        f"ROW_NUMBER() OVER (PARTITION BY {rest} ORDER BY id) - 1 AS ordinal FROM {table}) r "
+        f"WHERE r.id = {table}.id AND r.ordinal <> r.key_ordinal")
+
+def _create_natural_key_index(conn):
+    key = ', '.join(_natural_key(conn))
+    conn.exec_driver_sql(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_prodrecgrd_natural_key ON {ProductionRecordGRD.__tablename__} ({key})")
+
+def _add_natural_key(conn):
+    """Numbers the rows that share a natural key (key_ordinal) so the unique index can be built."""
+    _add_key_ordinal_column(conn)
+    _number_key_ordinals(conn)
+    _create_natural_key_index(conn)
+
+def _build_daily_rollup(conn):
+    """Fills the new kpi_daily_rollup table from the rows already loaded (once they have
+    dimension ids; until then step 9 builds it)."""
+    if _encoded(conn):
+        rebuild_daily_rollup(conn)
+
+def _iso_posting_dates(conn):
+    """Rewrites posting_date from the exports' 'dd-mm-YYYY' (some with ' HH:MM') to ISO
+    'YYYY-MM-DD', so it sorts and range-scans as a date; unparsable values become NULL.
+    Rows that now share a natural key are numbered apart (key_ordinal), then the rollup,
+    which holds the old format, is rebuilt."""
+    table = ProductionRecordGRD.__tablename__
+    iso = "substr(posting_date, 7, 4) || '-' || substr(posting_date, 4, 2) || '-' || substr(posting_date, 1, 2)"
+    converted = (f"CASE WHEN posting_date GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]*' "
+                 f"AND date({iso}) = {iso} THEN {iso} END") # date() normalises impossible days (31-02)
+    conn.exec_driver_sql("DROP INDEX IF EXISTS uq_prodrecgrd_natural_key")
+    conn.execute(text(f"UPDATE {table} SET posting_date = {converted}"))
+    _add_key_ordinal_column(conn)
+    _number_key_ordinals(conn)
+    _create_natural_key_index(conn)
+    _build_daily_rollup(conn)
+
+def _add_error_indexes(conn):
+    """Creates the partial indexes over rows with a metric above 100% (the error pages)."""
+    for index in ProductionRecordGRD.__table__.indexes:
+        if index.name.endswith('_over_100'):
+            index.create(conn, checkfirst=True)
+
+def _seed_data_versions(conn):
+    """Gives the months already loaded a first data version, so version-keyed caches see them."""
+    months = conn.execute(text(
+        f"SELECT DISTINCT substr(posting_date, 1, 7) FROM {ProductionRecordGRD.__tablename__} WHERE posting_date IS NOT NULL"
+    )).scalars().all()
+    if months:
+        bump_data_version(conn, months)
+
+def _add_rewritten_version(conn):
+    """Adds data_versions.rewritten_version to tables created before it existed."""
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(data_versions)")}
+    if 'rewritten_version' not in columns:
+        conn.exec_driver_sql("ALTER TABLE data_versions ADD COLUMN rewritten_version INTEGER NOT NULL DEFAULT 0")
+
+def _build_filter_catalog(conn):
+    """Fills the new filter_catalog table from the rows already loaded (once they have
+    dimension ids; until then step 9 builds it)."""
+    if _encoded(conn):
+        rebuild_filter_catalog(conn)
+
+def _add_ingest_batch_id(conn):
+    """Adds production_records_grd.ingest_batch_id and its index. Rows already loaded keep
+    NULL: the file each came from was not recorded."""
+    table = ProductionRecordGRD.__tablename__
+    columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+    if 'ingest_batch_id' not in columns:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN ingest_batch_id INTEGER")
+    for index in ProductionRecordGRD.__table__.indexes:
+        if index.name == 'ix_prodrecgrd_ingest_batch':
+            index.create(conn, checkfirst=True)
+
+def _encode_dimensions(conn):
+    """Moves the repeated text values of the rows already loaded (ProductionRecordGRD.DIMENSIONS)
+    into the dimensions table. production_records_grd is rebuilt with <field>_id columns in
+    place of the text, blank and NULL both becoming the value ''; rows that then share a
+    natural key are numbered apart (key_ordinal). kpi_daily_rollup and filter_catalog, keyed by
+    the ids now, are recreated and rebuilt. init_db vacuums the file afterwards."""
+    if _encoded(conn):
+        return # Created with the ids
+    model, dimensions = ProductionRecordGRD, Dimension.__tablename__
+    table = model.__tablename__
+    old = f"{table}_text"
+    conn.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {old}")
+    # Indexes keep their names when their table is renamed; the new table's use the same ones
+    indexes = conn.exec_driver_sql(f"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = '{old}' AND sql IS NOT NULL").scalars().all()
+    for index in indexes:
+        conn.exec_driver_sql(f'DROP INDEX "{index}"')
+    old_columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({old})")}
+
+    targets, values, joins = [], [], []
+    for column in model.__table__.columns:
+        field = column.name.removesuffix('_id')
+        if field in model.DIMENSIONS:
+            conn.exec_driver_sql(f"INSERT INTO {dimensions} (field, value) SELECT DISTINCT '{field}', IFNULL({field}, '') "
+                                 f"FROM {old} WHERE true ON CONFLICT DO NOTHING")
+            alias = f"d{len(joins)}"
+            # CROSS JOIN: SQLite keeps the join order as written, scanning the old rows once;
+            # with the window function below it would otherwise loop over dimensions first
+            joins.append(f"CROSS JOIN {dimensions} {alias} ON {alias}.field = '{field}' AND {alias}.value = IFNULL(o.{field}, '')")
+            values.append(f"{alias}.id")
+        elif column.name == 'key_ordinal':
+            values.append(None) # Numbered below, from the rest of the key
+        elif column.name in old_columns:
+            values.append(f"o.{column.name}")
+        else:
+            continue
+        targets.append(column.name)
+    selected = dict(zip(targets, values))
+    rest = ', '.join(selected[col] for col in model.NATURAL_KEY if col != 'key_ordinal')
+    values[targets.index('key_ordinal')] = f"ROW_NUMBER() OVER (PARTITION BY {rest} ORDER BY o.id) - 1"
+    # Only the natural key is indexed while copying; the other indexes are built once, afterwards
+    conn.execute(CreateTable(model.__table__))
+    natural_key = next(index for index in model.__table__.indexes if index.name == 'uq_prodrecgrd_natural_key')
+    natural_key.create(conn)
+    conn.exec_driver_sql(f"INSERT INTO {table} ({', '.join(targets)}) "
+                         f"SELECT {', '.join(values)} FROM {old} o {' '.join(joins)} ORDER BY o.id")
+    conn.exec_driver_sql(f"DROP TABLE {old}")
+    for index in model.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+    for derived in (KpiDailyRollup, FilterCatalog):
+        derived.__table__.drop(conn)
+        derived.__table__.create(conn)
+    rebuild_daily_rollup(conn)
+    rebuild_filter_catalog(conn)
+
+def _add_key_ordinal(conn):
+    """Adds key_ordinal to the natural key of tables created without it. Their rows were
+    unique on the rest of the key, so all of them keep 0."""
+    _add_key_ordinal_column(conn)
+    indexed = {row[2] for row in conn.exec_driver_sql("PRAGMA index_info(uq_prodrecgrd_natural_key)")}
+    if 'key_ordinal' not in indexed:
+        conn.exec_driver_sql("DROP INDEX IF EXISTS uq_prodrecgrd_natural_key")
+        _create_natural_key_index(conn)
+
+# (user_version after the step, step)
+MIGRATIONS = [
+    (1, _add_natural_key),
+    (2, _build_daily_rollup),
+    (3, _iso_posting_dates),
+    (4, _add_error_indexes),
+    (5, _seed_data_versions),
+    (6, _add_rewritten_version),
+    (7, _build_filter_catalog),
+    (8, _add_ingest_batch_id),
+    (9, _encode_dimensions),
+    (10, _add_key_ordinal),
+]
+
+
+def init_db(engine):
+    """Creates missing tables and applies pending migrations. Safe to call on every startup.
+    Raises RuntimeError if the SQLite library is older than MIN_SQLITE_VERSION."""
+    with engine.connect() as conn:
+        sqlite_version = conn.exec_driver_sql("SELECT sqlite_version()").scalar()
+    if tuple(int(part) for part in sqlite_version.split('.')[:3]) < MIN_SQLITE_VERSION:
+        raise RuntimeError(f"SQLite {sqlite_version} is too old: this app needs "
+                           f"{'.'.join(map(str, MIN_SQLITE_VERSION))} or later (Python's sqlite3 module links it).")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        version = initial_version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for target_version, migrate in MIGRATIONS:
+            if version < target_version:
+                logger.info(f"Applying schema migration {target_version}: {migrate.__name__}")
+                migrate(conn)
+                conn.exec_driver_sql(f"PRAGMA user_version = {target_version}")
+                version = target_version
+    if initial_version < 9: # Step 9 leaves the pages of the text-valued table free
+        _vacuum(engine)
+
+def _vacuum(engine):
+    """Rewrites the database file without its free pages, e.g. those of a table a migration
+    rebuilt (SQLite keeps freed pages in the file for reuse). Cannot run in a transaction."""
+    with engine.connect() as conn:
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    if free_pages:
+        logger.info(f"Vacuuming the database ({free_pages} free pages).")
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql("VACUUM")
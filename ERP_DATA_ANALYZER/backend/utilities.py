@@ -1,9 +1,20 @@
 import pandas as pd
+import numpy as np
 import os
 import logging
+import json
+import hashlib
+import itertools
+from datetime import datetime
+import time
 from pathlib import Path
-from backend.models import ProductionRecordGRD
+from backend.models import Dimension, ProductionRecordGRD, IngestedFile
 from backend.config import Config
+from backend.kpi import as_float_array, compute_kpis
+from backend.ingest_stats import timed_stage, record_run
+from backend.rollup import refresh_daily_rollup, refresh_filter_catalog
+from backend.versions import bump_data_version
+from sqlalchemy import delete, func, select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 import math # For isnan check and floor
@@ -86,8 +97,72 @@ def time_to_seconds(time_value):
         except (ValueError, IndexError, TypeError): return 0
     return 0
 
+# Whole-column equivalent of time_to_seconds. Parts may carry a sign and surrounding
+# whitespace (int() accepts both); range checks below reject anything outside 0-23/0-59.
+_DURATION_PATTERN = r'^([+-]?\d+)\s*:\s*([+-]?\d+)(?:\s*:\s*([+-]?\d+))?$'
+
+def _clock_parts_to_seconds(h, m, s, has_seconds):
+    """Applies time_to_seconds' range checks to parsed clock parts (float arrays, NaN = unparsable)."""
+    valid = (h >= 0) & (h <= 23) & (m >= 0) & (m <= 59)  # NaN compares False -> invalid
+    valid &= ~has_seconds | ((s >= 0) & (s <= 59))
+    clock = h * 3600 + m * 60 + np.where(has_seconds, s, 0)
+    return np.where(valid, clock, 0).astype('int64')
+
+def _fixed_width_clock(text: pd.Series, lengths: np.ndarray):
+    """Fast path for zero-padded 'HH:MM:SS' / 'HH:MM' strings (the export's normal form).
+    Works on the UTF-32 code points of a fixed-width array. Returns (matched mask, seconds)."""
+    matched = np.zeros(len(text), dtype=bool)
+    seconds = np.zeros(len(text), dtype='int64')
+    candidates = (lengths == 8) | (lengths == 5)
+    if not candidates.any():
+        return matched, seconds
+    codes = text[candidates].to_numpy(dtype='U8').view(np.uint32).reshape(-1, 8)
+    is_digit = (codes >= 48) & (codes <= 57)
+    is_colon = codes == 58
+    hms = (lengths[candidates] == 8) & is_colon[:, 2] & is_colon[:, 5] & is_digit[:, [0, 1, 3, 4, 6, 7]].all(axis=1)
+    hm = (lengths[candidates] == 5) & is_colon[:, 2] & is_digit[:, [0, 1, 3, 4]].all(axis=1)
+    d = codes.astype('float64') - 48
+    clock = _clock_parts_to_seconds(d[:, 0] * 10 + d[:, 1], d[:, 3] * 10 + d[:, 4], d[:, 6] * 10 + d[:, 7], hms)
+    matched[candidates] = hms | hm
+    seconds[candidates] = np.where(hms | hm, clock, 0)
+    return matched, seconds
+
+def durations_to_seconds(series: pd.Series) -> pd.Series:
+    """Vectorized time_to_seconds: converts a column of HH:MM:SS, HH:MM or bare-number values
+    to integer seconds. Missing, malformed or out-of-range values become 0."""
+    if pd.api.types.is_numeric_dtype(series):
+        numeric = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        return pd.Series(np.where(np.isfinite(numeric), np.rint(numeric), 0).astype('int64'), index=series.index)
+
+    if series.dtype == object:
+        series = series.astype('string')
+    text = series.str.strip()
+    lengths = text.str.len().fillna(0).to_numpy(dtype='int64')
+    matched, seconds = _fixed_width_clock(text, lengths)
+    rest = ~matched & (lengths > 0)
+    if rest.any():
+        rest_text = text[rest]
+        has_colon = rest_text.str.contains(':', regex=False).to_numpy(dtype=bool)
+        rest_seconds = np.zeros(len(rest_text), dtype='int64')
+
+        # Other clock forms: unpadded, signed or spaced parts, or malformed
+        if has_colon.any():
+            parts = rest_text[has_colon].str.extract(_DURATION_PATTERN)
+            h, m, s = (pd.to_numeric(parts[i], errors='coerce').to_numpy(dtype='float64', na_value=np.nan) for i in range(3))
+            rest_seconds[has_colon] = _clock_parts_to_seconds(h, m, s, parts[2].notna().to_numpy())
+
+        # Bare numbers: seconds as int/float, rounded half-to-even like round()
+        if (~has_colon).any():
+            numeric = pd.to_numeric(rest_text[~has_colon], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            rest_seconds[~has_colon] = np.where(np.isfinite(numeric), np.rint(numeric), 0).astype('int64')
+
+        seconds[rest] = rest_seconds
+
+    return pd.Series(seconds, index=series.index)
+
 # --- Calculation Functions ---
-# (Keep calc functions as they were, they rely on correct input)
+# Scalar reference implementations. Ingestion uses the columnar versions in
+# backend/kpi.py, which must produce identical results.
 def calc_availability(plan_time_s, loss_time_s):
     plan_time = safe_float_conversion(plan_time_s, 0.0)
     loss_time = safe_float_conversion(loss_time_s, 0.0)
@@ -129,9 +204,639 @@ def calc_oee_new(availability, performance, quality_rate):
     return max(0.0, oee_ratio * 100)
 
 
-def process_csv_file(file_path: str, db_session: Session):
+# --- Type Alignment ---
+CALCULATED_COLUMNS = ['availability', 'performance', 'quality_rate', 'oee_new', 'shift_type', 'key_ordinal']
+# Filled by the database or at publish (ingest_batch_id), never from the CSV
+INGEST_COLUMNS = ['id', 'ingest_batch_id']
+TIME_COLUMNS = ['plan_time', 'actual_run_time', 'loss_time', 'loss_time_should_be', 'reason_time_hm']
+
+def source_columns(model) -> dict:
+    """{name: Column} of what ingestion takes from the CSV, in table order. A dimension key
+    (<field>_id, see model.DIMENSIONS) is taken as its text value, named <field>, and only
+    encoded when the rows are published (publish_staged)."""
+    keys = {f"{field}_id": field for field in getattr(model, 'DIMENSIONS', ())}
+    return {keys.get(c.name, c.name): Dimension.__table__.c.value if c.name in keys else c
+            for c in model.__table__.columns if c.name not in INGEST_COLUMNS}
+
+def _int_column(series: pd.Series, col_name: str) -> pd.Series:
+    """Whole-column int alignment: coerces to numbers, maps NaN/inf to NA and truncates fractions."""
+    numeric = pd.to_numeric(series, errors='coerce')
+    if pd.api.types.is_integer_dtype(numeric):
+        return numeric.astype('Int64')
+    values = numeric.to_numpy(dtype='float64', na_value=np.nan)
+    finite = np.isfinite(values)
+    if (~finite & ~np.isnan(values)).any():
+        logger.warning(f"Column '{col_name}' contains infinite values. Setting them to NA.")
+    floored = np.floor(np.where(finite, values, 0.0))
+    fractional = finite & ~np.isclose(values, floored, rtol=1e-9, atol=1e-9)
+    if fractional.any():
+        examples = pd.unique(values[fractional])[:5]
+        logger.warning(f"Column '{col_name}' contains fractional values. Truncating. Examples: {examples}")
+    try:
+        return pd.Series(np.where(finite, floored, np.nan), index=series.index).astype('Int64')
+    except TypeError as e: raise TypeError(f"Cannot cast column '{col_name}' to Int64: {e}") from e
+
+def _float_column(series: pd.Series) -> pd.Series:
+    """Whole-column safe_float_conversion: unparsable, NaN and inf values become 0.0."""
+    return pd.Series(as_float_array(series), index=series.index).astype('Float64')
+
+def _date_column(series: pd.Series) -> pd.Series:
+    """'dd-mm-YYYY' export dates (some exports append ' HH:MM') -> ISO 'YYYY-MM-DD' strings,
+    None where unparsable. Each distinct value is parsed once (a file has a few dozen dates)."""
+    codes, uniques = pd.factorize(series) # NA -> code -1
+    day_parts = [str(value).strip().split(' ', 1)[0] for value in uniques]
+    parsed = pd.to_datetime(pd.Series(day_parts, dtype=object), format='%d-%m-%Y', errors='coerce')
+    iso = np.append(parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None).to_numpy(), None)
+    return pd.Series(iso[codes], index=series.index, dtype=object) # iso[-1] is the trailing None
+
+def align_column_types(df: pd.DataFrame, model_columns_dict: dict, file_name: str = '') -> pd.DataFrame:
+    """Casts the mapped CSV columns (read as strings) to the model's column types, in place.
+    Every conversion is a whole-column operation; per-column timings are logged."""
+    timings = {}
+    for col_name, col_def in model_columns_dict.items():
+        if col_name not in df.columns: continue # Skip if column still missing (shouldn't happen now)
+        if col_name in CALCULATED_COLUMNS: continue # Calculated after alignment
+        started = time.perf_counter()
+
+        target_type = col_def.type.python_type
+        logger.debug(f"Aligning column: '{col_name}' to target type: {target_type}")
+
+        if col_name in TIME_COLUMNS:
+            df[col_name] = durations_to_seconds(df[col_name]).astype('Int64') # Integer seconds
+
+        elif target_type == int:
+            df[col_name] = _int_column(df[col_name], col_name)
+
+        elif target_type == float:
+            df[col_name] = _float_column(df[col_name])
+
+        elif col_name == 'posting_date':
+            df[col_name] = _date_column(df[col_name])
+
+        elif target_type == str:
+            df[col_name] = df[col_name].fillna('').astype(str).replace({'nan': '', 'None': '', '<NA>': ''}, regex=False)
+
+        elif col_name in ['start_time', 'end_time']:
+            df[col_name] = df[col_name].fillna('').astype(str).str.replace(r'\.0$', '', regex=True).fillna("00:00:00")
+
+        timings[col_name] = time.perf_counter() - started
+
+    total = sum(timings.values())
+    breakdown = ', '.join(f"{col} {secs:.3f}s" for col, secs in sorted(timings.items(), key=lambda kv: kv[1], reverse=True))
+    logger.info(f"Aligned {len(timings)} columns for {file_name} in {total:.3f}s ({breakdown})")
+    return df
+
+
+# --- Column Mapping ---
+# Cleaned CSV header -> model column name
+COLUMN_MAP = {
+    # Exact matches from image (after cleaning) mapped to model names
+    'posting_date': 'posting_date',
+    'document_no': 'document_no',
+    'order_no': 'order_no',
+    'item_no': 'item_no',
+    'operation_no': 'operation_no',
+    'operation_description': 'operation_description',
+    'order_line_no': 'order_line_no',
+    'type': 'type',
+    'machine_no': 'machine_no',
+    'current_c_t': 'current_c_t', # Cleaned from 'Current C/T'
+    'output_quantity': 'output_quantity',
+    'rejection_qty': 'rejection_qty',
+    'rejection_reson': 'rejection_reason', # *** Fix mapping ***
+    're_work_qty': 'rework_qty',          # *** Fix mapping ***
+    're_work_reason': 'rework_reason',     # *** Fix mapping ***
+    'work_shift_code': 'work_shift_code',
+    'start_time': 'start_time',
+    'end_time': 'end_time',
+    'plan_time': 'plan_time',             # Cleaned from 'Plan time'
+    'actual_run_time': 'actual_run_time',
+    'loss_time': 'loss_time',
+    'remarks': 'remarks',
+    'operator_name': 'operator_name',
+    'loss_time_should_be': 'loss_time_should_be',
+    'oee': 'oee',                         # Original OEE column from CSV
+    'reason_code': 'reason_code',
+    'reason_time_hm': 'reason_time_hm',
+    'loss_time_remark': 'loss_time_remark',
+
+    # Add other potential variations if observed elsewhere
+    'currentct': 'current_c_t',
+    'rejectionreason': 'rejection_reason',
+    'reworkqty': 'rework_qty',
+    'reworkreason': 'rework_reason',
+    'actualruntime': 'actual_run_time',
+    'losstime_shouldbe': 'loss_time_should_be',
+    'reasontimehm': 'reason_time_hm',
+    'losstimeremark': 'loss_time_remark',
+    'operatorname': 'operator_name'
+}
+
+def clean_column_name(col):
+    """Normalizes a raw CSV header ('Current C/T', 'Re Work Qty ') to snake_case ('current_c_t', 're_work_qty')."""
+    return str(col).lower().strip().replace(' ', '_').replace('/', '_').replace('.', '').replace('(','').replace(')','').replace('-','_')
+
+class KeyOrdinals:
+    """Numbers the lines of one file that share the rest of the model's natural key: 0 for the
+    first such line, 1 for the next, ... in file order (the key_ordinal column). Call it on the
+    file's frames in order. It keeps a 64-bit hash and a count per distinct key (16 bytes),
+    not the key values."""
+
+    def __init__(self, model):
+        fields = getattr(model, 'DIMENSIONS', ())
+        self.columns = [col.removesuffix('_id') if col.removesuffix('_id') in fields else col
+                        for col in model.NATURAL_KEY if col != 'key_ordinal']
+        self._hashes = np.empty(0, dtype='uint64') # Sorted
+        self._counts = np.empty(0, dtype='int64')
+
+    def __call__(self, df: pd.DataFrame) -> np.ndarray:
+        """key_ordinal of each row of df (aligned key columns), counting the frames seen before."""
+        hashes = pd.util.hash_pandas_object(df[self.columns], index=False).to_numpy()
+        within = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+        seen = np.zeros(len(hashes), dtype='int64')
+        if len(self._hashes):
+            found = np.searchsorted(self._hashes, hashes).clip(max=len(self._hashes) - 1)
+            seen = np.where(self._hashes[found] == hashes, self._counts[found], 0)
+        keys, counts = np.unique(hashes, return_counts=True)
+        self._hashes, merged = np.unique(np.concatenate([self._hashes, keys]), return_inverse=True)
+        self._counts = np.bincount(merged, weights=np.concatenate([self._counts, counts])).astype('int64')
+        return seen + within
+
+    def skip(self, df: pd.DataFrame, model, file_name: str = ''):
+        """Counts the lines of a raw CSV frame that are not prepared again (already committed,
+        see prepared_chunks), aligning only the key columns."""
+        keys = _map_columns(df, model)[self.columns].copy()
+        columns = source_columns(model)
+        align_column_types(keys, {col: columns[col] for col in self.columns}, file_name)
+        self(keys)
+
+def prepare_frame(df: pd.DataFrame, model, file_name: str = '', stage_stats: dict = None, key_ordinals: KeyOrdinals = None) -> pd.DataFrame:
+    """Turns a raw CSV frame (all columns str) into insert-ready rows for `model`:
+    maps columns, aligns types and calculates KPIs. Returns only the source_columns() of the model
+    (dimension values as text). key_ordinals: the file's KeyOrdinals, when df is one of several
+    chunks of a file; by default the lines are numbered within df."""
+    with timed_stage(stage_stats, 'clean', len(df)):
+        df = _map_columns(df, model)
+    model_columns_dict = source_columns(model)
+
+    # 7. Data Type Conversion and Cleaning
+    logger.debug(f"Aligning data types for {file_name}...")
+    with timed_stage(stage_stats, 'align', len(df)):
+        align_column_types(df, model_columns_dict, file_name)
+
+    # 8. Perform Calculations
+    logger.debug(f"Calculating metrics for {file_name}...")
+    with timed_stage(stage_stats, 'kpi', len(df)):
+        try:
+            # Columnar equivalent of the calc_* functions above: one NumPy pass computes
+            # availability, quality_rate, performance, oee_new and shift_type for all rows.
+            # NA inputs are treated as 0, exactly like safe_float_conversion.
+            compute_kpis(df)
+            logger.debug(f"Finished calculating metrics for {file_name}.")
+        except Exception as calc_error:
+             logger.error(f"Error during metric calculation for {file_name}: {calc_error}", exc_info=True)
+             raise RuntimeError(f"Metric calculation failed for {file_name}") from calc_error
+    df['key_ordinal'] = (key_ordinals or KeyOrdinals(model))(df)
+
+    # 9. Prepare for Bulk Insert
+    # Now select *all* columns defined in the model
+    columns_to_insert = list(model_columns_dict.keys())
+
+    # Final check that all model columns are present in df
+    missing_final_check = set(columns_to_insert) - set(df.columns)
+    if missing_final_check:
+         logger.error(f"Columns missing just before creating df_final: {missing_final_check}")
+         # Add them back if missing - this indicates a logic error above
+         for col in missing_final_check: df[col] = None
+
+    # Missing values stay as pandas NA/NaN; load_frame binds them as NULL
+    return df[columns_to_insert]
+
+def _map_columns(df: pd.DataFrame, model) -> pd.DataFrame:
+    """Cleans and maps the CSV headers to model columns, adding missing and dropping extra ones."""
+    # 5. Clean Column Names
+    original_columns = df.columns.tolist()
+    df.columns = [clean_column_name(col) for col in df.columns]
+    logger.debug(f"Cleaned original columns: {original_columns}")
+    logger.debug(f"Cleaned columns result: {df.columns.tolist()}")
+    df = df.rename(columns=lambda c: COLUMN_MAP.get(c, c)) # Apply mapping
+    logger.debug(f"Columns after mapping: {df.columns.tolist()}")
+
+    # 6. Define Model Columns & Check for Missing/Extra relative to *Mapped* DF
+    # Include calculated columns here if they are part of the model
+    model_columns_dict = source_columns(model)
+    # Columns expected *from the CSV* based on the model (excluding calculated ones for now)
+    expected_csv_cols = {k for k, v in model_columns_dict.items() if k not in CALCULATED_COLUMNS}
+
+    # What columns does the *mapped* dataframe actually have?
+    actual_mapped_cols = set(df.columns)
+
+    missing_from_csv = expected_csv_cols - actual_mapped_cols
+    extra_in_csv = actual_mapped_cols - expected_csv_cols
+
+    # Add missing expected CSV columns and fill with None
+    if missing_from_csv:
+        logger.warning(f"Columns expected from CSV mapping not found: {missing_from_csv}. Filling with None.")
+        for col in missing_from_csv:
+            df[col] = None # Add missing columns with None value
+
+    # Drop extra columns found in CSV that don't map to model expectations
+    if extra_in_csv:
+         logger.warning(f"Extra columns after mapping ignored: {extra_in_csv}.")
+         df = df.drop(columns=list(extra_in_csv))
+
+    return df
+
+def _conflict_sql(model, columns, mode: str) -> str:
+    """' ON CONFLICT(natural key) DO UPDATE ...' for 'upsert', '' for 'append'."""
+    if mode != 'upsert':
+        return ''
+    key = ', '.join(f'"{col}"' for col in model.NATURAL_KEY)
+    updates = ', '.join(f'"{col}" = excluded."{col}"' for col in columns if col not in model.NATURAL_KEY)
+    return f' ON CONFLICT ({key}) DO UPDATE SET {updates}'
+
+def _write_sql(model, columns, mode: str, table: str = None) -> str:
+    """INSERT statement for `columns` (qmark params); 'upsert' adds ON CONFLICT(natural key) DO UPDATE.
+    table: write to this table (same columns) instead of the model's."""
+    quoted = [f'"{col}"' for col in columns]
+    sql = f'INSERT INTO "{table or model.__tablename__}" ({", ".join(quoted)}) VALUES ({", ".join("?" * len(columns))})'
+    return sql + _conflict_sql(model, columns, mode)
+
+def _python_values(series: pd.Series) -> list:
+    """Column values as plain Python objects (what sqlite3 binds), with NA/NaN as None."""
+    if not series.hasnans:
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+def load_frame(df_final: pd.DataFrame, model, db_session: Session, mode: str = 'upsert', batch_size: int = None, table: str = None) -> int:
+    """Bulk loads a prepared frame with DBAPI executemany, `batch_size` rows at a time.
+
+    Rows are built as plain tuples straight from the column arrays, one batch at a time, instead
+    of one dict per row routed through the ORM. mode 'upsert' updates rows whose natural key
+    already exists (INSERT ... ON CONFLICT DO UPDATE), so overlapping exports never duplicate
+    records; 'append' inserts blindly. table: load into this table (e.g. a staging table, see
+    create_staging_table) instead of the model's. Frames for a model with dimension values
+    (model.DIMENSIONS) reach its table through a staging table, as publish_staged encodes them.
+    Runs in the session's open transaction (no commit). Returns the number of rows inserted or
+    updated.
+    """
+    batch_size = batch_size or Config.INGEST_BATCH_SIZE
+    conn = db_session.connection(bind_arguments={'mapper': model})
+    if table is None and getattr(model, 'DIMENSIONS', ()):
+        staging = create_staging_table(conn, model)
+        try:
+            load_frame(df_final, model, db_session, mode='append', batch_size=batch_size, table=staging)
+            return publish_staged(conn, model, list(df_final.columns), mode)
+        finally:
+            drop_staging_table(conn, model)
+    sql = _write_sql(model, list(df_final.columns), mode, table)
+    for start in range(0, len(df_final), batch_size):
+        batch = df_final.iloc[start:start + batch_size]
+        rows = list(zip(*(_python_values(batch[col]) for col in batch.columns)))
+        conn.exec_driver_sql(sql, rows)
+    return len(df_final)
+
+def _max_id(conn, model) -> int:
+    return conn.execute(select(func.max(model.id))).scalar() or 0
+
+def _count_ids_above(conn, model, high_water: int) -> int:
+    """Rows with an id above `high_water`: the rows inserted since it was read (a rowid range scan)."""
+    return conn.execute(select(func.count()).select_from(model).where(model.id > high_water)).scalar()
+
+def _count_batch_rows(conn, model, batch_id: int, high_water: int) -> int:
+    """Rows of ingest batch `batch_id` with an id up to `high_water` (an ix_prodrecgrd_ingest_batch range scan)."""
+    return conn.execute(select(func.count()).select_from(model)
+                        .where(model.ingest_batch_id == batch_id, model.id <= high_water)).scalar()
+
+# --- Staging ---
+# process_csv_file bulk loads chunks into a TEMP table of its connection and only then publishes
+# them to the model's table with one INSERT ... SELECT, in a short transaction with the rollup
+# refresh and the ledger row. Temp tables belong to the connection and live outside the
+# database file, so staging takes no lock on it: the write lock is only held while publishing,
+# and readers see whole files (or whole chunks with commit_per_chunk) or nothing.
+# Publishing is also where dimension values (machines, shifts, operators, ...) become ids: the
+# few distinct values of the staged rows are added to the dimensions table, and the rows join
+# to it on (field, value) to pick up their ids.
+
+def _staging_table(model) -> str:
+    return f"staging_{model.__tablename__}"
+
+def create_staging_table(conn, model) -> str:
+    """Creates an empty TEMP table with the source_columns() of the model (no indexes or
+    constraints) and returns its name. An existing one, e.g. left behind by a failed run, is
+    replaced."""
+    table = _staging_table(model)
+    columns = ', '.join(f'"{name}" {column.type.compile(dialect=conn.dialect)}' for name, column in source_columns(model).items())
+    conn.exec_driver_sql(f'DROP TABLE IF EXISTS temp."{table}"')
+    conn.exec_driver_sql(f'CREATE TEMP TABLE "{table}" ({columns})')
+    return table
+
+def drop_staging_table(conn, model):
+    conn.exec_driver_sql(f'DROP TABLE IF EXISTS temp."{_staging_table(model)}"')
+
+def publish_staged(conn, model, columns, mode: str = 'upsert', batch_id: int = None) -> int:
+    """Moves the staged rows into the model's table in staging order (with 'upsert', a later
+    row with the same natural key wins, as with load_frame) and empties the staging table.
+    Dimension values among `columns` are added to the dimensions table if new and stored as
+    their ids. batch_id: stored as the rows' ingest_batch_id. Runs in the connection's open
+    transaction. Returns the number of rows published."""
+    table = _staging_table(model)
+    dimensions = Dimension.__tablename__
+    targets, values, joins = [], [], []
+    for col in columns:
+        if col in getattr(model, 'DIMENSIONS', ()):
+            # WHERE true: lets the parser tell the upsert clause from a join constraint
+            conn.exec_driver_sql(
+                f'INSERT INTO main."{dimensions}" (field, value) SELECT DISTINCT \'{col}\', IFNULL("{col}", \'\') '
+                f'FROM temp."{table}" WHERE true ON CONFLICT DO NOTHING')
+            alias = f"d{len(joins)}"
+            joins.append(f'JOIN main."{dimensions}" {alias} ON {alias}.field = \'{col}\' AND {alias}.value = IFNULL(s."{col}", \'\')')
+            targets.append(f"{col}_id")
+            values.append(f"{alias}.id")
+        else:
+            targets.append(col)
+            values.append(f's."{col}"')
+    if batch_id is not None:
+        targets.append('ingest_batch_id')
+        values.append(str(int(batch_id)))
+    quoted = ', '.join(f'"{col}"' for col in targets)
+    result = conn.exec_driver_sql(
+        f'INSERT INTO main."{model.__tablename__}" ({quoted}) SELECT {", ".join(values)} FROM temp."{table}" s '
+        f'{" ".join(joins)} WHERE true ORDER BY s.rowid' + _conflict_sql(model, targets, mode))
+    published = result.rowcount
+    conn.exec_driver_sql(f'DELETE FROM temp."{table}"')
+    return published
+
+def iter_csv_chunks(file_path: str, chunksize: int):
+    """Reads a CSV in chunks of at most `chunksize` rows, all columns as str.
+    Read/parse failures are raised as IOError."""
+    file_name = os.path.basename(file_path)
+    try:
+        # Read all as string initially to handle variations, then convert
+        yield from pd.read_csv(file_path, encoding='utf-8', low_memory=False, dtype=str, on_bad_lines='warn', chunksize=chunksize)
+    except Exception as e:
+         logger.error(f"Error reading CSV {file_name}: {e}", exc_info=True)
+         raise IOError(f"Could not read CSV: {file_name}") from e
+
+def prepared_chunks(file_path: str, model, chunksize: int, rows_to_skip: int = 0, stage_stats: dict = None):
+    """Yields (CSV rows read so far, prepared frame) for each chunk of the file.
+    Chunks wholly within the first `rows_to_skip` rows yield None instead of a frame; their
+    lines still count towards the key_ordinal of the lines after them."""
     file_name = os.path.basename(file_path)
+    total_rows = 0
+    key_ordinals = KeyOrdinals(model)
+    chunks = iter_csv_chunks(file_path, chunksize)
+    for chunk_no in itertools.count(1):
+        with timed_stage(stage_stats, 'read') as stage:
+            chunk = next(chunks, None)
+            stage['rows'] = len(chunk) if chunk is not None else 0
+        if chunk is None:
+            break
+        chunk_start = total_rows
+        total_rows += len(chunk)
+        if total_rows <= rows_to_skip:
+            key_ordinals.skip(chunk, model, file_name)
+            yield total_rows, None # Committed by a previous run
+            continue
+        if chunk_start < rows_to_skip:
+            key_ordinals.skip(chunk.iloc[:rows_to_skip - chunk_start].copy(), model, file_name)
+            chunk = chunk.iloc[rows_to_skip - chunk_start:]
+        logger.info(f"Read {len(chunk)} rows from {file_name} (chunk {chunk_no})")
+        yield total_rows, prepare_frame(chunk, model, file_name, stage_stats, key_ordinals)
+
+def prepare_csv_file(file_path: str, out, stop=None, chunksize: int = None, rows_to_skip: int = 0) -> dict:
+    """Reads and prepares a file without touching the database, putting the prepared_chunks()
+    items on the queue `out` one at a time and then None. Used as the worker task for parallel
+    ingestion (backend/batch.py), which passes the chunks to process_csv_file(prepared=...).
+    With a bounded queue the worker waits while the writer is behind, so it holds one chunk
+    at a time rather than the file. Stops early once the event `stop` is set. Returns the
+    stage stats of the work."""
+    model, _ = determine_db_type(os.path.basename(file_path))
+    stage_stats = {}
+    try:
+        for item in prepared_chunks(file_path, model, chunksize or Config.INGEST_CHUNK_SIZE, rows_to_skip, stage_stats):
+            if stop is not None and stop.is_set():
+                break
+            out.put(item)
+    finally:
+        out.put(None)
+    return stage_stats
+
+# --- Resume Checkpoints ---
+# With commit_per_chunk, each committed chunk records how many CSV rows are safely in the
+# database. A failed run can then be resumed without re-inserting those rows. The checkpoint is
+# tied to the file's size and mtime, so a changed file starts from the top again.
+def _checkpoint_path(file_path: str) -> Path:
+    return Path(Config.CHECKPOINT_FOLDER) / f"{os.path.basename(file_path)}.checkpoint.json"
+
+def _file_signature(file_path: str) -> dict:
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def load_checkpoint(file_path: str) -> int:
+    """Returns the number of CSV rows already committed for this exact file version (0 if none)."""
+    path = _checkpoint_path(file_path)
+    if not path.exists():
+        return 0
+    try:
+        checkpoint = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return 0
+    if {k: checkpoint.get(k) for k in ('size', 'mtime')} != _file_signature(file_path):
+        logger.warning(f"Checkpoint for {os.path.basename(file_path)} is for a different file version. Ignoring it.")
+        return 0
+    return int(checkpoint.get('rows_committed', 0))
+
+def save_checkpoint(file_path: str, rows_committed: int):
+    path = _checkpoint_path(file_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({'file': str(file_path), 'rows_committed': rows_committed, **_file_signature(file_path)}), encoding='utf-8')
+
+def clear_checkpoint(file_path: str):
+    _checkpoint_path(file_path).unlink(missing_ok=True)
+
+
+# --- Ingestion Ledger ---
+class AlreadyIngestedError(Exception):
+    """Raised by process_csv_file when identical file content was already ingested successfully."""
+
+def file_content_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of the file's bytes, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _ledger_entry(db_session: Session, content_hash: str, file_name: str) -> IngestedFile:
+    """Returns the ledger row for this content, adding a new one to the session if needed."""
+    entry = db_session.query(IngestedFile).filter_by(content_hash=content_hash).one_or_none()
+    if entry is None:
+        entry = IngestedFile(content_hash=content_hash, file_name=file_name, status='failed')
+        db_session.add(entry)
+    return entry
+
+def _record_failure(db_session: Session, content_hash: str, file_name: str, file_size: int, started_at: datetime, error: Exception):
+    """Best-effort ledger update after a failed (and rolled back) ingestion."""
+    try:
+        entry = _ledger_entry(db_session, content_hash, file_name)
+        if entry.status == 'success':
+            return # A forced re-run failed; the earlier successful load is still in place
+        entry.file_name, entry.file_size, entry.status = file_name, file_size, 'failed'
+        entry.error = str(error)[:500]
+        entry.started_at, entry.finished_at = started_at, datetime.now()
+        entry.duration_seconds = (entry.finished_at - started_at).total_seconds()
+        db_session.commit()
+    except SQLAlchemyError as e:
+        db_session.rollback()
+        logger.warning(f"Could not record failed ingestion of {file_name} in the ledger: {e}")
+
+
+# --- Batch Rollback ---
+# Every ingested file is a batch: its ledger id is the ingest_batch_id of the rows it wrote
+# (later files that upsert the same natural keys take those rows over). A bad upload can be
+# removed, or swapped for a corrected export (process_csv_file(replace_batch=...)), with one
+# DELETE on the batch index and a refresh of the dates it covered, instead of a full reload.
+
+def _delete_batch_rows(conn, model, batch_id: int) -> tuple:
+    """Deletes a batch's rows. Returns (rows deleted, their distinct posting_dates)."""
+    dates = conn.execute(select(model.posting_date).where(model.ingest_batch_id == batch_id).distinct()).scalars().all()
+    deleted = conn.execute(delete(model).where(model.ingest_batch_id == batch_id)).rowcount
+    return deleted, dates
+
+def delete_ingest_batch(db_session: Session, batch_id: int) -> int:
+    """Deletes the rows of an ingested file (its ingested_files id) and, in the same transaction,
+    recomputes the rollup and filter catalog of their dates and bumps those months' data
+    versions as rewritten. The ledger entry is marked 'deleted', so the file can be ingested
+    again. Returns the number of rows deleted."""
+    model = ProductionRecordGRD
+    entry = db_session.get(IngestedFile, batch_id)
+    if entry is None:
+        raise ValueError(f"Unknown ingestion batch {batch_id}.")
+    try:
+        conn = db_session.connection(bind_arguments={'mapper': model})
+        deleted, dates = _delete_batch_rows(conn, model, batch_id)
+        if dates:
+            refresh_daily_rollup(conn, dates)
+            refresh_filter_catalog(conn, dates)
+            bump_data_version(conn, dates, rewritten=True)
+        entry.status = 'deleted'
+        db_session.commit()
+    except SQLAlchemyError as e:
+        db_session.rollback()
+        logger.error(f"Database error deleting batch {batch_id} ({entry.file_name}). Rolled back. Error: {e}", exc_info=True)
+        raise IOError(f"Could not delete the records of {entry.file_name}. Check logs.") from e
+    logger.info(f"Deleted batch {batch_id} ({entry.file_name}): {deleted} records over {len(dates)} dates.")
+    return deleted
+
+def batch_row_counts(db_session: Session) -> dict:
+    """{ingest_batch_id: rows currently held} (an index-only scan). Rows loaded before batches
+    were recorded are counted under None."""
+    model = ProductionRecordGRD
+    return dict(db_session.query(model.ingest_batch_id, func.count()).group_by(model.ingest_batch_id).all())
+
+
+def process_csv_file(file_path: str, db_session: Session, chunksize: int = None, commit_per_chunk: bool = None, resume: bool = True, force: bool = False, mode: str = None, prepared=None, stage_stats: dict = None, replace_batch: int = None):
+    """Reads, transforms and inserts a CSV file, streaming it `chunksize` rows at a time so
+    peak memory does not grow with file size.
+
+    Chunks are loaded into a staging table first and published to the model's table in one
+    short transaction at the end (create_staging_table), so readers see the whole file or
+    nothing and the database is only locked while publishing. With commit_per_chunk, every
+    chunk is published, committed and checkpointed; if a run fails, the next run with
+    resume=True skips the rows already committed.
+
+    Files are looked up in the ingested_files ledger by content hash before parsing; identical
+    content that was already ingested raises AlreadyIngestedError unless force=True.
+
+    mode 'upsert' (default, Config.INGEST_MODE) updates rows whose natural key already exists,
+    so overlapping exports never duplicate records; 'append' inserts blindly.
+
+    prepared: optional iterable of prepared_chunks() items produced elsewhere (e.g. by
+    prepare_csv_file in a worker process, with the same rows_to_skip). The file is then not
+    read again here; it is only iterated after the ledger check.
+
+    The kpi_daily_rollup rows of every posting_date in the file and the filter_catalog rows of
+    their months are recomputed, and the data version of those months is bumped, in the same
+    transaction as the data (backend/rollup.py, backend/versions.py).
+
+    Published rows get the file's ledger id as ingest_batch_id. replace_batch: the ledger id of
+    an earlier file whose rows are deleted in the publish transaction, e.g. to swap a
+    corrected export for a bad one (see delete_ingest_batch).
+
+    Every attempt that gets past the ledger check is stored as an IngestRun with wall time,
+    CPU time, rows and peak memory per stage (backend/ingest_stats.py). stage_stats: optional
+    dict that also receives those per-stage stats.
+    Returns the number of records inserted (or updated) by this run.
+    """
+    file_name = os.path.basename(file_path)
+    chunksize = chunksize or Config.INGEST_CHUNK_SIZE
+    commit_per_chunk = Config.INGEST_COMMIT_PER_CHUNK if commit_per_chunk is None else commit_per_chunk
+    mode = mode or Config.INGEST_MODE
+    if mode not in ('upsert', 'append'):
+        raise ValueError(f"Unknown ingestion mode '{mode}'. Expected 'upsert' or 'append'.")
     logger.info(f"Starting processing for: {file_name}")
+    started_at, started = datetime.now(), time.perf_counter()
+    content_hash, file_size = None, None
+    stage_stats = {} if stage_stats is None else stage_stats
+    worker_prepared = prepared is not None
+    total_rows = inserted_count = 0
+    pending_dates = set() # posting_dates whose kpi_daily_rollup rows need recomputing
+    rewrote_rows = False # Rows stored before a publish were updated or deleted since the last commit, rather than only rows added
+    staged_columns = None # Columns of the chunks in the staging table, None while there is none
+    staged_rows = 0
+
+    def refresh_rollup():
+        nonlocal rewrote_rows
+        with timed_stage(stage_stats, 'rollup'):
+            conn = db_session.connection(bind_arguments={'mapper': model})
+            refresh_daily_rollup(conn, pending_dates)
+            refresh_filter_catalog(conn, pending_dates)
+            bump_data_version(conn, pending_dates, rewritten=rewrote_rows)
+        pending_dates.clear()
+        rewrote_rows = False
+
+    def publish():
+        """Publishes the staged rows (see create_staging_table) in the session's transaction."""
+        nonlocal inserted_count, rewrote_rows, staged_rows, staged_columns, replace_batch
+        with timed_stage(stage_stats, 'publish', staged_rows):
+            conn = db_session.connection(bind_arguments={'mapper': model})
+            batch = _ledger_entry(db_session, content_hash, file_name)
+            db_session.flush() # Assigns a new entry its id, the batch id of the rows
+            if replace_batch is not None:
+                deleted, dates = _delete_batch_rows(conn, model, replace_batch)
+                pending_dates.update(dates)
+                rewrote_rows = rewrote_rows or deleted > 0
+                replaced = db_session.get(IngestedFile, replace_batch)
+                if replaced is not None and replaced is not batch:
+                    replaced.status = 'replaced'
+                logger.info(f"Deleted {deleted} records of batch {replace_batch}, replaced by {file_name}.")
+                replace_batch = None
+            high_water = _max_id(conn, model) if mode == 'upsert' and not rewrote_rows else None
+            if high_water is not None:
+                batch_rows = _count_batch_rows(conn, model, batch.id, high_water)
+            written = publish_staged(conn, model, staged_columns, mode, batch_id=batch.id) if staged_columns else 0
+            inserted_count += written
+            if staged_columns is not None:
+                # A TEMP table only exists on its connection, and after a commit the session can
+                # take another one from the pool: the next chunk stages into a new table
+                drop_staging_table(conn, model)
+                staged_columns = None
+            if high_water is not None and _count_ids_above(conn, model, high_water) < written:
+                # Fewer new ids than rows written: some rows updated a natural key already stored.
+                # A rewrite only if rows from before this publish moved to this batch; a key
+                # repeated within the staged rows updates a row inserted by the same statement,
+                # and this batch's own rows (a forced or resumed run) are updated to the same lines
+                rewrote_rows = _count_batch_rows(conn, model, batch.id, high_water) > batch_rows
+        logger.info(f"Published {written} staged records from {file_name}.")
+        staged_rows = 0
+
+    def record(status, error=None):
+        record_run(db_session, file_name, status, stage_stats, time.perf_counter() - started,
+                   content_hash=content_hash, file_size=file_size, error=error, mode=mode, chunksize=chunksize,
+                   worker_prepared=worker_prepared, started_at=started_at, finished_at=datetime.now(),
+                   row_count=total_rows, inserted_count=inserted_count)
 
     try:
         # 1. Check if file exists
@@ -139,196 +844,47 @@ def process_csv_file(file_path: str, db_session: Session):
             logger.error(f"File not found during processing: {file_name}")
             raise FileNotFoundError(f"File not found: {file_path}")
 
+        # 2. Ingestion ledger: an already-ingested file costs one hash and one indexed lookup
+        with timed_stage(stage_stats, 'hash'):
+            content_hash = file_content_hash(file_path)
+            file_size = os.path.getsize(file_path)
+            hash_seconds = time.perf_counter() - started
+            ledger_entry = db_session.query(IngestedFile).filter_by(content_hash=content_hash).one_or_none()
+        if ledger_entry is not None and ledger_entry.status == 'success' and not force:
+            logger.info(f"Skipping {file_name}: identical content already ingested as '{ledger_entry.file_name}' ({ledger_entry.row_count} rows, {ledger_entry.finished_at}).")
+            raise AlreadyIngestedError(f"{file_name} was already ingested (as '{ledger_entry.file_name}' on {ledger_entry.finished_at:%Y-%m-%d %H:%M}).")
+
         # 3. Determine Model Type
         model, bind_key = determine_db_type(file_name)
 
-        # 4. Read CSV
-        logger.debug(f"Reading CSV: {file_name}")
-        try:
-            # Read all as string initially to handle variations, then convert
-            df = pd.read_csv(file_path, encoding='utf-8', low_memory=False, dtype=str, on_bad_lines='warn')
-            if df.empty:
-                logger.warning(f"Empty CSV file: {file_name}")
-                return 0
-        except Exception as e:
-             logger.error(f"Error reading CSV {file_name}: {e}", exc_info=True)
-             raise IOError(f"Could not read CSV: {file_name}") from e
-
-        total_rows = len(df)
-        logger.info(f"Read {total_rows} rows from {file_name}")
-
-        # 5. Clean Column Names
-        original_columns = df.columns.tolist()
-        df.columns = [str(col).lower().strip().replace(' ', '_').replace('/', '_').replace('.', '').replace('(','').replace(')','').replace('-','_') for col in df.columns]
-        cleaned_columns = df.columns.tolist()
-        logger.debug(f"Cleaned original columns: {original_columns}")
-        logger.debug(f"Cleaned columns result: {cleaned_columns}")
-
-        # --- Updated & Comprehensive Column Mapping ---
-        column_map = {
-            # Exact matches from image (after cleaning) mapped to model names
-            'posting_date': 'posting_date',
-            'document_no': 'document_no',
-            'order_no': 'order_no',
-            'item_no': 'item_no',
-            'operation_no': 'operation_no',
-            'operation_description': 'operation_description',
-            'order_line_no': 'order_line_no',
-            'type': 'type',
-            'machine_no': 'machine_no',
-            'current_c_t': 'current_c_t', # Cleaned from 'Current C/T'
-            'output_quantity': 'output_quantity',
-            'rejection_qty': 'rejection_qty',
-            'rejection_reson': 'rejection_reason', # *** Fix mapping ***
-            're_work_qty': 'rework_qty',          # *** Fix mapping ***
-            're_work_reason': 'rework_reason',     # *** Fix mapping ***
-            'work_shift_code': 'work_shift_code',
-            'start_time': 'start_time',
-            'end_time': 'end_time',
-            'plan_time': 'plan_time',             # Cleaned from 'Plan time'
-            'actual_run_time': 'actual_run_time',
-            'loss_time': 'loss_time',
-            'remarks': 'remarks',
-            'operator_name': 'operator_name',
-            'loss_time_should_be': 'loss_time_should_be',
-            'oee': 'oee',                         # Original OEE column from CSV
-            'reason_code': 'reason_code',
-            'reason_time_hm': 'reason_time_hm',
-            'loss_time_remark': 'loss_time_remark',
-
-            # Add other potential variations if observed elsewhere
-            'currentct': 'current_c_t',
-            'rejectionreason': 'rejection_reason',
-            'reworkqty': 'rework_qty',
-            'reworkreason': 'rework_reason',
-            'actualruntime': 'actual_run_time',
-            'losstime_shouldbe': 'loss_time_should_be',
-            'reasontimehm': 'reason_time_hm',
-            'losstimeremark': 'loss_time_remark',
-            'operatorname': 'operator_name'
-        }
-        df = df.rename(columns=lambda c: column_map.get(c, c)) # Apply mapping
-        final_columns_after_map = df.columns.tolist()
-        logger.debug(f"Columns after mapping: {final_columns_after_map}")
-
-        # 6. Define Model Columns & Check for Missing/Extra relative to *Mapped* DF
-        # Include calculated columns here if they are part of the model
-        model_columns_dict = {c.name: c for c in model.__table__.columns if c.name != 'id'}
-        # Columns expected *from the CSV* based on the model (excluding calculated ones for now)
-        expected_csv_cols = {k for k, v in model_columns_dict.items() if k not in ['availability', 'performance', 'quality_rate', 'oee_new', 'shift_type']}
-
-        # What columns does the *mapped* dataframe actually have?
-        actual_mapped_cols = set(df.columns)
-
-        missing_from_csv = expected_csv_cols - actual_mapped_cols
-        extra_in_csv = actual_mapped_cols - expected_csv_cols
-
-        # Add missing expected CSV columns and fill with None
-        if missing_from_csv:
-            logger.warning(f"Columns expected from CSV mapping not found: {missing_from_csv}. Filling with None.")
-            for col in missing_from_csv:
-                df[col] = None # Add missing columns with None value
-
-        # Drop extra columns found in CSV that don't map to model expectations
-        if extra_in_csv:
-             logger.warning(f"Extra columns after mapping ignored: {extra_in_csv}.")
-             df = df.drop(columns=list(extra_in_csv))
-
-        # 7. Data Type Conversion and Cleaning
-        logger.debug(f"Aligning data types for {file_name}...")
-        # Now apply type conversions based on the model definition
-        for col_name, col_def in model_columns_dict.items():
-            if col_name not in df.columns: continue # Skip if column still missing (shouldn't happen now)
-            if col_name in ['availability', 'performance', 'quality_rate', 'oee_new', 'shift_type']: continue # Skip calculated columns for now
-
-            target_type = col_def.type.python_type
-            logger.debug(f"Aligning column: '{col_name}' to target type: {target_type}")
-
-            # Apply time/float conversions first if not done by dtype=str read
-            if col_name in ['plan_time', 'actual_run_time', 'loss_time', 'loss_time_should_be', 'reason_time_hm']:
-                df[col_name] = df[col_name].apply(time_to_seconds)
-                target_type = int # Target is now integer seconds
-            elif col_name == 'current_c_t':
-                 df[col_name] = df[col_name].apply(safe_float_conversion)
-                 target_type = float
-
-            if target_type == int:
-                numeric_series = pd.to_numeric(df[col_name], errors='coerce')
-                not_na_mask = numeric_series.notna()
-                fractional_mask = (numeric_series[not_na_mask].apply(lambda x: not math.isclose(x, math.floor(x), abs_tol=1e-9)))
-                if fractional_mask.any():
-                    examples = numeric_series[not_na_mask][fractional_mask].unique()[:5]
-                    logger.warning(f"Column '{col_name}' contains fractional values. Truncating. Examples: {examples}")
-                    numeric_series.loc[not_na_mask & fractional_mask] = numeric_series.loc[not_na_mask & fractional_mask].apply(math.floor)
-                try:
-                    df[col_name] = numeric_series.astype('Int64')
-                except TypeError as e: raise TypeError(f"Cannot cast column '{col_name}' to Int64: {e}") from e
-
-            elif target_type == float:
-                 if col_name != 'current_c_t': df[col_name] = df[col_name].apply(safe_float_conversion)
-                 df[col_name] = pd.to_numeric(df[col_name], errors='coerce').astype('Float64')
-
-            elif target_type == str:
-                 df[col_name] = df[col_name].fillna('').astype(str).replace({'nan': '', 'None': '', '<NA>': ''}, regex=False)
-
-            elif col_name == 'posting_date':
-                 df[col_name] = pd.to_datetime(df[col_name], format='%d-%m-%Y', dayfirst=True, errors='coerce').dt.strftime('%d-%m-%Y').fillna('')
-
-            elif col_name in ['start_time', 'end_time']:
-                 df[col_name] = df[col_name].fillna('').astype(str).str.replace(r'\.0$', '', regex=True).fillna("00:00:00")
-
-        # 8. Perform Calculations
-        logger.debug(f"Calculating metrics for {file_name}...")
-        try:
-            # Ensure input columns for calculations exist and are correct type before applying
-            # Calculation functions handle potential NA inputs via safe_float_conversion
-            df['availability'] = df.apply(lambda row: calc_availability(row.get('plan_time'), row.get('loss_time')), axis=1)
-            df['quality_rate'] = df.apply(lambda row: calc_quality_rate(row.get('output_quantity'), row.get('rejection_qty')), axis=1)
-            df['performance'] = df.apply(lambda row: calc_performance(row.get('output_quantity'), row.get('current_c_t'), row.get('actual_run_time')), axis=1)
-            df['oee_new'] = df.apply(lambda row: calc_oee_new(row.get('availability'), row.get('performance'), row.get('quality_rate')), axis=1)
-            df['shift_type'] = df.apply(lambda row: calc_shift_type(row.get('actual_run_time')), axis=1) # Add shift type calc
-            logger.debug(f"Finished calculating metrics for {file_name}.")
-        except Exception as calc_error:
-             logger.error(f"Error during metric calculation for {file_name}: {calc_error}", exc_info=True)
-             raise RuntimeError(f"Metric calculation failed for {file_name}") from calc_error
-
-
-        # 9. Prepare for Bulk Insert
-        # Now select *all* columns defined in the model
-        columns_to_insert = list(model_columns_dict.keys())
-
-        # Ensure calculated columns exist before selection
-        for calc_col in ['availability', 'quality_rate', 'performance', 'oee_new', 'shift_type']:
-             if calc_col not in df.columns:
-                  logger.warning(f"Calculated column '{calc_col}' missing before final selection. Setting to None.")
-                  df[calc_col] = None
-
-        # Final check that all model columns are present in df
-        missing_final_check = set(columns_to_insert) - set(df.columns)
-        if missing_final_check:
-             logger.error(f"Columns missing just before creating df_final: {missing_final_check}")
-             # Add them back if missing - this indicates a logic error above
-             for col in missing_final_check: df[col] = None
-
-
-        df_final = df[[col for col in columns_to_insert if col in df.columns]].copy()
-
-        # Replace pandas NA/NaN/NaT with Python None using .where()
-        df_final = df_final.where(pd.notna(df_final), None)
-        logger.debug("Applied .where(pd.notna(df_final), None) to replace missing values.")
-
-        records = df_final.to_dict('records')
-        logger.debug(f"Prepared {len(records)} records for insertion from {file_name}.")
-
-        # 10. Bulk Insert
-        if records:
-            logger.info(f"Attempting bulk insert for {len(records)} records from {file_name}...")
+        # Rows already committed by an interrupted commit_per_chunk run
+        rows_to_skip = load_checkpoint(file_path) if resume else 0
+        if rows_to_skip:
+            logger.info(f"Resuming {file_name} after {rows_to_skip} already committed rows.")
+
+        # 4. Read CSV in chunks (or take chunks already prepared by a worker), then transform and insert each one
+        if prepared is None:
+            logger.debug(f"Reading CSV: {file_name} (chunksize={chunksize})")
+            prepared = prepared_chunks(file_path, model, chunksize, rows_to_skip, stage_stats)
+        for chunk_no, (total_rows, df_final) in enumerate(prepared, start=1):
+            if df_final is None:
+                continue
+
+            # 10. Bulk Insert into the staging table; nothing is visible to readers until publish()
+            logger.info(f"Staging {len(df_final)} records from {file_name} (chunk {chunk_no})...")
             try:
-                db_session.bulk_insert_mappings(model, records)
-                db_session.commit()
-                inserted_count = len(records)
-                logger.info(f"Successfully inserted {inserted_count} records from {file_name}.")
-                return inserted_count
+                with timed_stage(stage_stats, 'insert', len(df_final)):
+                    if staged_columns is None:
+                        staging = create_staging_table(db_session.connection(bind_arguments={'mapper': model}), model)
+                        staged_columns = list(df_final.columns)
+                    staged_rows += load_frame(df_final[staged_columns], model, db_session, mode='append', table=staging)
+                pending_dates.update(df_final['posting_date'].dropna().unique())
+                if commit_per_chunk:
+                    publish()
+                    refresh_rollup()
+                    with timed_stage(stage_stats, 'publish'):
+                        db_session.commit()
+                    save_checkpoint(file_path, total_rows)
             except SQLAlchemyError as e:
                 db_session.rollback()
                 logger.error(f"Database error during bulk insert from {file_name}. Rolled back. Error: {e}", exc_info=True)
@@ -337,18 +893,62 @@ def process_csv_file(file_path: str, db_session: Session):
                  db_session.rollback()
                  logger.error(f"Unexpected error during bulk insert from {file_name}: {e}", exc_info=True)
                  raise RuntimeError(f"Unexpected error during database insert for {file_name}.") from e
-        else:
+            del df_final
+
+        try:
+            if staged_rows or replace_batch is not None:
+                publish()
+        except SQLAlchemyError as e:
+            db_session.rollback()
+            logger.error(f"Database error publishing records from {file_name}. Rolled back. Error: {e}", exc_info=True)
+            raise IOError(f"Database insertion failed for {file_name}. Check logs.") from e
+
+        if total_rows == 0:
+            logger.warning(f"Empty CSV file: {file_name}")
+        elif inserted_count == 0:
             logger.info(f"No valid records to insert from {file_name}.")
-            return 0
 
-    except FileNotFoundError: raise
+        # Ledger row commits in the same transaction as the data it describes
+        ledger_entry = _ledger_entry(db_session, content_hash, file_name)
+        ledger_entry.file_name, ledger_entry.file_size, ledger_entry.status, ledger_entry.error = file_name, file_size, 'success', None
+        ledger_entry.row_count, ledger_entry.inserted_count = total_rows, inserted_count
+        ledger_entry.started_at, ledger_entry.finished_at = started_at, datetime.now()
+        ledger_entry.hash_seconds, ledger_entry.duration_seconds = hash_seconds, time.perf_counter() - started
+
+        try:
+            if pending_dates:
+                refresh_rollup()
+            with timed_stage(stage_stats, 'publish'):
+                db_session.commit()
+        except SQLAlchemyError as e:
+            db_session.rollback()
+            logger.error(f"Database error committing records from {file_name}. Rolled back. Error: {e}", exc_info=True)
+            raise IOError(f"Database insertion failed for {file_name}. Check logs.") from e
+        clear_checkpoint(file_path)
+        if inserted_count:
+            logger.info(f"Successfully inserted {inserted_count} records from {file_name}.")
+        record('success')
+        return inserted_count
+
+    except (FileNotFoundError, AlreadyIngestedError): raise
     except (ValueError, IOError, RuntimeError, TypeError) as e:
         logger.error(f"Failed to process {file_name} due to: {e}", exc_info=True)
         if db_session and db_session.is_active: db_session.rollback()
+        if content_hash:
+            _record_failure(db_session, content_hash, file_name, file_size, started_at, e)
+            record('failed', str(e))
         raise
     except Exception as e:
         logger.error(f"An critical unexpected error occurred processing {file_name}: {str(e)}", exc_info=True)
         if db_session and db_session.is_active: db_session.rollback()
+        if content_hash:
+            _record_failure(db_session, content_hash, file_name, file_size, started_at, e)
+            record('failed', str(e))
         raise RuntimeError(f"Critical unexpected error processing {file_name}.") from e
     finally:
+        if staged_columns is not None:
+            try:
+                drop_staging_table(db_session.connection(bind_arguments={'mapper': model}), model)
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not drop the staging table for {file_name}: {e}")
         logger.info(f"Finished processing attempt for: {file_name}")
\ No newline at end of file
@@ -0,0 +1,88 @@
+import calendar
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import select, text
+
+from backend.models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# --- Data Versions ---
+# data_versions holds a counter that every ingestion commit bumps ('all'), in the same
+# transaction as the data, and for each 'YYYY-MM' the counter value of the last commit that
+# touched that month. Dashboard caches pass the version of the months they read as an argument,
+# so st.cache_data keys on it: new data is never served from a stale entry, and entries for
+# untouched months stay valid. A January upload leaves August-December cached.
+GLOBAL_SCOPE = 'all'
+
+def month_key(posting_date) -> str:
+    """'YYYY-MM' of a date or ISO date string."""
+    return str(posting_date)[:7]
+
+def bump_data_version(conn, posting_dates, rewritten: bool = False) -> int:
+    """Increments the global version and stamps the months of the given posting dates with it.
+    rewritten: the commit updated or deleted existing rows of those months, not only inserted
+    new ones (see ProductionDataset). Runs in the connection's open transaction. Returns the
+    new version."""
+    now = datetime.now()
+    table = DataVersion.__tablename__
+    upsert = (f"INSERT INTO {table} (scope, version, rewritten_version, updated_at) "
+              f"VALUES (:scope, :version, :rewritten, :now) "
+              f"ON CONFLICT (scope) DO UPDATE SET version = {{}}, "
+              f"rewritten_version = MAX({table}.rewritten_version, excluded.rewritten_version), "
+              f"updated_at = excluded.updated_at")
+    version = conn.execute(text(upsert.format(f"{table}.version + 1") + " RETURNING version"),
+                           {'scope': GLOBAL_SCOPE, 'version': 1, 'rewritten': 0, 'now': now}).scalar_one()
+    months = sorted({month_key(d) for d in posting_dates if d is not None})
+    if months:
+        rewritten_version = version if rewritten else 0
+        conn.execute(text(upsert.format('excluded.version')),
+                     [{'scope': month, 'version': version, 'rewritten': rewritten_version, 'now': now} for month in months])
+    logger.info(f"Data version {version}: {len(months)} month(s) {'rewritten' if rewritten else 'changed'} "
+                f"({', '.join(months[:12])}).")
+    return version
+
+def data_version(conn) -> int:
+    """The global version (0 before the first ingestion)."""
+    return conn.execute(select(DataVersion.version).where(DataVersion.scope == GLOBAL_SCOPE)).scalar() or 0
+
+def month_versions(conn) -> dict:
+    """{'YYYY-MM': version} of every month that has received data."""
+    rows = conn.execute(select(DataVersion.scope, DataVersion.version).where(DataVersion.scope != GLOBAL_SCOPE))
+    return dict(rows.all())
+
+def month_states(conn) -> dict:
+    """{'YYYY-MM': (version, rewritten_version)} of every month that has received data."""
+    rows = conn.execute(select(DataVersion.scope, DataVersion.version, DataVersion.rewritten_version)
+                        .where(DataVersion.scope != GLOBAL_SCOPE))
+    return {month: (version, rewritten) for month, version, rewritten in rows}
+
+def month_bounds(month: str) -> tuple:
+    """First and last date of a 'YYYY-MM' month."""
+    year, month_no = int(month[:4]), int(month[5:7])
+    return date(year, month_no, 1), date(year, month_no, calendar.monthrange(year, month_no)[1])
+
+def _months_in_range(versions: dict, start_date=None, end_date=None) -> list:
+    first = month_key(start_date) if start_date is not None else ''
+    last = month_key(end_date) if end_date is not None else '9999-12'
+    return [month for month in sorted(versions) if first <= month <= last]
+
+def range_version(versions: dict, start_date=None, end_date=None) -> int:
+    """Version of the data between two dates (either may be None): the highest version among
+    the overlapping months, so it changes whenever one of them does."""
+    return max((versions[month] for month in _months_in_range(versions, start_date, end_date)), default=0)
+
+def split_by_month(filters: dict, versions: dict) -> list:
+    """(filters, version) for each month with data within the filters' date range, with the
+    date range narrowed to that month. Fetching and caching per month means only the
+    months that changed are queried again."""
+    parts = []
+    for month in _months_in_range(versions, filters.get('start_date'), filters.get('end_date')):
+        first, last = month_bounds(month)
+        if filters.get('start_date') is not None:
+            first = max(first, filters['start_date'])
+        if filters.get('end_date') is not None:
+            last = min(last, filters['end_date'])
+        parts.append(({**filters, 'start_date': first, 'end_date': last}, versions[month]))
+    return parts
@@ -0,0 +1,85 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy.orm import sessionmaker
+
+from backend.batch import ingest_files
+from backend.config import Config
+from backend.database import create_sqlite_engine, get_engine, sqlite_pragmas
+
+logger = logging.getLogger(__name__)
+
+# --- Single Writer ---
+# SQLite takes one writer at a time. The uploader (app.py) and the folder monitor used to write
+# through their own sessions, so a second writer waited on the first and could fail with
+# "database is locked". All writes now go through one DatabaseWriter per process: a thread that
+# owns the only write connection and runs the submitted jobs one after another. Dashboard pages
+# keep reading through get_engine(); in WAL mode each read sees the last committed snapshot and
+# neither waits for the writer nor holds it up.
+
+class DatabaseWriter:
+    """Runs write jobs, in submission order, on a dedicated thread and connection."""
+
+    def __init__(self, url: str, **engine_kwargs):
+        # One pooled connection, used only by the writer thread. Its temp tables, where
+        # ingestion stages whole files (backend/utilities.create_staging_table), spill to a
+        # temporary file rather than growing in memory.
+        pragmas = {**sqlite_pragmas(), 'temp_store': 'FILE'}
+        self.engine = create_sqlite_engine(url, pragmas=pragmas, pool_size=1, max_overflow=0, **engine_kwargs)
+        self.Session = sessionmaker(bind=self.engine)
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='database-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, job, *args, **kwargs) -> Future:
+        """Queues job(session, *args, **kwargs). The session is opened for the job and closed
+        after it; the job commits its own work. The future holds the job's return value or
+        exception."""
+        future = Future()
+        self._jobs.put((future, job, args, kwargs))
+        logger.debug(f"Queued write job {getattr(job, '__name__', job)} ({self._jobs.qsize()} waiting).")
+        return future
+
+    def ingest(self, file_paths, on_result=None, **process_kwargs) -> Future:
+        """Queues backend/batch.ingest_files for the files; the future holds its results.
+        on_result is called from the writer thread, so it should only hand the result over
+        (e.g. put it on a queue.Queue)."""
+        return self.submit(_ingest_job, list(file_paths), on_result=on_result, **process_kwargs)
+
+    def pending(self) -> int:
+        """Jobs waiting behind the one running."""
+        return self._jobs.qsize()
+
+    def _run(self):
+        while True:
+            future, job, args, kwargs = self._jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            session = self.Session()
+            try:
+                future.set_result(job(session, *args, **kwargs))
+            except BaseException as e:
+                session.rollback()
+                logger.error(f"Write job {getattr(job, '__name__', job)} failed: {e}", exc_info=True)
+                future.set_exception(e)
+            finally:
+                session.close()
+
+
+def _ingest_job(session, file_paths, on_result=None, **process_kwargs):
+    return ingest_files(file_paths, session, on_result=on_result, **process_kwargs)
+
+
+_writers = {} # {bind: writer}
+_writers_lock = threading.Lock()
+
+def get_writer(bind: str = 'grd') -> DatabaseWriter:
+    """The process-wide writer of a Config.SQLALCHEMY_BINDS database. Its tables exist and are
+    migrated (get_engine) before the first job runs."""
+    with _writers_lock:
+        if bind not in _writers:
+            get_engine(bind)
+            _writers[bind] = DatabaseWriter(Config.SQLALCHEMY_BINDS[bind])
+        return _writers[bind]
@@ -0,0 +1,2 @@
+# Ingestion benchmarks. Run from the ERP_DATA_ANALYZER folder so `backend` is importable, e.g.:
+#   python -m benchmarks.bench_kpi
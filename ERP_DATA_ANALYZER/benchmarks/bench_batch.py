@@ -0,0 +1,78 @@
+"""Measures how multi-file ingestion (backend/batch.ingest_files) scales with worker processes.
+
+Each run loads the same files into a fresh scratch SQLite database, end to end (parse, clean,
+KPIs, upsert, ledger), and checks that every run stores the same number of rows.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_batch
+    python -m benchmarks.bench_batch --workers 1 2 4 8 --copies 4
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.batch import ingest_files
+from backend.config import Config
+from backend.models import ProductionRecordGRD
+from backend.schema import init_db
+
+
+def make_copies(paths, copies, workdir):
+    """Copies of each file with distinct contents (the ledger would skip exact duplicates)."""
+    files = []
+    for copy_no in range(copies):
+        for path in paths:
+            target = os.path.join(workdir, f"c{copy_no}_{os.path.basename(path)}")
+            shutil.copyfile(path, target)
+            with open(target, 'a', encoding='utf-8') as f:
+                f.write('\n' * (copy_no + 1)) # Blank lines: same rows, different hash
+            files.append(target)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help="GRD CSV files (default: the upload folder)")
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument('--copies', type=int, default=2, help="Ingest N distinct copies of every file")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(Config.UPLOAD_FOLDER, '*_GRD.csv')))
+    if not paths:
+        parser.error("No GRD CSV files found.")
+
+    print(f"{os.cpu_count()} CPU core(s).")
+    print(f"{'workers':>7} | {'files':>5} | {'seconds':>8} | {'rows/s':>10} | {'rows in table':>13}")
+    with tempfile.TemporaryDirectory() as workdir:
+        files = make_copies(paths, args.copies, workdir)
+        expected_rows = None
+        for workers in args.workers:
+            engine = create_engine(f"sqlite:///{os.path.join(workdir, f'w{workers}.sqlite')}")
+            init_db(engine)
+            session = sessionmaker(bind=engine)()
+            try:
+                start = time.perf_counter()
+                results = ingest_files(files, session, max_workers=workers)
+                elapsed = time.perf_counter() - start
+                rows = session.query(ProductionRecordGRD).count()
+            finally:
+                session.close()
+                engine.dispose()
+            failed = [r['file'] for r in results if r['status'] != 'success']
+            if failed:
+                raise AssertionError(f"{workers} worker(s): not ingested: {failed}")
+            if expected_rows is not None and rows != expected_rows:
+                raise AssertionError(f"{workers} worker(s) stored {rows} rows, expected {expected_rows}")
+            expected_rows = rows
+            written = sum(r['records'] for r in results)
+            print(f"{workers:>7} | {len(files):>5} | {elapsed:>8.2f} | {written / elapsed:>10,.0f} | {rows:>13,}")
+
+
+if __name__ == '__main__':
+    main()
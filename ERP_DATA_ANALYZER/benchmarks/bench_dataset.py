@@ -0,0 +1,95 @@
+"""Memory of the shared dashboard dataset (backend/dataset.py) vs the per-page frames it replaces.
+
+Before, each metric page cached its own object-dtype frame of production_records_grd (per
+filter combination). This loads that frame once the old way, then the shared compact
+dataset, reports the deep memory of both and checks both hold the same rows. It also times
+typical page slices.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_dataset
+    python -m benchmarks.bench_dataset --db /tmp/grd_bench/bench.sqlite
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import Config
+from backend.dataset import DATASET_COLUMNS, KPI_METRICS, ProductionDataset
+from backend.models import ProductionRecordGRD
+from backend.queries import METRIC_RANGE, named_query
+from backend.schema import init_db
+
+METRIC_PAGES = 4
+
+
+def legacy_page_frame(session):
+    """The frame one metric page used to cache (before backend/dataset.py), with machine, shift
+    and operator names as the table stored them then."""
+    columns = [c.removesuffix('_id') if c.removesuffix('_id') in ProductionRecordGRD.DIMENSIONS else c for c in DATASET_COLUMNS]
+    df = pd.DataFrame(named_query(session, ProductionRecordGRD, columns).all(), columns=columns)
+    df['metric_value'] = df['oee_new']
+    df['posting_date'] = pd.to_datetime(df['posting_date'], errors='coerce')
+    df = df.dropna(subset=['posting_date'])
+    df['month_year'] = df['posting_date'].dt.strftime('%b, %Y'); df['month_order'] = df['posting_date'].dt.strftime('%Y%m')
+    df['day'] = df['posting_date'].dt.day
+    return df
+
+
+def mib(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="SQLite file (default: the app's grd database)")
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{args.db}" if args.db else Config.SQLALCHEMY_BINDS['grd'])
+    init_db(engine) # The dataset follows data_versions
+    session = sessionmaker(bind=engine)()
+    try:
+        start = time.perf_counter()
+        legacy = legacy_page_frame(session)
+        legacy_seconds = time.perf_counter() - start
+    finally:
+        session.close()
+
+    dataset = ProductionDataset(engine)
+    start = time.perf_counter()
+    shared = dataset.frame
+    shared_seconds = time.perf_counter() - start
+
+    if sorted(legacy['id']) != sorted(shared['id']):
+        raise AssertionError("The shared dataset does not hold the same rows as the legacy page frame.")
+    for column in ('oee_new', 'plan_time', 'output_quantity'):
+        expected = legacy.set_index('id')[column].astype(float).sort_index().to_numpy()
+        actual = shared.set_index('id')[column].astype(float).sort_index().to_numpy()
+        if not np.allclose(expected, actual, equal_nan=True):
+            raise AssertionError(f"Column {column} differs between the legacy frame and the shared dataset.")
+    for metric in KPI_METRICS: # The float32 KPIs must not move rows in or out of the 0-100 range
+        expected = set(legacy.loc[legacy[metric].astype(float).between(*METRIC_RANGE), 'id'])
+        if set(dataset.rows(valid_metrics=(metric,))['id']) != expected:
+            raise AssertionError(f"Rows with {metric} in {METRIC_RANGE} differ between the legacy frame and the shared dataset.")
+
+    print(f"{len(shared):,} rows")
+    print(f"legacy: {mib(legacy):8.1f} MiB per page copy, {METRIC_PAGES * mib(legacy):8.1f} MiB for {METRIC_PAGES} metric pages "
+          f"(more per cached filter combination); load {legacy_seconds:.2f}s")
+    print(f"shared: {mib(shared):8.1f} MiB once for all pages; load {shared_seconds:.2f}s "
+          f"({METRIC_PAGES * mib(legacy) / mib(shared):.1f}x less than {METRIC_PAGES} page copies)")
+
+    first, last = shared['posting_date'].min().date(), shared['posting_date'].max().date()
+    machines = tuple(np.unique(shared['machine_no_id'])[:3].tolist())
+    for label, filters in (('all rows', {}), ('date range', {'start_date': first, 'end_date': first + (last - first) / 4}),
+                           ('3 machines', {'machines': machines})):
+        start = time.perf_counter()
+        rows = dataset.rows(valid_metrics=('oee_new',), **filters)
+        print(f"slice {label:>10}: {len(rows):>9,} rows in {(time.perf_counter() - start) * 1000:7.1f} ms")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
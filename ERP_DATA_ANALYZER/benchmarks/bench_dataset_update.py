@@ -0,0 +1,106 @@
+"""Refresh of the shared dashboard dataset (backend/dataset.py) after monthly ingests.
+
+Ingests one synthetic GRD export per month into a scratch database, refreshing the dataset
+after each. A new month only adds rows, so the refresh must append them (a read by id above
+the high-water mark) without marking any month rewritten or reading one again. A corrected
+re-export of the first month then updates its rows, which must mark that month rewritten and
+read it again. After every refresh the dataset must equal a fresh load of the table. Reports
+the refresh time against a full reload.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_dataset_update
+    python -m benchmarks.bench_dataset_update --months 6 --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import create_sqlite_engine
+from backend.dataset import ProductionDataset
+from backend.schema import init_db
+from backend.utilities import process_csv_file
+from backend.versions import month_states
+from benchmarks.generate_grd import HEADER, make_rows
+
+
+def write_month_csv(path, month, n_rows, seed=0):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(','.join(HEADER) + '\n')
+        make_rows(n_rows, seed=seed, month=month).to_csv(f, header=False, index=False, lineterminator='\n')
+    return path
+
+
+def comparable(df):
+    return df.astype({column: 'object' for column in df.select_dtypes('category')}).reset_index(drop=True)
+
+
+def refresh(engine, dataset, file_path):
+    """Ingests the file, refreshes the dataset and checks it against a fresh load. Returns the
+    months marked rewritten, the rows the refresh read and its seconds."""
+    with engine.connect() as conn:
+        before = month_states(conn)
+    session = sessionmaker(bind=engine)()
+    try:
+        process_csv_file(file_path, session)
+    finally:
+        session.close()
+    with engine.connect() as conn:
+        after = month_states(conn)
+    rewritten = sorted(month for month in after if after[month][1] != before.get(month, (0, 0))[1])
+
+    read_rows = []
+    read = dataset._read
+    dataset._read = lambda *conditions: [read_rows.append(len(chunk)) or chunk for chunk in read(*conditions)]
+    try:
+        start = time.perf_counter()
+        updated = dataset.frame
+        seconds = time.perf_counter() - start
+    finally:
+        del dataset._read
+    pd.testing.assert_frame_equal(comparable(updated), comparable(ProductionDataset(engine).frame))
+    return rewritten, sum(read_rows), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months', type=int, default=4, help="Monthly files to ingest")
+    parser.add_argument('--rows', type=int, default=50_000, help="Rows per monthly file")
+    args = parser.parse_args()
+
+    months = [str(month) for month in pd.period_range('2024-01', periods=args.months, freq='M')]
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_sqlite_engine(f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}")
+        init_db(engine)
+        dataset = ProductionDataset(engine)
+        dataset.frame
+        for month in months:
+            file_path = write_month_csv(os.path.join(workdir, f'LOSS TIME {month}_GRD.csv'), month, args.rows)
+            rewritten, read_rows, seconds = refresh(engine, dataset, file_path)
+            if rewritten or read_rows != args.rows:
+                raise AssertionError(f"Ingesting {month} marked {rewritten or 'no month'} rewritten and the "
+                                     f"refresh read {read_rows:,} rows; expected only its {args.rows:,} new rows appended.")
+            start = time.perf_counter()
+            ProductionDataset(engine).frame
+            print(f"{month}: appended {read_rows:,} rows in {seconds * 1000:7.1f} ms "
+                  f"(full reload {(time.perf_counter() - start) * 1000:7.1f} ms)")
+
+        # The same lines with other values, as a corrected export: updates the month's rows
+        corrected = write_month_csv(os.path.join(workdir, f'LOSS TIME {months[0]} CORRECTED_GRD.csv'),
+                                    months[0], args.rows)
+        frame = pd.read_csv(corrected, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        frame['Output Quantity'] = frame['Output Quantity'].where(frame['Output Quantity'] == '', '1')
+        frame.to_csv(corrected, index=False, encoding='utf-8-sig', lineterminator='\n')
+        rewritten, read_rows, seconds = refresh(engine, dataset, corrected)
+        if rewritten != [months[0]] or read_rows != args.rows:
+            raise AssertionError(f"Re-ingesting a corrected {months[0]} marked {rewritten or 'no month'} rewritten and "
+                                 f"the refresh read {read_rows:,} rows; expected {months[0]} read again.")
+        print(f"{months[0]} corrected: read {read_rows:,} rows again in {seconds * 1000:7.1f} ms")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
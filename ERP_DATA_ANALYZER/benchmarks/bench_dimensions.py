@@ -0,0 +1,162 @@
+"""Text dimension columns vs dimension ids (backend/models.Dimension) on production_records_grd.
+
+A synthetic GRD file is ingested into a new database, which stores machines, shifts,
+operators, items, reason codes and reasons as ids. The table is then copied twice in the same
+file: once as it is, and once with the names joined back in as text, as the table stored them
+before. Each copy gets its natural key and its machine and shift indexes. The benchmark reports
+the size of each copy and its indexes (SQLite's dbstat). It also times, on both copies, a
+GROUP BY over machine/shift/operator, an IN filter on machines and shifts, and loading the three
+columns into pandas. It checks that both copies give the same results.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_dimensions
+    python -m benchmarks.bench_dimensions --rows 3000000 --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import create_sqlite_engine
+from backend.models import Dimension, ProductionRecordGRD
+from backend.queries import dimension_names
+from backend.schema import init_db
+from backend.utilities import process_csv_file
+from benchmarks.generate_grd import grd_file_name, write_grd_csv
+
+GROUPED = ('machine_no', 'work_shift_code', 'operator_name')
+
+
+def build_copies(conn):
+    """Creates records_ids and records_text from production_records_grd, with their indexes."""
+    model = ProductionRecordGRD
+    table = model.__tablename__
+    columns, joins = [], []
+    for column in model.__table__.columns:
+        field = column.name.removesuffix('_id')
+        if field in model.DIMENSIONS:
+            alias = f"d{len(joins)}"
+            joins.append(f"JOIN {Dimension.__tablename__} {alias} ON {alias}.id = r.{column.name}")
+            columns.append(f"{alias}.value AS {field}")
+        else:
+            columns.append(f"r.{column.name}")
+    conn.exec_driver_sql(f"CREATE TABLE records_ids AS SELECT * FROM {table} ORDER BY id")
+    conn.exec_driver_sql(f"CREATE TABLE records_text AS SELECT {', '.join(columns)} FROM {table} r {' '.join(joins)} ORDER BY r.id")
+    for copy, suffix in (('records_ids', '_id'), ('records_text', '')):
+        key = [col.removesuffix('_id') + suffix if col.removesuffix('_id') in model.DIMENSIONS else col for col in model.NATURAL_KEY]
+        conn.exec_driver_sql(f"CREATE UNIQUE INDEX {copy}_natural_key ON {copy} ({', '.join(key)})")
+        conn.exec_driver_sql(f"CREATE INDEX {copy}_machine ON {copy} (machine_no{suffix})")
+        conn.exec_driver_sql(f"CREATE INDEX {copy}_shift ON {copy} (work_shift_code{suffix})")
+    conn.exec_driver_sql("ANALYZE")
+
+
+def sizes_mib(conn, copy):
+    """{table or index: MiB} of a copy."""
+    rows = conn.exec_driver_sql(
+        f"SELECT name, SUM(pgsize) FROM dbstat WHERE name = '{copy}' OR name LIKE '{copy}\\_%' ESCAPE '\\' GROUP BY name").all()
+    return {name.removeprefix(f"{copy}_") if name != copy else 'table': size / 2**20 for name, size in rows}
+
+
+def timed(function, repeat):
+    """(best wall time of `repeat` calls, result of the last)."""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_queries(engine, repeat):
+    """{query: {copy: seconds}}. Raises AssertionError if the copies disagree."""
+    with engine.connect() as conn:
+        names = dimension_names(conn)
+        ids = {(field, value): id_ for field, value, id_ in conn.exec_driver_sql(f"SELECT field, value, id FROM {Dimension.__tablename__}")}
+        machines = [value for (value,) in conn.exec_driver_sql("SELECT DISTINCT machine_no FROM records_text ORDER BY 1 LIMIT 3")]
+        shifts = [value for (value,) in conn.exec_driver_sql("SELECT DISTINCT work_shift_code FROM records_text ORDER BY 1 LIMIT 2")]
+
+    def in_list(field, values, suffix):
+        return ', '.join(str(ids[(field, value)]) if suffix else f"'{value}'" for value in values)
+
+    def queries(copy, suffix):
+        keys = ', '.join(f"{field}{suffix}" for field in GROUPED)
+        return {
+            'GROUP BY machine, shift, operator':
+                f"SELECT {keys}, COUNT(*), TOTAL(oee_new) FROM {copy} GROUP BY {keys}",
+            'IN filter: 3 machines, 2 shifts':
+                f"SELECT COUNT(*), TOTAL(oee_new) FROM {copy} WHERE machine_no{suffix} IN ({in_list('machine_no', machines, suffix)}) "
+                f"AND work_shift_code{suffix} IN ({in_list('work_shift_code', shifts, suffix)})",
+        }
+
+    def comparable(rows, grouped, suffix):
+        # Dimension ids -> names, so id rows compare with text rows; sums rounded, as the
+        # copies may add a group's rows in another order
+        rows = [tuple(names[value] if suffix and i < grouped else round(value, 6) if isinstance(value, float) else value
+                      for i, value in enumerate(row)) for row in rows]
+        return sorted(rows)
+
+    results = {}
+    with engine.connect() as conn:
+        for copy, suffix in (('records_text', ''), ('records_ids', '_id')):
+            for (label, sql), grouped in zip(queries(copy, suffix).items(), (len(GROUPED), 0)):
+                seconds, rows = timed(lambda: conn.exec_driver_sql(sql).all(), repeat)
+                results.setdefault(label, {})[copy] = (seconds, comparable(rows, grouped, suffix))
+
+            columns = ', '.join(f"{field}{suffix}" for field in GROUPED)
+            dtype = 'int32' if suffix else 'category'
+            seconds, frame = timed(lambda: pd.read_sql(f"SELECT {columns} FROM {copy}", conn).astype(dtype), repeat)
+            results.setdefault('pandas load of the 3 columns', {})[copy] = (seconds, len(frame))
+    for label, copies in results.items():
+        if copies['records_text'][1] != copies['records_ids'][1]:
+            raise AssertionError(f"'{label}' differs between the text and the id copy.")
+    return {label: {copy: seconds for copy, (seconds, _) in copies.items()} for label, copies in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3, help="Query timings are the best of this many runs")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'grd_bench'),
+                        help="Where the generated file is kept (reused across runs)")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    csv_path = os.path.join(args.data_dir, grd_file_name(args.rows))
+    if not os.path.exists(csv_path):
+        print(f"Generating {csv_path}")
+        write_grd_csv(csv_path, args.rows)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_sqlite_engine(f"sqlite:///{os.path.join(workdir, 'dimensions.sqlite')}")
+        init_db(engine)
+        session = sessionmaker(bind=engine)()
+        try:
+            print(f"Ingesting {args.rows:,} rows")
+            process_csv_file(csv_path, session, force=True)
+        finally:
+            session.close()
+        with engine.begin() as conn:
+            build_copies(conn)
+        with engine.connect() as conn:
+            sizes = {copy: sizes_mib(conn, copy) for copy in ('records_text', 'records_ids')}
+            values = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {Dimension.__tablename__}").scalar()
+        timings = run_queries(engine, args.repeat)
+        engine.dispose()
+
+    print(f"\n{args.rows:,} rows, {values} dimension values")
+    print(f"{'':<38} | {'text':>9} | {'ids':>9}")
+    for name in sizes['records_text']:
+        print(f"{name + ' (MiB)':<38} | {sizes['records_text'][name]:>9.1f} | {sizes['records_ids'][name]:>9.1f}")
+    total = {copy: sum(sizes[copy].values()) for copy in sizes}
+    print(f"{'total (MiB)':<38} | {total['records_text']:>9.1f} | {total['records_ids']:>9.1f}")
+    for label, seconds in timings.items():
+        print(f"{label + ' (s)':<38} | {seconds['records_text']:>9.3f} | {seconds['records_ids']:>9.3f}")
+    print("Parity OK: both copies gave the same results.")
+
+
+if __name__ == '__main__':
+    main()
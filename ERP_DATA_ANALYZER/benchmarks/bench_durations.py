@@ -0,0 +1,84 @@
+"""Parity check and micro-benchmark for the vectorized duration parser (utilities.durations_to_seconds).
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_durations
+    python -m benchmarks.bench_durations --sizes 10000 100000 1000000
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.utilities import durations_to_seconds, time_to_seconds
+
+# Forms seen in the GRD exports plus the malformed inputs time_to_seconds maps to 0
+EDGE_CASES = [
+    '03:00:00', '02:30:00', '00:00:00', '23:59:59', '24:00:00', '10:60:00', '10:00:60',
+    '06:00', '23:59', '24:00', '7:5', ' 01:02:03 ', '1 : 2 : 3', '+1:02:03', '-1:00:00',
+    '01:-2:00', '1:2:3:4', '1.5:30', 'ab:cd', ':', '12:', ':30', '',  '   ', None, np.nan,
+    '0', '42', '42.4', '42.5', '43.5', '-7.6', '1e3', 'nan', 'inf', '-inf', 'abc', '0.083333333',
+    '3.75', '97.22222222',
+]
+
+
+def make_series(n_rows, seed=0):
+    """Random clock strings with ~20% blanks and ~5% edge cases, as object values."""
+    rng = np.random.default_rng(seed)
+    h, m, s = rng.integers(0, 24, n_rows), rng.integers(0, 60, n_rows), rng.integers(0, 60, n_rows)
+    clock = pd.Series([f"{a:02d}:{b:02d}:{c:02d}" for a, b, c in zip(h, m, s)], dtype=object)
+    clock[rng.random(n_rows) < 0.2] = np.nan
+    odd = rng.random(n_rows) < 0.05
+    clock[odd] = rng.choice(np.array(EDGE_CASES, dtype=object), int(odd.sum()))
+    return clock
+
+
+def as_ingested(series):
+    """Round-trips values through a CSV so the column has the dtype process_csv_file sees
+    (pd.read_csv(..., dtype=str))."""
+    buffer = io.StringIO()
+    series.to_frame('t').to_csv(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=str)['t']
+
+
+def check_parity(n_rows=50_000):
+    """Asserts durations_to_seconds matches time_to_seconds value for value."""
+    series = pd.concat([pd.Series(EDGE_CASES, dtype=object), make_series(n_rows, seed=1)], ignore_index=True)
+    for values in (series, as_ingested(series)):
+        expected = values.apply(time_to_seconds).to_numpy()
+        actual = durations_to_seconds(values).to_numpy()
+        bad = np.flatnonzero(expected != actual)
+        if len(bad):
+            examples = [(values.iloc[i], expected[i], actual[i]) for i in bad[:5]]
+            raise AssertionError(f"Duration parity failed on {len(bad)} values, e.g. (input, expected, got): {examples}")
+    print(f"Parity OK: durations_to_seconds matches time_to_seconds on {len(series)} values.")
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    check_parity()
+    print(f"{'rows':>10} | {'vectorized rows/s':>18} | {'apply rows/s':>14} | {'speedup':>8}")
+    for n_rows in args.sizes:
+        series = as_ingested(make_series(n_rows))
+        fast = best_of(lambda: durations_to_seconds(series), args.repeat)
+        slow = best_of(lambda: series.apply(time_to_seconds), 1)
+        print(f"{n_rows:>10,} | {n_rows / fast:>18,.0f} | {n_rows / slow:>14,.0f} | {slow / fast:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""End-to-end ingestion benchmark on synthetic GRD files (benchmarks/generate_grd.py).
+
+For each size, a generated file is ingested with process_csv_file into a fresh scratch SQLite
+database. Each run happens in its own Python process, so peak RSS is per run. The report
+shows per-stage wall times (hash, read, column clean, type align, KPI calc, insert, rollup), rows/s,
+CPU time and peak RSS; the JSON also has CPU time, rows and peak memory per stage. Results are written to JSON; pass an earlier file to --compare to see
+the rows/s change per size.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --sizes 10000 100000 1000000 10000000 --json run.json
+    python -m benchmarks.bench_ingest --compare run.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from backend.config import Config
+from benchmarks.generate_grd import grd_file_name, write_grd_csv
+
+
+def peak_rss_mib():
+    """Peak resident set size of this process so far, or None where unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KiB on Linux
+
+
+def run_one(file_path, db_path, chunksize, mode):
+    """Ingests one file into a new database and returns the measurements (child process side)."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend.schema import init_db
+    from backend.ingest_stats import INGEST_STAGES
+    from backend.utilities import process_csv_file
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    init_db(engine)
+    session = sessionmaker(bind=engine)()
+    stage_stats = {}
+    try:
+        wall, cpu = time.perf_counter(), time.process_time()
+        rows = process_csv_file(file_path, session, chunksize=chunksize, mode=mode, stage_stats=stage_stats)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        session.close()
+        engine.dispose()
+    return {
+        'rows': rows,
+        'seconds': wall,
+        'cpu_seconds': cpu,
+        'rows_per_second': rows / wall if wall else None,
+        # timed_stage resets the kernel's high-water mark at each stage on Linux, so ru_maxrss
+        # only covers the time since the last stage started; the stages hold the rest
+        'peak_rss_mib': max((peak for peak in [peak_rss_mib(), *(s['peak_rss_mib'] for s in stage_stats.values())]
+                             if peak is not None), default=None),
+        'stages': {stage: stage_stats[stage] for stage in INGEST_STAGES if stage in stage_stats},
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Config.PROJECT_ROOT, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import numpy, pandas, sqlalchemy
+    return {
+        'git_commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+        'cpu_count': os.cpu_count(), 'pandas': pandas.__version__, 'numpy': numpy.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+    }
+
+
+def print_report(results):
+    stages = list(results[0]['stages'])
+    print(f"{'rows':>10} | {'rows/s':>9} | {'wall s':>7} | {'cpu s':>7} | {'RSS MiB':>7} | " + ' | '.join(f"{s:>6}" for s in stages))
+    for r in results:
+        rss = f"{r['peak_rss_mib']:>7.0f}" if r['peak_rss_mib'] is not None else f"{'-':>7}"
+        print(f"{r['rows']:>10,} | {r['rows_per_second']:>9,.0f} | {r['seconds']:>7.2f} | {r['cpu_seconds']:>7.2f} | {rss} | "
+              + ' | '.join(f"{r['stages'][s]['seconds']:>6.2f}" for s in stages))
+
+
+def print_comparison(results, previous_path):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    before_by_size = {r['size']: r for r in previous['results']}
+    print(f"\nrows/s compared with {previous_path} (commit {previous['environment'].get('git_commit')}):")
+    for r in results:
+        before = before_by_size.get(r['size'])
+        if before:
+            change = r['rows_per_second'] / before['rows_per_second'] - 1
+            print(f"{r['size']:>10,} | {before['rows_per_second']:>9,.0f} -> {r['rows_per_second']:>9,.0f} ({change:+.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'grd_bench'),
+                        help="Where generated files are kept (reused across runs)")
+    parser.add_argument('--chunksize', type=int, default=Config.INGEST_CHUNK_SIZE)
+    parser.add_argument('--mode', choices=['upsert', 'append'], default=Config.INGEST_MODE)
+    parser.add_argument('--json', help="Results file (default: instance/benchmarks/ingest_<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier results JSON to compare rows/s against")
+    parser.add_argument('--run-one', nargs=2, metavar=('CSV', 'DB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        # Child process: print the measurements as JSON on the last line
+        print(json.dumps(run_one(*args.run_one, args.chunksize, args.mode)))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            file_path = os.path.join(args.data_dir, grd_file_name(size))
+            if not os.path.exists(file_path):
+                print(f"Generating {size:,} rows -> {file_path}")
+                write_grd_csv(file_path, size)
+            db_path = os.path.join(workdir, f"bench_{size}.sqlite")
+            child = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_ingest', '--run-one', file_path, db_path,
+                 '--chunksize', str(args.chunksize), '--mode', args.mode],
+                capture_output=True, text=True, cwd=Config.PROJECT_ROOT)
+            if child.returncode != 0:
+                sys.exit(f"Ingesting {file_path} failed:\n{child.stderr[-2000:]}")
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append({'size': size, 'file_mib': os.path.getsize(file_path) / 2**20, **result})
+            os.remove(db_path)
+
+    print_report(results)
+    if args.compare:
+        print_comparison(results, args.compare)
+
+    json_path = args.json or os.path.join(Config.INSTANCE_PATH, 'benchmarks', f"ingest_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'chunksize': args.chunksize,
+                   'mode': args.mode, 'environment': environment(), 'results': results}, f, indent=2)
+    print(f"\nResults written to {json_path}")
+
+
+if __name__ == '__main__':
+    main()
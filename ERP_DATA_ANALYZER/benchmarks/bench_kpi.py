@@ -0,0 +1,96 @@
+"""Parity check and throughput benchmark for the columnar KPI engine (backend/kpi.py).
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_kpi
+    python -m benchmarks.bench_kpi --sizes 10000 100000 1000000 --legacy-max 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.kpi import KPI_COLUMNS, compute_kpis
+from backend.utilities import (calc_availability, calc_quality_rate, calc_performance,
+                               calc_oee_new, calc_shift_type)
+
+
+def make_frame(n_rows, seed=0):
+    """Builds a frame shaped like the type-aligned ingestion frame, including the
+    edge cases the calc_* functions special-case (zeros, NA, loss > plan, rejects > output)."""
+    rng = np.random.default_rng(seed)
+    plan = rng.integers(0, 12 * 3600, n_rows)
+    plan[rng.random(n_rows) < 0.1] = 0
+    loss = rng.integers(0, 13 * 3600, n_rows)
+    run = np.maximum(plan - loss, 0)
+    run[rng.random(n_rows) < 0.05] = rng.integers(1, 3600)
+    output = pd.array(rng.integers(0, 500, n_rows), dtype='Int64')
+    output[rng.random(n_rows) < 0.05] = pd.NA
+    reject = pd.array(rng.integers(0, 20, n_rows), dtype='Int64')
+    reject[rng.random(n_rows) < 0.3] = pd.NA
+    ct = pd.array(rng.choice([0.0, 12.5, 45.0, 120.0, 300.0, 900.0], n_rows), dtype='Float64')
+    return pd.DataFrame({
+        'plan_time': pd.array(plan, dtype='Int64'),
+        'loss_time': pd.array(loss, dtype='Int64'),
+        'actual_run_time': pd.array(run, dtype='Int64'),
+        'output_quantity': output,
+        'rejection_qty': reject,
+        'current_c_t': ct,
+    })
+
+
+def legacy_kpis(df):
+    """The row-wise df.apply path process_csv_file used before backend/kpi.py."""
+    df['availability'] = df.apply(lambda row: calc_availability(row.get('plan_time'), row.get('loss_time')), axis=1)
+    df['quality_rate'] = df.apply(lambda row: calc_quality_rate(row.get('output_quantity'), row.get('rejection_qty')), axis=1)
+    df['performance'] = df.apply(lambda row: calc_performance(row.get('output_quantity'), row.get('current_c_t'), row.get('actual_run_time')), axis=1)
+    df['oee_new'] = df.apply(lambda row: calc_oee_new(row.get('availability'), row.get('performance'), row.get('quality_rate')), axis=1)
+    df['shift_type'] = df.apply(lambda row: calc_shift_type(row.get('actual_run_time')), axis=1)
+    return df
+
+
+def check_parity(n_rows=5000, seed=1):
+    """Asserts the columnar engine matches the scalar calc_* functions exactly."""
+    base = make_frame(n_rows, seed)
+    expected = legacy_kpis(base.copy())
+    actual = compute_kpis(base.copy())
+    for col in KPI_COLUMNS:
+        mismatches = int((expected[col].to_numpy() != actual[col].to_numpy()).sum())
+        if mismatches:
+            raise AssertionError(f"KPI parity failed for '{col}': {mismatches} of {n_rows} rows differ")
+    print(f"Parity OK: {len(KPI_COLUMNS)} KPI columns identical to calc_* on {n_rows} rows.")
+
+
+def time_call(func, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max', type=int, default=10_000,
+                        help="Skip the row-wise path above this many rows (it runs at ~1-2k rows/s).")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    check_parity()
+    print(f"{'rows':>10} | {'columnar rows/s':>16} | {'row-wise rows/s':>16} | {'speedup':>8}")
+    for n_rows in args.sizes:
+        df = make_frame(n_rows)
+        fast = time_call(compute_kpis, df, args.repeat)
+        if n_rows <= args.legacy_max:
+            slow = time_call(legacy_kpis, df, 1)
+            slow_col, speedup = f"{n_rows / slow:>16,.0f}", f"{slow / fast:>7.0f}x"
+        else:
+            slow_col, speedup = f"{'skipped':>16}", f"{'-':>8}"
+        print(f"{n_rows:>10,} | {n_rows / fast:>16,.0f} | {slow_col} | {speedup}")
+
+
+if __name__ == '__main__':
+    main()
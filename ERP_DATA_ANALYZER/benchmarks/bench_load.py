@@ -0,0 +1,118 @@
+"""Compares the executemany loader (utilities.load_frame) with the old ORM bulk_insert_mappings path.
+
+Prepares the GRD files once, then times only the database write stage into an empty scratch
+SQLite table and records peak Python memory allocated while writing (tracemalloc). Also checks that
+every path stores the same rows.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_load --copies 10 --batch-sizes 1000 5000 20000
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import Config
+from backend.models import Dimension, ProductionRecordGRD
+from backend.queries import named_query
+from backend.utilities import load_frame, source_columns
+from benchmarks.bench_upsert import load_frames, make_engine
+
+
+def dimension_ids(db_session, field, values) -> dict:
+    """{value: dimensions id} of a field's values, adding the new ones."""
+    values = set(values.fillna(''))
+    db_session.execute(insert(Dimension).on_conflict_do_nothing(), [{'field': field, 'value': value} for value in values])
+    return dict(db_session.query(Dimension.value, Dimension.id).filter(Dimension.field == field, Dimension.value.in_(values)).all())
+
+
+def legacy_insert(df_final, model, db_session):
+    """The write stage process_csv_file used before load_frame: one dict per row through the ORM.
+    Dimension values are swapped for their ids first, which the table stores now, and the ISO
+    posting_date strings for the datetime.date values its Date column binds."""
+    df_final = df_final.assign(**{f"{field}_id": df_final[field].fillna('').map(dimension_ids(db_session, field, df_final[field]))
+                                  for field in model.DIMENSIONS}).drop(columns=list(model.DIMENSIONS))
+    df_final['posting_date'] = pd.to_datetime(df_final['posting_date'], format='%Y-%m-%d').dt.date
+    records = df_final.where(pd.notna(df_final), None).to_dict('records')
+    db_session.bulk_insert_mappings(model, records)
+    return len(records)
+
+
+def timed_write(engine, frames, write, trace=False):
+    """Writes every frame in one transaction. Returns (rows, seconds, peak traced bytes or None).
+    tracemalloc slows allocation-heavy code a lot, so time and memory are measured in separate runs."""
+    session = sessionmaker(bind=engine)()
+    try:
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        written = sum(write(frame, session) for frame in frames)
+        session.commit()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+        session.close()
+    return written, elapsed, peak
+
+
+def table_rows(engine):
+    """The stored rows with dimension names rather than ids (ids depend on insertion order)."""
+    session = sessionmaker(bind=engine)()
+    try:
+        query = named_query(session, ProductionRecordGRD, list(source_columns(ProductionRecordGRD)))
+        return [tuple(row) for row in query.order_by(ProductionRecordGRD.id)]
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help="GRD CSV files (default: the upload folder)")
+    parser.add_argument('--copies', type=int, default=3, help="Replicate the data N times with distinct keys")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[Config.INGEST_BATCH_SIZE])
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(Config.UPLOAD_FOLDER, '*_GRD.csv')))
+    if not paths:
+        parser.error("No GRD CSV files found.")
+    frames = load_frames(paths, args.copies)
+    print(f"Prepared {sum(len(f) for f in frames):,} rows from {len(paths)} file(s) x {args.copies} copies.")
+
+    runs = [('orm bulk_insert_mappings', None, False,
+             lambda frame, session: legacy_insert(frame, ProductionRecordGRD, session))]
+    for batch_size in args.batch_sizes:
+        for mode in ('append', 'upsert'):
+            runs.append((f"executemany {mode} b={batch_size}", mode, mode == 'upsert',
+                         lambda frame, session, m=mode, b=batch_size: load_frame(frame, ProductionRecordGRD, session, mode=m, batch_size=b)))
+
+    print(f"{'path':<32} | {'rows/s':>10} | {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        reference = None
+        for i, (label, mode, natural_key, write) in enumerate(runs):
+            engine = make_engine(workdir, f"mem{i}.sqlite", natural_key)
+            _, _, peak = timed_write(engine, frames, write, trace=True)
+            engine.dispose()
+            engine = make_engine(workdir, f"run{i}.sqlite", natural_key)
+            written, elapsed, _ = timed_write(engine, frames, write)
+            print(f"{label:<32} | {written / elapsed:>10,.0f} | {peak / 2**20:>9.1f}")
+            rows = table_rows(engine)
+            engine.dispose()
+            if reference is None:
+                reference = rows
+            # Upsert keeps one row per natural key, so its rows must be a subset of the appended ones
+            elif (rows != reference) if mode != 'upsert' else not set(rows) <= set(reference):
+                raise AssertionError(f"'{label}' stored different rows than the ORM path")
+    print("Parity OK: every path stored the same rows as the ORM path.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Reads and writes with SQLite's default pragmas vs the ones backend/database.py applies.
+
+For each setting, a synthetic GRD file is ingested into a new database, committing every chunk,
+followed by a series of small commits. Then the dashboard reads run against that database:
+the shared dataset load, daily averages, error rows and sidebar options. Last, the file is
+re-ingested in one transaction while another thread keeps running dashboard queries. This
+shows how long readers wait on the writer and how many of them fail with "database is locked".
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_sqlite
+    python -m benchmarks.bench_sqlite --rows 500000 --chunksize 20000
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import create_sqlite_engine, sqlite_pragmas
+from backend.dataset import KPI_METRICS, ProductionDataset
+from backend.models import FilterCatalog, ProductionRecordGRD
+from backend.queries import catalog_values, daily_averages, metric_errors
+from backend.schema import init_db
+from backend.utilities import process_csv_file
+from backend.versions import bump_data_version
+from benchmarks.generate_grd import grd_file_name, write_grd_csv
+
+SMALL_COMMITS = 200
+
+
+def dashboard_queries(session):
+    """One round of the queries the dashboards run on a page load (without caching)."""
+    for metric in KPI_METRICS:
+        daily_averages(session, ProductionRecordGRD, metric, valid_metrics=(metric,))
+        metric_errors(session, ProductionRecordGRD, metric, ['id', 'posting_date', 'machine_no', metric])
+    for field in FilterCatalog.FIELDS:
+        catalog_values(session, field)
+
+
+def timed(function, repeat=1):
+    """Best wall time of `repeat` calls."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_setting(csv_path, db_path, pragmas, chunksize, repeat):
+    engine = create_sqlite_engine(f"sqlite:///{db_path}", pragmas=pragmas)
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    results = {}
+
+    def ingest(**kwargs):
+        session = Session()
+        try:
+            return process_csv_file(csv_path, session, chunksize=chunksize, force=True, **kwargs)
+        finally:
+            session.close()
+
+    results['ingest'] = timed(lambda: ingest(commit_per_chunk=True, resume=False))
+
+    def small_commits():
+        for _ in range(SMALL_COMMITS):
+            with engine.begin() as conn:
+                bump_data_version(conn, [])
+    results['small_commits'] = timed(small_commits)
+
+    engine.dispose() # Reads start from a cold pool, as after a restart
+    results['dataset_load'] = timed(lambda: ProductionDataset(engine).frame, repeat)
+
+    def queries():
+        session = Session()
+        try:
+            dashboard_queries(session)
+        finally:
+            session.close()
+    results['dashboard_queries'] = timed(queries, repeat)
+
+    # Readers during a long write transaction
+    latencies, failures = [], []
+    writing = threading.Event()
+    writing.set()
+
+    def reader():
+        while writing.is_set():
+            start = time.perf_counter()
+            try:
+                queries()
+                latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                failures.append(time.perf_counter() - start)
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        results['ingest_with_reader'] = timed(lambda: ingest(commit_per_chunk=False))
+    finally:
+        writing.clear()
+        thread.join()
+    results['reads_during_write'] = len(latencies)
+    results['max_read_seconds'] = max(latencies + failures, default=0.0)
+    results['locked_reads'] = len(failures)
+
+    with engine.connect() as conn:
+        results['journal_mode'] = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--chunksize', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=3, help="Read timings are the best of this many runs")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'grd_bench'),
+                        help="Where the generated file is kept (reused across runs)")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    csv_path = os.path.join(args.data_dir, grd_file_name(args.rows))
+    if not os.path.exists(csv_path):
+        print(f"Generating {csv_path}")
+        write_grd_csv(csv_path, args.rows)
+
+    settings = {'defaults': {}, 'tuned': sqlite_pragmas()}
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, pragmas in settings.items():
+            print(f"{name}: {', '.join(f'{k}={v}' for k, v in pragmas.items()) or 'SQLite defaults'}")
+            results[name] = run_setting(csv_path, os.path.join(workdir, f'{name}.sqlite'), pragmas, args.chunksize, args.repeat)
+
+    rows = [
+        ('ingest, commit per chunk (s)', 'ingest', '.2f'),
+        (f'{SMALL_COMMITS} small commits (s)', 'small_commits', '.2f'),
+        ('dataset load (s)', 'dataset_load', '.2f'),
+        ('dashboard queries (s)', 'dashboard_queries', '.3f'),
+        ('ingest, one transaction (s)', 'ingest_with_reader', '.2f'),
+        ('  reads completed meanwhile', 'reads_during_write', 'd'),
+        ('  slowest read (s)', 'max_read_seconds', '.2f'),
+        ('  reads failed: locked', 'locked_reads', 'd'),
+        ('journal mode', 'journal_mode', 's'),
+    ]
+    print(f"\n{args.rows:,} rows, chunks of {args.chunksize:,}")
+    print(f"{'':<30} | {'defaults':>10} | {'tuned':>10}")
+    for label, key, fmt in rows:
+        print(f"{label:<30} | {results['defaults'][key]:>10{fmt}} | {results['tuned'][key]:>10{fmt}}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Chunked ingestion through the staging table (backend/utilities.py) on a pooled engine.
+
+Staging uses a TEMP table, which only exists on the connection that created it. With
+commit_per_chunk the session hands its connection back to the pool at every commit and may
+take another one for the next chunk. This ingests a synthetic GRD file in several chunks,
+committing after each, on an engine whose pool already holds several idle connections (as
+the app's shared engine does once pages have read from it). It checks that every chunk is
+stored and that the table matches a whole-file ingest, and reports the time of both.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_staging
+    python -m benchmarks.bench_staging --rows 200000 --chunksize 20000 --pooled 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import create_sqlite_engine
+from backend.schema import init_db
+from backend.utilities import process_csv_file
+from benchmarks.bench_load import table_rows
+from benchmarks.generate_grd import write_grd_csv
+
+
+def ingest(db_path, file_path, pooled, **process_kwargs):
+    """Ingests the file into a new database after filling the pool with `pooled` idle
+    connections. Returns (engine, rows written, seconds)."""
+    engine = create_sqlite_engine(f"sqlite:///{db_path}")
+    init_db(engine)
+    connections = [engine.connect() for _ in range(pooled)]
+    for conn in connections:
+        conn.close() # Back to the pool, idle
+    session = sessionmaker(bind=engine)()
+    try:
+        start = time.perf_counter()
+        written = process_csv_file(file_path, session, **process_kwargs)
+        return engine, written, time.perf_counter() - start
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000, help="Rows in the ingested file")
+    parser.add_argument('--chunksize', type=int, default=1_500)
+    parser.add_argument('--pooled', type=int, default=3, help="Idle connections in the pool before ingesting")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        file_path = write_grd_csv(os.path.join(workdir, 'LOSS TIME STAGING_GRD.csv'), args.rows)
+        whole, whole_written, whole_seconds = ingest(os.path.join(workdir, 'whole.sqlite'), file_path, args.pooled,
+                                                     commit_per_chunk=False, chunksize=args.chunksize)
+        chunked, chunked_written, chunked_seconds = ingest(os.path.join(workdir, 'chunked.sqlite'), file_path, args.pooled,
+                                                           commit_per_chunk=True, chunksize=args.chunksize)
+        chunks = -(-args.rows // args.chunksize)
+        print(f"{args.rows:,} rows, {chunks} chunks of {args.chunksize:,}, {args.pooled} idle pooled connections")
+        print(f"whole file:        {whole_written:>9,} rows in {whole_seconds:6.2f}s")
+        print(f"commit per chunk:  {chunked_written:>9,} rows in {chunked_seconds:6.2f}s")
+        if chunked_written != args.rows or table_rows(chunked) != table_rows(whole):
+            raise AssertionError("Ingesting with commit_per_chunk did not store the same rows as a whole-file ingest.")
+        print("Parity OK: commit_per_chunk stored the same rows as a whole-file ingest.")
+        whole.dispose()
+        chunked.dispose()
+
+
+if __name__ == '__main__':
+    main()
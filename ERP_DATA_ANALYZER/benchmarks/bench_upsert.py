@@ -0,0 +1,89 @@
+"""Compares the natural-key upsert path with the old blind-append path.
+
+Prepares the GRD files once, then times only the database write stage on a scratch SQLite file:
+first load into an empty table, then re-ingesting the same (overlapping) data.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_upsert
+    python -m benchmarks.bench_upsert --copies 10 uploads/*.csv
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import Config
+from backend.models import Base, ProductionRecordGRD
+from backend.schema import init_db
+from backend.utilities import load_frame, prepare_frame
+
+
+def load_frames(paths, copies):
+    """Prepared frames for each file. Extra copies get distinct document numbers so they add
+    new natural keys rather than overlapping the originals."""
+    frames = []
+    for path in paths:
+        raw = pd.read_csv(path, encoding='utf-8', dtype=str, on_bad_lines='warn')
+        frame = prepare_frame(raw, ProductionRecordGRD, os.path.basename(path))
+        for copy_no in range(copies):
+            copy = frame.copy()
+            if copy_no:
+                copy['document_no'] = copy['document_no'].astype(str) + f"-C{copy_no}"
+            frames.append(copy)
+    return frames
+
+
+def make_engine(workdir, name, natural_key):
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, name)}")
+    if natural_key:
+        init_db(engine)
+    else:
+        # Schema before the natural key: no unique index, so nothing stops duplicates
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS uq_prodrecgrd_natural_key"))
+    return engine
+
+
+def timed_load(engine, frames, mode):
+    session = sessionmaker(bind=engine)()
+    try:
+        start = time.perf_counter()
+        written = sum(load_frame(frame, ProductionRecordGRD, session, mode=mode) for frame in frames)
+        session.commit()
+        elapsed = time.perf_counter() - start
+        rows = session.query(ProductionRecordGRD).count()
+    finally:
+        session.close()
+    return written, elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help="GRD CSV files (default: the upload folder)")
+    parser.add_argument('--copies', type=int, default=1, help="Replicate the data N times with distinct keys")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(Config.UPLOAD_FOLDER, '*_GRD.csv')))
+    if not paths:
+        parser.error("No GRD CSV files found.")
+    frames = load_frames(paths, args.copies)
+    print(f"Prepared {sum(len(f) for f in frames):,} rows from {len(paths)} file(s) x {args.copies} copies.")
+
+    print(f"{'path':<8} | {'pass':<22} | {'rows/s':>10} | {'rows in table':>13}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, natural_key in (('append', False), ('upsert', True)):
+            engine = make_engine(workdir, f"{label}.sqlite", natural_key)
+            for pass_name in ('initial load', 're-ingest (overlap)'):
+                written, elapsed, rows = timed_load(engine, frames, label)
+                print(f"{label:<8} | {pass_name:<22} | {written / elapsed:>10,.0f} | {rows:>13,}")
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
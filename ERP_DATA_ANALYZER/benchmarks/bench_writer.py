@@ -0,0 +1,134 @@
+"""Concurrent ingestion and dashboard reads: separate writer sessions vs the single writer.
+
+Two threads stand in for the uploader and the folder monitor. Each ingests its own synthetic
+GRD file while reader threads keep running the dashboard queries. Before backend/writer.py,
+each entry point wrote through its own session. The second writer then waited on SQLite's
+lock and could fail with "database is locked". Now both submit to one DatabaseWriter. The
+benchmark reports write results, lock errors and read throughput for both setups, on WAL
+databases (backend/database.py).
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.bench_writer
+    python -m benchmarks.bench_writer --rows 200000 --readers 4 --busy-timeout 1
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend.batch import ingest_files
+from backend.database import create_sqlite_engine
+from backend.schema import init_db
+from backend.writer import DatabaseWriter
+from benchmarks.bench_sqlite import dashboard_queries
+from benchmarks.generate_grd import write_grd_csv
+
+
+def direct_ingest(engine, file_paths):
+    """The old entry points: every file through a session of its own thread."""
+    results = {}
+
+    def write(file_path):
+        session = sessionmaker(bind=engine)()
+        try:
+            # max_workers=1: both threads in one process, as app.py and the monitor were
+            results[file_path] = ingest_files([file_path], session, max_workers=1)[0]
+        finally:
+            session.close()
+    threads = [threading.Thread(target=write, args=(path,)) for path in file_paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[path] for path in file_paths]
+
+
+def queued_ingest(writer, file_paths):
+    """The entry points now: each thread submits its file to the writer and waits."""
+    jobs = {}
+
+    def submit(file_path):
+        jobs[file_path] = writer.ingest([file_path], max_workers=1)
+    threads = [threading.Thread(target=submit, args=(path,)) for path in file_paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [jobs[path].result()[0] for path in file_paths]
+
+
+def run(name, db_path, file_paths, readers, busy_timeout):
+    url = f"sqlite:///{db_path}"
+    engine = create_sqlite_engine(url, connect_args={'timeout': busy_timeout})
+    init_db(engine)
+    reads, read_errors = [], []
+    writing = threading.Event()
+    writing.set()
+
+    def reader():
+        session = sessionmaker(bind=engine)()
+        try:
+            while writing.is_set():
+                start = time.perf_counter()
+                try:
+                    dashboard_queries(session)
+                    reads.append(time.perf_counter() - start)
+                except OperationalError as e:
+                    read_errors.append(str(e.orig))
+                    session.rollback()
+        finally:
+            session.close()
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    try:
+        if name == 'direct':
+            results = direct_ingest(engine, file_paths)
+        else:
+            writer = DatabaseWriter(url, connect_args={'timeout': busy_timeout})
+            results = queued_ingest(writer, file_paths)
+    finally:
+        elapsed = time.perf_counter() - start
+        writing.clear()
+        for thread in threads:
+            thread.join()
+    engine.dispose()
+    return {
+        'seconds': elapsed,
+        'written': sum(r['status'] == 'success' for r in results),
+        'failed': [r['error'] for r in results if r['status'] == 'failed'],
+        'reads': len(reads),
+        'slowest_read': max(reads, default=0.0),
+        'read_errors': read_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help="Rows per ingested file")
+    parser.add_argument('--readers', type=int, default=2, help="Dashboard reader threads")
+    parser.add_argument('--busy-timeout', type=float, default=5.0,
+                        help="Seconds a connection waits for a lock before 'database is locked' (sqlite3 default: 5)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Two files with different seeds, as from two exports
+        file_paths = [write_grd_csv(os.path.join(workdir, f'LOSS TIME ENTRY-{n}_GRD.csv'), args.rows, seed=n)
+                      for n in (1, 2)]
+        print(f"{len(file_paths)} files of {args.rows:,} rows, {args.readers} reader threads, busy timeout {args.busy_timeout}s")
+        for name in ('direct', 'queued'):
+            r = run(name, os.path.join(workdir, f'{name}.sqlite'), file_paths, args.readers, args.busy_timeout)
+            print(f"{name:>7}: {r['written']}/{len(file_paths)} files written in {r['seconds']:.1f}s, "
+                  f"{len(r['failed'])} failed; {r['reads']} dashboard reads (slowest {r['slowest_read']:.2f}s), "
+                  f"{len(r['read_errors'])} read errors")
+            for error in sorted(set(r['failed'] + r['read_errors'])):
+                print(f"         {error}")
+
+
+if __name__ == '__main__':
+    main()
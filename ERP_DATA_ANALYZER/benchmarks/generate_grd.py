@@ -0,0 +1,141 @@
+"""Synthetic LOSS TIME *_GRD.csv generator for ingestion benchmarks.
+
+Files use the real export header verbatim: UTF-8 BOM, trailing spaces in several names and the
+'Rejection Reson' typo. Rows mimic the sample exports: about half are production rows (shift
+times, plan/run/loss durations, OEE) and half are loss-reason rows with empty times, with
+blanks where the exports have them. Every row has a distinct natural key, so upserting a
+generated file stores all of its rows.
+
+Usage (from the ERP_DATA_ANALYZER folder):
+    python -m benchmarks.generate_grd 100000 /tmp/grd_bench
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+HEADER = [
+    'Posting Date ', 'Document No ', 'Order No ', 'Item No ', 'Operation No ', 'Operation Description ',
+    'Order Line No', 'Type', 'Machine No', 'Current C/T', 'Output Quantity', 'Rejection Qty',
+    'Rejection Reson', 'Re Work Qty ', 'Re Work Reason', 'Work Shift Code', 'Start Time', 'End Time',
+    'Plan time', 'Actual Run Time', 'Loss Time', 'Remarks', 'Operator Name', 'Loss time should be',
+    'OEE', 'Reason Code', 'Reason Time hm ', 'Loss Time Remark',
+]
+
+OPERATIONS = ['IR BORE(R)', 'IR BORE(F)', 'IR KBORE(R)', 'IR KBORE(F)', 'OR TRK(R)', 'OR TRK(F)',
+              'IR TRK(R)', 'IR TRK(F)', 'OR OD(R)', 'OR OD(F)', 'FOR NOT RUN M/C']
+MACHINES = [f"B-{n}" for n in range(1, 11)] + [f"TR-{n}" for n in range(1, 11)] + [f"OD-{n}" for n in range(1, 11)]
+SHIFTS = {'A': ('06:00:00', '14:30:00'), 'B': ('14:30:00', '23:00:00'), 'C': ('23:00:00', '06:00:00'),
+          'DAY': ('09:00:00', '18:00:00'), 'NIGHT': ('18:00:00', '06:00:00')}
+REASONS = ['Re Setting', 'No Operator', 'Power Cut', 'Setting', 'Tool/bit Change', 'Feeding',
+           'Maintenance', 'No Material', 'Quality Issue', 'Trial', 'Dressing', 'Other']
+REMARKS = ['NEW SETTING ', 'FINISHING PRO', 'WHEEL CHANGE', 'TAPER PRO', 'FEEDING', 'NEW SETTING', '']
+CYCLE_TIMES = ['10', '60', '120', '240', '250', '300', '12.5']
+
+
+def _formatted(values, fmt):
+    """fmt.format() of each value, formatting every distinct value only once."""
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.array([fmt.format(v) for v in uniques], dtype=object)[inverse]
+
+
+def _clock(seconds):
+    """Integer seconds -> 'HH:MM:SS' strings."""
+    uniques, inverse = np.unique(seconds, return_inverse=True)
+    return np.array([f"{v // 3600:02d}:{v % 3600 // 60:02d}:{v % 60:02d}" for v in uniques], dtype=object)[inverse]
+
+
+def make_rows(n_rows, start=0, seed=0, month='2024-08'):
+    """Builds rows start..start+n_rows as a DataFrame of strings ('' = blank cell)."""
+    rng = np.random.default_rng(seed + start)
+    idx = np.arange(start, start + n_rows)
+    production = rng.random(n_rows) < 0.5
+    n_prod = int(production.sum())
+
+    days = (pd.Timestamp(f"{month}-01") + pd.to_timedelta(np.arange(28), unit='D')).strftime('%d-%m-%Y')
+    shift_idx = rng.choice(len(SHIFTS), n_rows, p=[0.35, 0.3, 0.2, 0.1, 0.05])
+    shift_codes = np.array(list(SHIFTS), dtype=object)[shift_idx]
+    blank = np.full(n_rows, '', dtype=object)
+
+    frame = pd.DataFrame({
+        'Posting Date ': days.to_numpy(dtype=object)[rng.integers(0, 28, n_rows)],
+        'Document No ': pd.Series(idx // 8).map('RELP{:07d}'.format),
+        'Item No ': rng.choice(['SFGD23238IRM', 'SFGD22316ORS', 'SFGD22222IRS', 'SFGD24030IRM', 'XYZ'], n_rows),
+        'Operation No ': ((idx % 8) + 1) * 10,
+        'Operation Description ': rng.choice(OPERATIONS, n_rows),
+        'Order Line No': 10000,
+        'Type': 'Machine Centre',
+        'Machine No': rng.choice(MACHINES, n_rows),
+        'Current C/T': rng.choice(CYCLE_TIMES, n_rows),
+        'Output Quantity': rng.integers(0, 400, n_rows),
+        'Rejection Qty': np.where(rng.random(n_rows) < 0.9, 0, rng.integers(1, 8, n_rows)),
+        'Rejection Reson': blank,
+        'Re Work Qty ': np.where(rng.random(n_rows) < 0.8, 0, rng.integers(1, 30, n_rows)),
+        'Re Work Reason': blank,
+        'Work Shift Code': shift_codes,
+        'Operator Name': _formatted(rng.integers(12000, 12120, n_rows), 'GD-OPERATOR-{}'),
+    })
+    frame.insert(2, 'Order No ', frame['Document No '])
+
+    # Production rows: shift window, plan/run/loss durations and the export's OEE columns
+    plan = rng.choice([1800, 3600, 5400, 7200, 23400, 28800], n_prod)
+    loss = np.where(rng.random(n_prod) < 0.6, 0, (rng.random(n_prod) * plan).astype(int) // 600 * 600)
+    run = plan - loss
+    shift_of_prod = shift_idx[production]
+    for col, values in (
+        ('Start Time', np.array([start for start, _ in SHIFTS.values()], dtype=object)[shift_of_prod]),
+        ('End Time', np.array([end for _, end in SHIFTS.values()], dtype=object)[shift_of_prod]),
+        ('Plan time', _clock(plan)),
+        ('Actual Run Time', _clock(run)),
+        ('Loss Time', np.where(loss > 0, _clock(loss), '')),
+        ('Loss time should be', _formatted(np.round(loss / 3600, 9), '{:.10g}')),
+        ('OEE', _formatted(np.round(run / plan * 100, 8), '{:.10g}')),
+    ):
+        column = blank.copy()
+        column[production] = values
+        frame[col] = column
+    frame['Remarks'] = np.where(rng.random(n_rows) < 0.01, 'REWORK', '')
+
+    # Loss-reason rows: reason code, reason duration and a free-text remark
+    n_loss = n_rows - n_prod
+    for col, values in (
+        ('Reason Code', rng.choice(REASONS, n_loss)),
+        ('Reason Time hm ', _clock(rng.choice([600, 1200, 1800, 3600, 7200, 28800], n_loss))),
+        ('Loss Time Remark', rng.choice(REMARKS, n_loss)),
+    ):
+        column = blank.copy()
+        column[~production] = values
+        frame[col] = column
+
+    return frame[HEADER]
+
+
+def write_grd_csv(path, n_rows, seed=0, block_rows=500_000):
+    """Writes a synthetic GRD export of n_rows rows, generated in blocks to bound memory."""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write(','.join(HEADER) + '\n')
+        for start in range(0, n_rows, block_rows):
+            make_rows(min(block_rows, n_rows - start), start, seed).to_csv(f, header=False, index=False, lineterminator='\n')
+    return path
+
+
+def grd_file_name(n_rows):
+    return f"LOSS TIME SYNTHETIC-{n_rows}_GRD.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', type=int, nargs='+', help="Rows per generated file")
+    parser.add_argument('out_dir', help="Folder for the generated files")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for n_rows in args.rows:
+        path = write_grd_csv(os.path.join(args.out_dir, grd_file_name(n_rows)), n_rows, args.seed)
+        print(f"Wrote {n_rows:,} rows to {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()
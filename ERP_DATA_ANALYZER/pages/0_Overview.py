@@ -1,20 +1,22 @@
 import streamlit as st
 from sqlalchemy.orm import Session
-from backend.models import ProductionRecordGRD
+from backend.models import KpiDailyRollup
 from backend.config import Config
+from backend.database import get_engine, get_sessionmaker
+from backend.queries import catalog_values, date_bounds, filtered_query
+from backend.versions import month_versions, range_version, split_by_month
 import pandas as pd
 import altair as alt
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import func
 import math
 
 logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
 try:
-    engine_grd = create_engine(Config.SQLALCHEMY_BINDS['grd'])
-    SessionLocal = sessionmaker(binds={ProductionRecordGRD: engine_grd})
+    engine_grd = get_engine() # Creates/backfills kpi_daily_rollup on databases from older versions (init_db)
+    SessionLocal = get_sessionmaker()
     logger.info("Database engine created successfully for Overview page.")
 except Exception as e:
     logger.error(f"Error creating database engine: {e}", exc_info=True)
@@ -61,59 +63,50 @@ st.markdown("Monthly average of KPIs (0-100%). Use filters in the sidebar.")
 st.markdown("---")
 
 # --- Data Fetching ---
-@st.cache_data(ttl=600)
-def fetch_overview_data(_session):
+# Everything is read from kpi_daily_rollup (backend/rollup.py), restricted to groups with at
+# least one row whose four KPIs are all within 0-100. Sidebar filters become SQL conditions
+# (backend/queries.py) and months are summed in SQL, so one row per month reaches pandas.
+METRICS = ["oee_new", "availability", "performance", "quality_rate"]
+VALID_GROUPS = (KpiDailyRollup.all_valid_count > 0,)
+
+# Cached results are keyed on the data version of the months they cover (backend/versions.py).
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_date_bounds(_session, version):
+    return date_bounds(_session, KpiDailyRollup, where=VALID_GROUPS)
+
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_filter_options(_session, column, date_range, version):
+    """{dimension id: name} of the values with valid rows in the months of the date range, from
+    the filter catalog. The sidebar shows the names and filters on the ids."""
+    return catalog_values(_session, column, *date_range, count_column="all_valid_count")
+
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_month_overview(_session, filters, version):
+    """KPI sums over the valid rows of one month (split_by_month) matching the filters."""
+    month = func.strftime('%Y-%m', KpiDailyRollup.posting_date).label("month")
+    columns = [month, func.sum(KpiDailyRollup.all_valid_count).label("all_valid_count")]
+    columns += [func.sum(getattr(KpiDailyRollup, f"{metric}_all_valid_sum")).label(metric) for metric in METRICS]
+    data = filtered_query(_session, KpiDailyRollup, columns, where=VALID_GROUPS, **filters).group_by(month).all()
+    return pd.DataFrame(data, columns=["month", "all_valid_count", *METRICS])
+
+def fetch_overview_data(session, filters, versions):
+    """Monthly KPI averages over the valid rows matching the filters: sum / count of the rollup
+    groups, which equals the mean over the valid raw rows without loading them. Each month is
+    cached on its own, so new data only re-queries the months it touched."""
     try:
-        # Fetch relevant columns including operator name
-        query = _session.query(
-            ProductionRecordGRD.posting_date,
-            ProductionRecordGRD.machine_no,
-            ProductionRecordGRD.work_shift_code,
-            ProductionRecordGRD.operator_name, # <-- Added Operator Name
-            ProductionRecordGRD.oee_new,
-            ProductionRecordGRD.availability,
-            ProductionRecordGRD.performance,
-            ProductionRecordGRD.quality_rate
-            )
-        data = query.all()
+        months = [fetch_month_overview(session, month_filters, version)
+                  for month_filters, version in split_by_month(filters, versions)]
+        df = pd.concat(months, ignore_index=True) if months else pd.DataFrame()
 
-        if not data:
-            logger.warning("No data found for overview.")
+        if df.empty:
+            logger.warning("No valid data (0-100) matches the overview filters.")
             return pd.DataFrame()
 
-        df = pd.DataFrame(data)
-        logger.info(f"Fetched {len(df)} records for overview.")
-
-        if "posting_date" in df.columns:
-            df["posting_date"] = pd.to_datetime(df["posting_date"], format="%d-%m-%Y", dayfirst=True, errors="coerce")
-            df = df.dropna(subset=["posting_date"])
-        else:
-            st.warning("Required column 'posting_date' is missing.")
-            return pd.DataFrame()
-
-        required_cols = ["oee_new", "availability", "performance", "quality_rate"]
-        existing_cols = [col for col in required_cols if col in df.columns]
-        if len(existing_cols) < len(required_cols):
-             missing = list(set(required_cols) - set(existing_cols))
-             logger.warning(f"Missing KPI columns for overview: {missing}")
-             # Don't display warning here, handle empty state later if needed
-             # st.warning(f"Missing KPI columns: {', '.join(missing)}")
-        if not existing_cols: return pd.DataFrame() # Return empty if no metrics exist
-
-        # Convert metrics to numeric, coercing errors to NaN
-        valid_df = df.copy()
-        for col in existing_cols:
-             valid_df[col] = pd.to_numeric(valid_df[col], errors='coerce')
-             # Filter for valid data (0 to 100 range, inclusive) before grouping
-             valid_df = valid_df[valid_df[col].between(0, 100, inclusive="both")]
-
-        if valid_df.empty:
-             logger.warning("No valid data (0-100) found after filtering for overview.")
-             # Return empty so filters don't try to operate on it
-             return pd.DataFrame()
-
-        logger.info(f"{len(valid_df)} valid records remain for overview calculation.")
-        return valid_df
+        for metric in METRICS:
+            df[metric] = df[metric] / df["all_valid_count"]
+        df["month_year"] = pd.to_datetime(df["month"], format="%Y-%m").dt.strftime("%b, %y")
+        logger.info(f"Fetched {len(df)} months ({df['all_valid_count'].sum()} valid records) for overview.")
+        return df
 
     except Exception as e:
         logger.error(f"Error fetching/processing overview data: {e}", exc_info=True)
@@ -121,83 +114,63 @@ def fetch_overview_data(_session):
         return pd.DataFrame()
 
 # --- Sidebar Filters ---
+# The date range narrows the options (filter_catalog); every selection narrows the averages
 st.sidebar.header("Filters")
+filters = {}
 try:
     session = SessionLocal()
-    df = fetch_overview_data(session)
-finally:
-    session.close()
+    versions = month_versions(session)
+    min_date, max_date = fetch_date_bounds(session, range_version(versions))
+    data_available = min_date is not None
+    if data_available:
+        date_range = st.sidebar.date_input(
+            "Select Date Range", value=(min_date, max_date), min_value=min_date, max_value=max_date,
+            key="overview_date_range"
+        )
+        if len(date_range) == 2:
+            filters["start_date"], filters["end_date"] = date_range
+        date_filters = (filters.get("start_date"), filters.get("end_date"))
+        filters_version = range_version(versions, *date_filters)
 
-df_filtered = df.copy()
-
-if not df_filtered.empty:
-    # Date Range Filter
-    min_date = df_filtered["posting_date"].min().date()
-    max_date = df_filtered["posting_date"].max().date()
-    date_range = st.sidebar.date_input(
-        "Select Date Range", value=(min_date, max_date), min_value=min_date, max_value=max_date,
-        key="overview_date_range"
-    )
-    if len(date_range) == 2:
-        start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-        df_filtered = df_filtered[(df_filtered["posting_date"] >= start_date) & (df_filtered["posting_date"] <= end_date)]
-
-    # Machine Filter
-    if "machine_no" in df_filtered.columns:
-        unique_machines = sorted(df_filtered["machine_no"].dropna().unique())
-        default_machines = unique_machines if unique_machines else []
+        # Machine Filter
+        unique_machines = fetch_filter_options(session, "machine_no", date_filters, filters_version)
         selected_machines = st.sidebar.multiselect(
-            "Select Machines", options=unique_machines, default=default_machines,
-            key="overview_machines"
+            "Select Machines", options=list(unique_machines), default=list(unique_machines),
+            format_func=unique_machines.get, key="overview_machines"
         )
         if selected_machines:
-            df_filtered = df_filtered[df_filtered["machine_no"].isin(selected_machines)]
+            filters["machines"] = tuple(selected_machines)
 
-    # Shift Filter
-    if "work_shift_code" in df_filtered.columns:
-        unique_shifts = sorted(df_filtered["work_shift_code"].dropna().unique())
-        default_shifts = unique_shifts if unique_shifts else []
+        # Shift Filter
+        unique_shifts = fetch_filter_options(session, "work_shift_code", date_filters, filters_version)
         selected_shifts = st.sidebar.multiselect(
-            "Select Shifts", options=unique_shifts, default=default_shifts,
-            key="overview_shifts"
+            "Select Shifts", options=list(unique_shifts), default=list(unique_shifts),
+            format_func=unique_shifts.get, key="overview_shifts"
         )
         if selected_shifts:
-            df_filtered = df_filtered[df_filtered["work_shift_code"].isin(selected_shifts)]
+            filters["shifts"] = tuple(selected_shifts)
 
-    # Operator Filter <-- NEW
-    if "operator_name" in df_filtered.columns:
-        # Handle potential NaN/None before sorting/displaying
-        unique_operators = sorted(df_filtered["operator_name"].astype(str).dropna().unique())
-        default_operators = unique_operators if unique_operators else []
+        # Operator Filter
+        unique_operators = fetch_filter_options(session, "operator_name", date_filters, filters_version)
         selected_operators = st.sidebar.multiselect(
-            "Select Operators", options=unique_operators, default=default_operators,
-            key="overview_operators" # Unique key
+            "Select Operators", options=list(unique_operators), default=list(unique_operators),
+            format_func=unique_operators.get, key="overview_operators"
         )
         if selected_operators:
-            df_filtered = df_filtered[df_filtered["operator_name"].isin(selected_operators)]
+            filters["operators"] = tuple(selected_operators)
 
-else:
-     # Only show warning if initial fetch was empty
-     if df.empty:
+        monthly_avg = fetch_overview_data(session, filters, versions)
+    else:
+        monthly_avg = pd.DataFrame()
         st.warning("No valid data (0-100%) available for overview. Please upload/process files.")
+finally:
+    session.close()
 
 # --- Calculations and Charting ---
-if not df_filtered.empty:
-    df_filtered["month_year"] = df_filtered["posting_date"].dt.strftime("%b, %y")
-    metrics_to_display = [col for col in ["oee_new", "availability", "performance", "quality_rate"] if col in df_filtered.columns]
+if not monthly_avg.empty:
+    metrics_to_display = [col for col in METRICS if col in monthly_avg.columns]
 
     if metrics_to_display:
-        monthly_avg = df_filtered.groupby("month_year", as_index=False)[metrics_to_display].mean()
-        # Add sort key for proper month ordering
-        try:
-            monthly_avg["sort_date"] = pd.to_datetime(monthly_avg["month_year"], format="%b, %y")
-            monthly_avg = monthly_avg.sort_values("sort_date").drop(columns=["sort_date"])
-        except ValueError:
-            logger.warning("Could not parse month_year for sorting, using alphabetical.")
-            # Fallback to alphabetical sort if parsing fails
-            monthly_avg = monthly_avg.sort_values("month_year")
-
-
         for col in metrics_to_display:
             monthly_avg[f"{col}_label"] = monthly_avg[col].apply(lambda x: f"{x:.1f}%" if pd.notnull(x) else "N/A")
 
@@ -237,7 +210,7 @@ if not df_filtered.empty:
     else:
         st.warning("No KPI columns found in the data to display averages.")
 
-# Handle cases where df_filtered became empty *after* applying filters
-elif not df.empty: # Check if data existed before filtering
+# Handle cases where no data is left *after* applying filters
+elif data_available:
      st.warning("No data matches the selected filters.")
 # Initial empty data case handled above filters
\ No newline at end of file
@@ -4,11 +4,13 @@ import streamlit as st
 from sqlalchemy.orm import Session
 from backend.models import ProductionRecordGRD
 from backend.config import Config
+from backend.database import get_sessionmaker
+from backend.dataset import shared_dataset
+from backend.queries import catalog_values, daily_averages, date_bounds
+from backend.versions import month_versions, range_version, split_by_month
 import pandas as pd
 import altair as alt
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 import math
 
@@ -16,8 +18,7 @@ logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
 try:
-    engine_grd = create_engine(Config.SQLALCHEMY_BINDS['grd'])
-    SessionLocal = sessionmaker(binds={ProductionRecordGRD: engine_grd})
+    SessionLocal = get_sessionmaker()
     logger.info("Database engine created successfully for OEE page.")
 except Exception as e:
     logger.error(f"Error creating database engine: {e}", exc_info=True)
@@ -64,83 +65,53 @@ st.markdown("Daily average OEE values (0-100%), faceted by month. Use filters in
 st.markdown("---")
 
 # --- Data Fetching (Revised Structure V4 - Simpler) ---
-@st.cache_data(ttl=600)
-def fetch_metric_data(_session, metric_name):
-    required_metric = metric_name
-    logger.info(f"Fetching data for metric: {required_metric}")
-
+def fetch_metric_data(metric_name, filters):
+    """Valid (0-100) rows of the metric matching the sidebar filters: a slice of the dataset
+    all pages share (backend/dataset.py)."""
     try:
-        metric_attribute_map = {
-            "oee_new": ProductionRecordGRD.oee_new,
-            "availability": ProductionRecordGRD.availability,
-            "performance": ProductionRecordGRD.performance,
-            "quality_rate": ProductionRecordGRD.quality_rate,
-        }
-
-        if required_metric not in metric_attribute_map:
-            err_msg = f"Configuration Error: Metric name '{required_metric}' is not recognized."
-            st.error(err_msg); logger.error(err_msg); return pd.DataFrame()
-
-        metric_column_to_alias = metric_attribute_map[required_metric]
-
-        columns_to_query = {
-            'posting_date': ProductionRecordGRD.posting_date, 'machine_no': ProductionRecordGRD.machine_no,
-            'work_shift_code': ProductionRecordGRD.work_shift_code, 'operator_name': ProductionRecordGRD.operator_name,
-            'metric_value': metric_column_to_alias.label('metric_value'), 'id': ProductionRecordGRD.id,
-            'document_no': ProductionRecordGRD.document_no, 'oee_new': ProductionRecordGRD.oee_new,
-            'availability': ProductionRecordGRD.availability, 'performance': ProductionRecordGRD.performance,
-            'quality_rate': ProductionRecordGRD.quality_rate, 'plan_time': ProductionRecordGRD.plan_time,
-            'loss_time': ProductionRecordGRD.loss_time, 'actual_run_time': ProductionRecordGRD.actual_run_time,
-            'output_quantity': ProductionRecordGRD.output_quantity, 'rejection_qty': ProductionRecordGRD.rejection_qty,
-            'current_c_t': ProductionRecordGRD.current_c_t, 'rework_qty': ProductionRecordGRD.rework_qty,
-        }
-
-        if required_metric in columns_to_query:
-            del columns_to_query[required_metric]
-
-        query = _session.query(*columns_to_query.values())
-        logger.debug(f"Executing database query for {required_metric}...")
-        data = query.all(); logger.debug(f"Query returned {len(data)} raw results.")
-        if not data: logger.warning(f"No data found for {required_metric}."); return pd.DataFrame()
-
-        df = pd.DataFrame(data, columns=columns_to_query.keys())
-        logger.info(f"Fetched {len(df)} records into DataFrame for {required_metric}.")
-        logger.debug(f"DataFrame columns after fetch: {df.columns.tolist()}")
-        if df.columns.duplicated().any():
-            logger.error(f"DUPLICATE COLUMNS DETECTED fetch: {df.columns[df.columns.duplicated()].tolist()}")
-            df = df.loc[:, ~df.columns.duplicated()]; logger.warning(f"Cols now: {df.columns.tolist()}")
-
-        if "posting_date" in df.columns:
-            df["posting_date"] = pd.to_datetime(df["posting_date"], format="%d-%m-%Y", dayfirst=True, errors="coerce")
-            df = df.dropna(subset=["posting_date"])
-            df['month_year'] = df['posting_date'].dt.strftime('%b, %Y'); df['month_order'] = df['posting_date'].dt.strftime('%Y%m')
-            df['day'] = df['posting_date'].dt.day
-            if not df.empty: logger.info(f"[FETCH DEBUG] Unique months fetched: {sorted(df['month_year'].unique())}")
-            else: logger.info(f"[FETCH DEBUG] DataFrame empty after date parsing.")
-        else: st.error("Critical error: 'posting_date' column missing."); logger.error("posting_date missing."); return pd.DataFrame()
-
-        if 'metric_value' not in df.columns:
-            err_msg = f"Internal Error: Aliased 'metric_value' not found. Cols: {df.columns.tolist()}"; st.error(err_msg); logger.error(err_msg); return pd.DataFrame()
-
-        df['metric_value'] = pd.to_numeric(df['metric_value'], errors='coerce')
-
-        # OEE is 0-100
-        df_filtered = df[df['metric_value'].between(0, 100, inclusive='both')].copy()
-        # Drop rows where metric value couldn't be converted or was outside range
-        df_filtered = df_filtered.dropna(subset=['metric_value'])
-        logger.info(f"{len(df_filtered)} valid (0-100) records for {required_metric}.")
-
-        for col in df_filtered.columns:
-            if col not in ['posting_date','machine_no','work_shift_code','operator_name','document_no','month_year','month_order','day']:
-                 if not pd.api.types.is_numeric_dtype(df_filtered[col]) and col != 'metric_value':
-                    try: df_filtered[col] = pd.to_numeric(df_filtered[col], errors='coerce')
-                    except Exception as e: logger.warning(f"Could not convert '{col}' to numeric: {e}")
-
-        logger.debug(f"Returning filtered DataFrame cols: {df_filtered.columns.tolist()}")
-        return df_filtered
-
-    except SQLAlchemyError as e: err_msg = f"DB Query Error for '{required_metric}': {e}."; st.error(err_msg); logger.error(err_msg, exc_info=True); return pd.DataFrame()
-    except Exception as e: logger.error(f"Error fetching {required_metric}: {e}", exc_info=True); st.error(f"Error fetching data: {e}"); return pd.DataFrame()
+        df = shared_dataset().rows(valid_metrics=(metric_name,), **filters)
+        logger.info(f"{len(df)} valid (0-100) records for {metric_name} match the filters.")
+        return df
+    except SQLAlchemyError as e: err_msg = f"DB Query Error for '{metric_name}': {e}."; st.error(err_msg); logger.error(err_msg, exc_info=True); return pd.DataFrame()
+    except Exception as e: logger.error(f"Error fetching {metric_name}: {e}", exc_info=True); st.error(f"Error fetching data: {e}"); return pd.DataFrame()
+
+# Columns averaged per day for the trend chart tooltips: column -> (format, title)
+DAILY_TOOLTIPS = {
+    'availability': ('.1f', 'Avg Availability (%)'),
+    'performance': ('.1f', 'Avg Performance (%)'),
+    'quality_rate': ('.1f', 'Avg Quality Rate (%)'),
+}
+
+# Cached results are keyed on the data version of the months they cover (backend/versions.py),
+# so they are reused until an ingestion changes one of those months.
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_month_daily_data(_session, metric_name, filters, version):
+    """Daily means of the metric and the tooltip columns within one month (split_by_month)."""
+    mean_columns = [col for col in DAILY_TOOLTIPS if col != metric_name]
+    return daily_averages(_session, ProductionRecordGRD, metric_name, mean_columns, valid_metrics=(metric_name,), **filters)
+
+def fetch_daily_data(session, metric_name, filters, versions):
+    """Daily means for the trend chart, one row per day. Each month is fetched and cached on
+    its own, so new data only re-queries the months it touched."""
+    months = [fetch_month_daily_data(session, metric_name, month_filters, version)
+              for month_filters, version in split_by_month(filters, versions)]
+    df = pd.concat(months, ignore_index=True) if months else pd.DataFrame()
+    if not df.empty:
+        df['posting_date'] = pd.to_datetime(df['posting_date'])
+        df['month_year'] = df['posting_date'].dt.strftime('%b, %Y'); df['month_order'] = df['posting_date'].dt.year * 100 + df['posting_date'].dt.month # YYYYMM
+        df['day'] = df['posting_date'].dt.day
+    return df
+
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_date_bounds(_session, metric_name, version):
+    """First and last date with valid (0-100) data, or (None, None) when there is none."""
+    return date_bounds(_session, ProductionRecordGRD, valid_metrics=(metric_name,))
+
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_filter_options(_session, metric_name, column, date_range, version):
+    """Sidebar options for `column`: {dimension id: name} of the values with valid (0-100) rows
+    in the months of the date range, from the filter catalog (one row per distinct value and month)."""
+    return catalog_values(_session, column, *date_range, count_column=f"{metric_name}_count")
 
 
 # --- Sidebar Filters ---
@@ -148,70 +119,41 @@ st.sidebar.header("Filters")
 metric_to_display = "oee_new"
 metric_title = "OEE"
 chart_color = "#4a90e2" # OEE color
-try:
-    session = SessionLocal()
-    # df_display has all valid (0-100) data BEFORE sidebar filters
-    df_display = fetch_metric_data(session, metric_to_display)
-finally:
-    if session: session.close()
-
-# df_filtered_display starts as a copy, sidebar filters apply to this
-df_filtered_display = df_display.copy()
-
-# --->>> DEBUGGING: Log DataFrame before sidebar filters <<<---
-if not df_filtered_display.empty:
-     logger.info(f"[SIDEBAR DEBUG] Before filters - Shape: {df_filtered_display.shape}, Months: {sorted(df_filtered_display['month_year'].unique())}")
-else:
-     logger.info("[SIDEBAR DEBUG] Before filters - DataFrame is empty.")
-# --->>> END DEBUGGING <<<---
 
 # --- Filtering Logic ---
-if not df_display.empty: # Base filtering on the initially fetched data (df_display)
-    min_date_overall = df_display["posting_date"].min().date()
-    max_date_overall = df_display["posting_date"].max().date()
-
-    if min_date_overall <= max_date_overall:
+# The date range narrows the sidebar options (read from filter_catalog) and every selection
+# narrows the rows: the table is sliced from the shared dataset, the chart averaged in SQL.
+filters = {}
+try:
+    session = SessionLocal()
+    versions = month_versions(session)
+    min_date_overall, max_date_overall = fetch_date_bounds(session, metric_to_display, range_version(versions))
+    data_available = min_date_overall is not None # Valid (0-100) data exists before sidebar filters
+    if data_available:
         date_range = st.sidebar.date_input(
-            "Select Date Range",
-            value=(min_date_overall, max_date_overall), # Default to full range
-            min_value=min_date_overall,
-            max_value=max_date_overall,
+            "Select Date Range", value=(min_date_overall, max_date_overall),
+            min_value=min_date_overall, max_value=max_date_overall,
             key=f"{metric_to_display}_date_range"
         )
         if len(date_range) == 2:
-            start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-            # Apply filter to df_filtered_display
-            df_filtered_display = df_filtered_display[
-                (df_filtered_display["posting_date"] >= start_date) &
-                (df_filtered_display["posting_date"] <= end_date)
-            ]
+            filters['start_date'], filters['end_date'] = date_range
+        date_filters = (filters.get('start_date'), filters.get('end_date'))
+        filters_version = range_version(versions, *date_filters)
+        unique_machines = fetch_filter_options(session, metric_to_display, 'machine_no', date_filters, filters_version)
+        selected_machines = st.sidebar.multiselect("Select Machines", list(unique_machines), default=list(unique_machines), format_func=unique_machines.get, key=f"{metric_to_display}_machines")
+        if selected_machines: filters['machines'] = tuple(selected_machines)
+        unique_shifts = fetch_filter_options(session, metric_to_display, 'work_shift_code', date_filters, filters_version)
+        selected_shifts = st.sidebar.multiselect("Select Shifts", list(unique_shifts), default=list(unique_shifts), format_func=unique_shifts.get, key=f"{metric_to_display}_shifts")
+        if selected_shifts: filters['shifts'] = tuple(selected_shifts)
+        unique_operators = fetch_filter_options(session, metric_to_display, 'operator_name', date_filters, filters_version)
+        selected_operators = st.sidebar.multiselect("Select Operators", list(unique_operators), default=list(unique_operators), format_func=unique_operators.get, key=f"{metric_to_display}_operators")
+        if selected_operators: filters['operators'] = tuple(selected_operators)
+        df_filtered_display = fetch_metric_data(metric_to_display, filters)
+        df_daily = fetch_daily_data(session, metric_to_display, filters, versions)
     else:
-        st.sidebar.warning("Invalid date range in available data.")
-
-    # Machine Filter (apply to df_filtered_display)
-    if "machine_no" in df_filtered_display.columns:
-        unique_machines = sorted(df_filtered_display["machine_no"].dropna().astype(str).unique())
-        # Get defaults from the potentially date-filtered data
-        default_machines = unique_machines if unique_machines else []
-        selected_machines = st.sidebar.multiselect("Select Machines", unique_machines, default=default_machines, key=f"{metric_to_display}_machines")
-        if selected_machines: # Apply filter only if machines were selected (don't filter if list becomes empty)
-             df_filtered_display = df_filtered_display[df_filtered_display["machine_no"].isin(selected_machines)]
-
-    # Shift Filter (apply to df_filtered_display)
-    if "work_shift_code" in df_filtered_display.columns:
-        unique_shifts = sorted(df_filtered_display["work_shift_code"].dropna().astype(str).unique())
-        default_shifts = unique_shifts if unique_shifts else []
-        selected_shifts = st.sidebar.multiselect("Select Shifts", unique_shifts, default=default_shifts, key=f"{metric_to_display}_shifts")
-        if selected_shifts:
-             df_filtered_display = df_filtered_display[df_filtered_display["work_shift_code"].isin(selected_shifts)]
-
-    # Operator Filter (apply to df_filtered_display)
-    if "operator_name" in df_filtered_display.columns:
-        unique_operators = sorted(df_filtered_display["operator_name"].dropna().astype(str).unique())
-        default_operators = unique_operators if unique_operators else []
-        selected_operators = st.sidebar.multiselect("Select Operators", unique_operators, default=default_operators, key=f"{metric_to_display}_operators")
-        if selected_operators:
-             df_filtered_display = df_filtered_display[df_filtered_display["operator_name"].isin(selected_operators)]
+        df_filtered_display = df_daily = pd.DataFrame()
+finally:
+    if session: session.close()
 
 # This df_filtered_display now contains data matching sidebar filters
 df_plot_data = df_filtered_display # Use this potentially filtered data for plotting
@@ -225,7 +167,7 @@ else:
 
 
 # Warning if initial fetch failed
-if df_display.empty:
+if not data_available:
     st.warning(f"No valid data (0-100%) available for {metric_title}. Please upload/process files.")
 
 # --- Main Chart Display ---
@@ -233,36 +175,23 @@ st.subheader(f"Daily Average {metric_title} Trend by Month")
 
 if not df_plot_data.empty: # Check if data remains after sidebar filters
 
-    # Define Tooltips (Fixed Formatting)
+    # Define Tooltips: every field is a daily mean from df_daily (one row per day)
     base_tooltip_list = [
         alt.Tooltip('posting_date:T', title='Date', format="%Y-%m-%d"),
-        alt.Tooltip('day:O', title='Day'), # Include day in tooltip
-        alt.Tooltip('mean(metric_value):Q', title=f'Avg {metric_title} (%)', format=".1f"), # Show the average for the day
+        alt.Tooltip('day:O', title='Day'),
+        alt.Tooltip('metric_value:Q', title=f'Avg {metric_title} (%)', format=".1f"),
     ]
-    tooltip_cols_formats = { # Map column to format and title
-        # Include relevant KPIs for context, checking if they exist
-        'availability': ('.1f', 'Avg Availability (%)'),
-        'performance': ('.1f', 'Avg Performance (%)'),
-        'quality_rate': ('.1f', 'Avg Quality Rate (%)'),
-        'machine_no': (None, 'Machine'), # Assuming machine/shift/op are constant per day for this view isn't safe if data has multiple entries per day
-        'work_shift_code': (None, 'Shift'),
-        'operator_name': (None, 'Operator'),
-        'count()': ('.0f', 'Record Count') # Show how many records contribute to the average
-    }
-    for col, (fmt, title) in tooltip_cols_formats.items():
-        if col in df_plot_data.columns: # Check against the plotting data
-            # Use aggregation for KPIs in tooltips if desired (e.g., mean)
-            if fmt: base_tooltip_list.append(alt.Tooltip(f'mean({col}):Q' if col in ['availability','performance','quality_rate'] else col, title=title, format=fmt))
-            else: base_tooltip_list.append(alt.Tooltip(col, title=title))
-    base_tooltip_list = [tip for tip in base_tooltip_list if tip is not None]
-
+    for col, (fmt, title) in DAILY_TOOLTIPS.items():
+        if col in df_daily.columns:
+            base_tooltip_list.append(alt.Tooltip(f'{col}:Q', title=title, format=fmt))
+    base_tooltip_list.append(alt.Tooltip('record_count:Q', title='Record Count', format='.0f'))
 
     # --- Charting Logic: Average Daily Line Plot ---
     y_scale = alt.Scale(domain=[0, 100]) # OEE is always 0-100
 
-    line = alt.Chart(df_plot_data).mark_line(point=True, color=chart_color).encode(
+    line = alt.Chart(df_daily).mark_line(point=True, color=chart_color).encode(
         x=alt.X('day:O', title='Day of Month', axis=alt.Axis(labelAngle=0)),
-        y=alt.Y('mean(metric_value):Q', title=f'Avg {metric_title} (%)', scale=y_scale),
+        y=alt.Y('metric_value:Q', title=f'Avg {metric_title} (%)', scale=y_scale),
         tooltip=base_tooltip_list,
         facet=alt.Facet('month_year:N', columns=3, title=None, sort=alt.SortField(field="month_order")), # Use None for facet title if main title is enough
         order='day:O' # Ensure line connects days correctly
@@ -279,7 +208,7 @@ if not df_plot_data.empty: # Check if data remains after sidebar filters
 
 
 # Handle case where sidebar filters cleared all data
-elif not df_display.empty: # Check if data existed before sidebar filtering
+elif data_available: # Check if data existed before sidebar filtering
      st.warning("No data matches the selected filters.")
 # Initial empty data case handled near the top fetch
 
@@ -289,7 +218,7 @@ table_header_range = "(0-100%)" # OEE is always 0-100
 st.subheader(f"Filtered Detailed Data Table {table_header_range}")
 
 # Use df_filtered_display (which has OEE 0-100 and matches sidebar filters)
-df_table_data = df_filtered_display.rename(columns={'metric_value': metric_to_display})
+df_table_data = shared_dataset().with_names(df_filtered_display).rename(columns={'metric_value': metric_to_display})
 
 # Define the desired display order
 display_cols_order = [
@@ -323,5 +252,5 @@ if not df_table_data.empty:
          except Exception as e: logger.error(f"Error displaying dataframe: {e}", exc_info=True); st.error(f"Error displaying table: {e}")
 else:
      # Only show this if there was data before filtering but not after
-     if not df_display.empty:
+     if data_available:
         st.warning("No data matches the selected filters to display in the table.")
\ No newline at end of file
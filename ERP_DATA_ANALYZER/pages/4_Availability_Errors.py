@@ -2,18 +2,19 @@ import streamlit as st
 from sqlalchemy.orm import Session
 from backend.models import ProductionRecordGRD
 from backend.config import Config
+from backend.database import get_sessionmaker
+from backend.dataset import compact_dtypes
+from backend.queries import metric_errors
+from backend.versions import data_version
 import pandas as pd
 import altair as alt
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
 logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
 try:
-    engine_grd = create_engine(Config.SQLALCHEMY_BINDS['grd'])
-    SessionLocal = sessionmaker(binds={ProductionRecordGRD: engine_grd})
+    SessionLocal = get_sessionmaker()
     logger.info("Database engine created successfully for Availability Errors page.")
 except Exception as e:
     logger.error(f"Error creating database engine: {e}", exc_info=True)
@@ -60,38 +61,15 @@ st.markdown("This page shows records where the calculated Availability value is
 st.markdown("---")
 
 # --- Data Fetching for Errors ---
-@st.cache_data(ttl=600)
-def fetch_error_data(_session, metric_name):
+@st.cache_data(max_entries=Config.DASHBOARD_CACHE_ENTRIES)
+def fetch_error_data(_session, metric_name, columns, version):
+    """Records with the metric above 100%, read through its partial index (backend/queries.py).
+    Cached per data version (backend/versions.py), so a new ingestion is picked up on the next run."""
     required_metric = metric_name
     try:
-        query = _session.query(ProductionRecordGRD)
-        data = query.all()
-
-        if not data:
-            logger.warning(f"No data found for {required_metric} error check.")
-            return pd.DataFrame()
-
-        # Convert records to dictionaries, excluding the internal SQLAlchemy state
-        records = [ {c.name: getattr(d, c.name) for c in d.__table__.columns} for d in data ]
-        df = pd.DataFrame(records)
-        logger.info(f"Fetched {len(df)} records for {required_metric} error check.")
-
-        if "posting_date" in df.columns:
-            df["posting_date"] = pd.to_datetime(df["posting_date"], format="%d-%m-%Y", dayfirst=True, errors="coerce")
-            df = df.dropna(subset=["posting_date"])
-        else:
-            st.warning("Required column 'posting_date' is missing.")
-            return pd.DataFrame()
-
-        if required_metric not in df.columns:
-            st.warning(f"Required column '{required_metric}' is missing.")
-            return pd.DataFrame()
-
-        df[required_metric] = pd.to_numeric(df[required_metric], errors='coerce')
-        error_df = df[df[required_metric] > 100].copy()
+        error_df = metric_errors(_session, ProductionRecordGRD, required_metric, columns)
+        error_df = compact_dtypes(error_df) # Categories, float32 KPIs and Int32 counts (backend/dataset.py)
         logger.info(f"Found {len(error_df)} records with {required_metric} > 100.")
-
-        error_df = error_df.sort_values(by="posting_date")
         return error_df
 
     except AttributeError:
@@ -106,9 +84,16 @@ def fetch_error_data(_session, metric_name):
 st.sidebar.header("Filters")
 metric_to_display = "availability"
 metric_title = "Availability"
+# Columns loaded for the error table and chart
+display_cols_err = [
+    'posting_date', 'machine_no', 'work_shift_code', 'operator_name', metric_to_display,
+    'plan_time', 'loss_time', 'actual_run_time', # Key columns for Availability
+    'oee_new', 'performance', 'quality_rate', # Other KPIs
+    'document_no', 'id'
+]
 try:
     session = SessionLocal()
-    df_errors = fetch_error_data(session, metric_to_display)
+    df_errors = fetch_error_data(session, metric_to_display, tuple(display_cols_err), data_version(session))
 finally:
     session.close()
 
@@ -164,12 +149,6 @@ st.subheader(f"Records with {metric_title} > 100%")
 
 if not df_filtered_errors.empty:
     st.info(f"Found {len(df_filtered_errors)} record(s) with {metric_title} exceeding 100% matching the current filters.")
-    display_cols_err = [
-        'posting_date', 'machine_no', 'work_shift_code', 'operator_name', metric_to_display,
-        'plan_time', 'loss_time', 'actual_run_time', # Key columns for Availability
-        'oee_new', 'performance', 'quality_rate', # Other KPIs
-        'document_no', 'id'
-    ]
     cols_to_show_err = [col for col in display_cols_err if col in df_filtered_errors.columns]
     st.dataframe(df_filtered_errors[cols_to_show_err])
 
@@ -1,18 +1,24 @@
 import streamlit as st
 from sqlalchemy.orm import Session
-from backend.models import ProductionRecordGRD
+from backend.models import IngestedFile, ProductionRecordGRD
+from backend.ingest_stats import INGEST_STAGES, run_history
 # Removed total_records_inserted import as it's less reliable across sessions/restarts
 from backend.config import Config
+from backend.database import get_engine, get_sessionmaker
+from backend.utilities import batch_row_counts, delete_ingest_batch
+from backend.writer import get_writer
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import os
+import json
+import pandas as pd
+import altair as alt
 
 logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
 try:
-    engine_grd = create_engine(Config.SQLALCHEMY_BINDS['grd'])
-    SessionLocal = sessionmaker(binds={ProductionRecordGRD: engine_grd})
+    engine_grd = get_engine() # Creates ingest_runs if app.py has not run since upgrading (init_db)
+    SessionLocal = get_sessionmaker()
     logger.info("Database engine created successfully for Data Management page.")
 except Exception as e:
     logger.error(f"Error creating database engine: {e}", exc_info=True)
@@ -88,4 +94,164 @@ if st.button("Refresh Count"):
         st.error(f"Failed to refresh count: {e}")
     finally:
         if session:
-             session.close()
\ No newline at end of file
+             session.close()
+
+
+# --- Ingested Files ---
+st.markdown("---")
+st.subheader("Ingested Files")
+st.caption("Every ingested file is a batch: its records can be deleted, or replaced by a corrected export, "
+           "without reloading the rest of the data. Records a later file overwrote belong to that later file.")
+
+def ingested_files(session):
+    """The ingestion ledger, newest first, with the records each file currently holds, and the
+    number of records loaded before files were tracked (they belong to no batch)."""
+    counts = batch_row_counts(session)
+    entries = session.query(IngestedFile).order_by(IngestedFile.id.desc()).all()
+    files = pd.DataFrame([{
+        'id': entry.id, 'file_name': entry.file_name, 'status': entry.status, 'records': counts.get(entry.id, 0),
+        'row_count': entry.row_count, 'finished_at': entry.finished_at,
+    } for entry in entries], columns=['id', 'file_name', 'status', 'records', 'row_count', 'finished_at'])
+    return files, counts.get(None, 0)
+
+def wait_for_write(job, message):
+    """Waits for a job submitted to the database writer (backend/writer.py) and returns its result."""
+    with st.spinner(f"{message}..."):
+        return job.result()
+
+session = None
+try:
+    session = SessionLocal()
+    files, _ = ingested_files(session)
+finally:
+    if session:
+        session.close()
+
+if files.empty:
+    st.info("No files ingested yet.")
+else:
+    labels = {row.id: f"{row.file_name} (batch {row.id}, {row.records:,} records, {row.status})" for row in files.itertuples()}
+    batch_id = st.selectbox("File", options=list(labels), format_func=labels.get, key='batch_select')
+    file_name = files.set_index('id').at[batch_id, 'file_name']
+    delete_col, replace_col = st.columns(2)
+    with delete_col:
+        confirmed = st.checkbox(f"Delete the records of {file_name}", key='batch_delete_confirm')
+        if st.button("Delete batch", disabled=not confirmed, key='batch_delete'):
+            try:
+                deleted = wait_for_write(get_writer().submit(delete_ingest_batch, batch_id), f"Deleting {file_name}")
+                st.success(f"Deleted {deleted:,} records of {file_name}. Dashboards show the change on their next refresh.")
+            except Exception as e:
+                logger.error(f"Deleting batch {batch_id} failed: {e}", exc_info=True)
+                st.error(f"Failed to delete {file_name}: {e}")
+    with replace_col:
+        corrected = st.file_uploader("Corrected GRD CSV file", type=["csv"], key='batch_replace_file')
+        if corrected is not None and st.button("Replace batch", key='batch_replace'):
+            # Kept out of the upload folder, where the file monitor would pick it up as a new file
+            replace_folder = os.path.join(Config.INSTANCE_PATH, 'replacements')
+            os.makedirs(replace_folder, exist_ok=True)
+            file_path = os.path.join(replace_folder, corrected.name)
+            try:
+                with open(file_path, "wb") as f:
+                    f.write(corrected.getbuffer())
+                result = wait_for_write(get_writer().ingest([file_path], replace_batch=batch_id),
+                                        f"Replacing {file_name} with {corrected.name}")[0]
+                if result['status'] == 'success':
+                    st.success(f"Replaced {file_name} with {corrected.name} ({result['records']:,} records).")
+                else:
+                    st.error(f"{corrected.name} was not ingested ({result['status']}): {result['error']}. {file_name} was kept.")
+            except Exception as e:
+                logger.error(f"Replacing batch {batch_id} failed: {e}", exc_info=True)
+                st.error(f"Failed to replace {file_name}: {e}")
+
+    session = None
+    try:
+        session = SessionLocal()
+        files, untracked = ingested_files(session) # After any change above
+    finally:
+        if session:
+            session.close()
+    if untracked:
+        st.caption(f"{untracked:,} records were loaded before files were tracked and belong to no batch.")
+    st.dataframe(files.rename(columns={
+        'id': 'Batch', 'file_name': 'File', 'status': 'Status', 'records': 'Records held',
+        'row_count': 'CSV rows', 'finished_at': 'Ingested',
+    }), hide_index=True)
+
+
+# --- Ingestion Performance ---
+st.markdown("---")
+st.subheader("Ingestion Performance")
+st.caption(f"Every ingestion is timed per stage. Runs more than {Config.INGEST_REGRESSION_FACTOR:g}x slower "
+           f"(rows/s) than the median of the previous {Config.INGEST_REGRESSION_WINDOW} runs of similar size are flagged.")
+
+def display_ingest_runs(session):
+    """Throughput history, regression flags and the per-stage breakdown of recent ingestions."""
+    runs = run_history(session)
+    if runs.empty:
+        st.info("No ingestion runs recorded yet.")
+        return
+
+    regressions = runs[runs['regression']]
+    if not regressions.empty:
+        latest = regressions.iloc[-1]
+        st.warning(f"{len(regressions)} slow ingestion(s) flagged. Latest: {latest['file_name']} at "
+                   f"{latest['rows_per_second']:,.0f} rows/s vs. a usual {latest['baseline_rows_per_second']:,.0f} rows/s "
+                   f"({latest['finished_at']:%Y-%m-%d %H:%M}).")
+
+    successful = runs[runs['status'] == 'success'].copy()
+    if not successful.empty:
+        successful['flag'] = successful['regression'].map({True: 'Regression', False: 'OK'})
+        throughput = alt.Chart(successful).mark_line(point=True, color='#1f77b4').encode(
+            x=alt.X('finished_at:T', title='Finished'),
+            y=alt.Y('rows_per_second:Q', title='Rows / second'),
+        )
+        flagged = alt.Chart(successful[successful['regression']]).mark_point(color='red', size=120, filled=True).encode(
+            x='finished_at:T', y='rows_per_second:Q',
+        )
+        tooltip = alt.Chart(successful).mark_point(opacity=0).encode(
+            x='finished_at:T', y='rows_per_second:Q',
+            tooltip=[alt.Tooltip('file_name:N', title='File'), alt.Tooltip('row_count:Q', title='Rows', format=','),
+                     alt.Tooltip('rows_per_second:Q', title='Rows/s', format=',.0f'),
+                     alt.Tooltip('baseline_rows_per_second:Q', title='Usual rows/s', format=',.0f'),
+                     alt.Tooltip('wall_seconds:Q', title='Seconds', format='.2f'), alt.Tooltip('flag:N', title='Status')],
+        )
+        st.altair_chart((throughput + flagged + tooltip).properties(title='Ingestion throughput'), use_container_width=True)
+
+        # Where the time goes in the most recent runs
+        recent = successful.tail(20)
+        stage_rows = [
+            {'run': f"{run.id}: {run.file_name}", 'stage': stage, 'seconds': stats['seconds']}
+            for run in recent.itertuples() for stage, stats in json.loads(run.stages or '{}').items()
+        ]
+        if stage_rows:
+            stages_chart = alt.Chart(pd.DataFrame(stage_rows)).mark_bar().encode(
+                x=alt.X('sum(seconds):Q', title='Seconds'),
+                y=alt.Y('run:N', title=None, sort=None),
+                color=alt.Color('stage:N', sort=list(INGEST_STAGES), title='Stage'),
+                order=alt.Order('stage_order:Q'),
+                tooltip=['run:N', 'stage:N', alt.Tooltip('seconds:Q', format='.3f')],
+            ).transform_calculate(
+                stage_order=f"indexof({json.dumps(list(INGEST_STAGES))}, datum.stage)"
+            ).properties(title='Time per stage (last 20 runs)')
+            st.altair_chart(stages_chart, use_container_width=True)
+
+    table = runs.iloc[::-1][['finished_at', 'file_name', 'status', 'row_count', 'wall_seconds', 'cpu_seconds',
+                             'rows_per_second', 'baseline_rows_per_second', 'peak_rss_mib', 'worker_prepared',
+                             'regression', 'error']]
+    st.dataframe(table.rename(columns={
+        'finished_at': 'Finished', 'file_name': 'File', 'status': 'Status', 'row_count': 'Rows',
+        'wall_seconds': 'Wall (s)', 'cpu_seconds': 'CPU (s)', 'rows_per_second': 'Rows/s',
+        'baseline_rows_per_second': 'Usual rows/s', 'peak_rss_mib': 'Peak memory (MiB)',
+        'worker_prepared': 'Parallel batch', 'regression': 'Regression', 'error': 'Error',
+    }), hide_index=True)
+
+session = None
+try:
+    session = SessionLocal()
+    display_ingest_runs(session)
+except Exception as e:
+    logger.error(f"Error displaying ingestion runs: {str(e)}", exc_info=True)
+    st.error(f"Failed to display ingestion runs: {str(e)}")
+finally:
+    if session:
+        session.close()
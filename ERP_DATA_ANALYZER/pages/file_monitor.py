@@ -1,24 +1,23 @@
 import streamlit as st
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from backend.utilities import process_csv_file, allowed_file
+from backend.utilities import allowed_file
+from backend.writer import get_writer
 from backend.config import Config
-from backend.models import ProductionRecordGRD
+from backend.database import get_engine
 import os
 import time
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from threading import Thread, Lock
+from threading import Thread, Lock, Timer
 import queue
 
 logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
-# Create engine and session factory once
+# Ingestion goes through the process-wide database writer (backend/writer.py)
 try:
-    engine_grd = create_engine(Config.SQLALCHEMY_BINDS['grd'])
-    SessionLocal = sessionmaker(binds={ProductionRecordGRD: engine_grd})
+    # The monitor can run before app.py; get_engine creates the tables (init_db)
+    engine_grd = get_engine()
     logger.info("Database engine created successfully for File Monitor.")
 except Exception as e:
     logger.error(f"Error creating database engine for monitor: {e}", exc_info=True)
@@ -73,8 +72,6 @@ if 'monitor_messages' not in st.session_state:
     st.session_state['monitor_messages'] = []
 if 'monitor_running' not in st.session_state:
     st.session_state['monitor_running'] = False
-if 'last_processed' not in st.session_state:
-    st.session_state['last_processed'] = {} # Track processed files
 
 # Use a thread-safe queue for messages from the handler to the main thread
 # This prevents direct manipulation of st.session_state from the handler thread
@@ -82,9 +79,15 @@ message_queue = queue.Queue()
 
 # --- Watchdog Handler ---
 class CSVHandler(FileSystemEventHandler):
+    # Wait this long after the last new file before processing, so writes can finish and
+    # files dropped together are ingested as one parallel batch
+    SETTLE_SECONDS = 2.0
+
     def __init__(self, msg_queue):
         self.msg_queue = msg_queue
-        self.processing_files = set() # Prevent processing the same file if events fire rapidly
+        self.pending_files = {} # Files waiting for the next batch (dict keeps arrival order)
+        self.pending_lock = Lock()
+        self.timer = None
 
     def on_created(self, event):
         if event.is_directory:
@@ -101,63 +104,57 @@ class CSVHandler(FileSystemEventHandler):
             logger.debug(f"Ignoring hidden/temp file: {filename}")
             return
 
-        # Avoid race conditions if multiple events fire
-        # Check processing_files first
-        if file_path in self.processing_files:
-             logger.debug(f"Already processing {filename}, skipping duplicate event.")
-             return
-        self.processing_files.add(file_path)
-
-
-        logger.info(f"Detected new file: {filename}")
-        self.msg_queue.put(f"Detected: {filename}. Waiting...")
-
-        # Wait a bit for the file write to potentially finish
-        # This is crucial on some systems/network drives
-        time.sleep(2.0) # Increased wait time
-
-        session = None # Create session within the handler thread
-        try:
-            if not os.path.exists(file_path):
-                logger.warning(f"File {filename} disappeared before processing.")
-                self.msg_queue.put(f"Skipped: {filename} (disappeared).")
-                return
-
-            file_mtime = os.path.getmtime(file_path)
-            # Check if already processed (using session_state for persistence across Streamlit reruns)
-            # Access session_state carefully from threads - reading is generally okay, writing needs caution.
-            # Reading last_processed should be safe here.
-            last_processed_time = st.session_state.get('last_processed', {}).get(file_path)
-
-            if last_processed_time is not None and last_processed_time == file_mtime:
-                logger.info(f"Skipping already processed file version: {filename}")
-                self.msg_queue.put(f"Skipped: {filename} (already processed).")
+        with self.pending_lock:
+            # Avoid queueing the same file twice if multiple events fire
+            if file_path in self.pending_files:
+                logger.debug(f"Already queued {filename}, skipping duplicate event.")
                 return
+            self.pending_files[file_path] = None
+            logger.info(f"Detected new file: {filename}")
+            self.msg_queue.put(f"Detected: {filename}. Waiting...")
+            # Restart the wait; this is crucial on some systems/network drives
+            if self.timer:
+                self.timer.cancel()
+            self.timer = Timer(self.SETTLE_SECONDS, self.process_pending)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def process_pending(self):
+        with self.pending_lock:
+            file_paths, self.pending_files = list(self.pending_files), {}
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                logger.warning(f"File {os.path.basename(file_path)} disappeared before processing.")
+                self.msg_queue.put(f"Skipped: {os.path.basename(file_path)} (disappeared).")
+        file_paths = [file_path for file_path in file_paths if os.path.exists(file_path)]
+        if not file_paths:
+            return
 
-            self.msg_queue.put(f"Processing: {filename}...")
-            session = SessionLocal() # Create a new session for this file processing task
-            count = process_csv_file(file_path, session) # process_csv_file handles commit/rollback
-
-            # Update session_state only after successful processing via queue later if needed,
-            # or accept potential minor race condition if watchdog stops exactly during this update.
-            # For simplicity, we will update last_processed directly here, accepting minimal risk.
-            # A more robust way would be to send success msg back to main thread to update state.
-            st.session_state.setdefault('last_processed', {})[file_path] = file_mtime
-
-            self.msg_queue.put(f"✅ Processed {filename} ({count} records)")
-            logger.info(f"Processed {file_path} with {count} records")
-            # Signal main thread to clear cache (using None as a special message)
-            self.msg_queue.put(None)
-
-
-        except Exception as e:
-            self.msg_queue.put(f"❌ Failed to process {filename}: {str(e)}")
-            logger.error(f"Failed to process {file_path}: {str(e)}", exc_info=True)
-        finally:
-            if session:
-                session.close() # Ensure session is closed
-            if file_path in self.processing_files:
-                 self.processing_files.remove(file_path) # Remove from processing set
+        self.msg_queue.put(f"Processing: {', '.join(os.path.basename(p) for p in file_paths)}...")
+        # The batch joins the database writer's queue (backend/writer.py), so it never writes at
+        # the same time as an upload; report() receives each file's result from the writer thread.
+        # ingest_files parses the files in worker processes and writes them one at a time.
+        # Content already in the ingested_files ledger (persistent, shared by the uploader and
+        # every session) is skipped.
+        # Dashboards pick up successful loads through the data version (backend/versions.py).
+        job = get_writer().ingest(file_paths, on_result=self.report)
+        job.add_done_callback(lambda job: self.report_failure(job, file_paths))
+
+    def report_failure(self, job, file_paths):
+        if job.exception() is not None:
+            self.msg_queue.put(f"❌ Failed to process batch: {str(job.exception())}")
+            logger.error(f"Failed to process batch {file_paths}: {str(job.exception())}")
+
+    def report(self, result):
+        filename = result['file']
+        if result['status'] == 'success':
+            self.msg_queue.put(f"✅ Processed {filename} ({result['records']} records)")
+            logger.info(f"Processed {result['path']} with {result['records']} records")
+        elif result['status'] == 'skipped':
+            logger.info(f"Skipping already processed file content: {filename}")
+            self.msg_queue.put(f"Skipped: {filename} (already processed).")
+        else:
+            self.msg_queue.put(f"❌ Failed to process {filename}: {result['error']}")
 
 # --- Monitoring Control Functions ---
 def start_monitoring(msg_queue):
@@ -248,12 +245,8 @@ new_messages = False
 while not message_queue.empty():
     try:
         message = message_queue.get_nowait()
-        if message is None: # Special message to clear cache
-            st.cache_data.clear()
-            logger.info("Cache cleared due to file processing signal.")
-        else:
-            st.session_state['monitor_messages'].insert(0, message) # Add to front (newest first)
-            new_messages = True
+        st.session_state['monitor_messages'].insert(0, message) # Add to front (newest first)
+        new_messages = True
     except queue.Empty:
         break
 